@@ -0,0 +1,129 @@
+"""
+Benchmark the overhead dabbler adds around DSSAT.
+
+Runs the example experiment against the stand-in DSSAT in
+tests/fake_dssat, or a real DSSAT build with --dssat-bin, at each table
+size and worker count, and reports runs per second, per-run latency
+percentiles and peak memory. Run from the repository root:
+
+    python benchmarks/bench_run.py --runs 200 --scale 1 10 --workers 1 4
+
+With the stand-in, which takes no time of its own unless --delay is set,
+the numbers are the cost of the wrapper: writing inputs, launching the
+process, reading the FIFOs and parsing the tables. DSSAT's memory is sampled
+while it runs, so reads 0 for runs too short to be sampled.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import numpy as np
+from datetime import date
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+from dabbler import DSSAT, Experiment  # noqa: E402
+
+FAKE_DSSAT = REPO / "tests" / "fake_dssat"
+
+EXPERIMENT = Experiment(
+    crop="Maize",
+    model="MZIXM",
+    cultivar="PC0003",
+    plant_date=date(1982, 2, 25),
+    harvest_date=date(1982, 6, 25),
+    simulation_start=date(1982, 1, 1),
+    coordinates_latitude=29.6380,
+    coordinates_longitude=-28.3689,
+    weather_station_code="UFGA",
+    soil_code="IBMZ910014",
+)
+
+
+def parse_tables(result, outputs):
+    for out_file in outputs:
+        getattr(result, out_file.split(".")[0], None)
+
+
+def bench(dssat, runs, workers, parse):
+    """Run the example experiment runs times, return the measurements."""
+    experiments = [EXPERIMENT] * runs
+    latencies = []
+    child_rss = []
+    start = time.perf_counter()
+    if workers == 1:
+        for experiment in experiments:
+            run_start = time.perf_counter()
+            result = dssat.run(experiment)
+            if parse:
+                parse_tables(result, dssat.outputs)
+            latencies.append(time.perf_counter() - run_start)
+            child_rss.append(result.metrics.max_rss or 0)
+    else:
+        # Latency of a pooled run is its wall time in the worker
+        for result in dssat.run_many(experiments, workers, ordered=False):
+            if parse:
+                parse_tables(result, dssat.outputs)
+            latencies.append(result.metrics.wall_time)
+            child_rss.append(result.metrics.max_rss or 0)
+    elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "runs": runs,
+        "workers": workers,
+        "runs_per_second": runs / elapsed,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "dssat_max_rss_mb": max(child_rss) / 2**20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--delay", type=float, default=0.0, help="Stand-in run time")
+    parser.add_argument("--no-parse", action="store_true", help="Skip parsing")
+    parser.add_argument("--dssat-bin", help="Real DSSAT build to run instead")
+    parser.add_argument("--dssat-soil", default=".")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    dssat_bin = args.dssat_bin or FAKE_DSSAT
+    os.environ["DABBLER_FAKE_DSSAT_DELAY"] = str(args.delay)
+    dssat = DSSAT(dssat_bin, args.dssat_soil, slot="bench")
+
+    print(
+        f"{'scale':>5} {'workers':>7} {'runs/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'DSSAT MB':>9} {'RSS MB':>7}"
+    )
+    results = []
+    for scale in args.scale:
+        # Read by the stand-in, including from pool workers started later
+        os.environ["DABBLER_FAKE_DSSAT_SCALE"] = str(scale)
+        for workers in args.workers:
+            bench(dssat, min(args.runs, 5 * workers), workers, False)  # Warm up
+            result = bench(dssat, args.runs, workers, not args.no_parse)
+            result["scale"] = scale
+            results.append(result)
+            print(
+                f"{scale:>5} {workers:>7} {result['runs_per_second']:>8.1f} "
+                f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['dssat_max_rss_mb']:>9.1f} "
+                f"{result['max_rss_mb']:>7.1f}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
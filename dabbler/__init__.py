@@ -1 +1,4 @@
 from dabbler.dabbler import *
+from dabbler.pool import DSSATPool
+from dabbler.batch import ExperimentBatch
+from dabbler.cache import ResultCache, WeatherCache, SoilCache
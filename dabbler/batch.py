@@ -0,0 +1,218 @@
+"""
+Experiments stored column by column.
+
+A sweep over cultivars or planting dates is mostly the same experiment over
+and over. ExperimentBatch keeps one array per varying Experiment field and a
+single value for the fields that do not vary, and refers to weather and soil
+data by key, so each weather DataFrame or soil profile is held, and pickled
+to pool workers, once however many experiments use it.
+"""
+import numpy as np
+import pandas as pd
+from . import dabbler
+
+# Columns holding keys into ExperimentBatch.weather and ExperimentBatch.soils
+WEATHER_KEY = "weather_key"
+SOIL_KEY = "soil_key"
+
+
+def _is_missing(value):
+    # None, or NaN / NaT read from a table
+    if value is None or value is pd.NaT:
+        return True
+    if isinstance(value, (float, np.floating)):
+        return value != value
+    if isinstance(value, np.datetime64):
+        return np.isnat(value)
+    return False
+
+
+def _object_array(values):
+    # Filled one by one so tuples stay whole values rather than becoming rows
+    array = np.empty(len(values), object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _to_python(value):
+    if _is_missing(value):
+        return None
+    if isinstance(value, np.datetime64):
+        return value.astype("datetime64[D]").item()
+    if isinstance(value, pd.Timestamp):
+        return value.date()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ExperimentBatch:
+    """Many dabbler.Experiment stored as columns.
+
+    Indexing a batch gives an Experiment, slicing it gives a batch, and
+    iterating it gives its experiments in order. It can be passed wherever
+    an iterable of experiments is expected; DSSATPool sends it to workers in
+    slices rather than one experiment at a time.
+
+    Parameters
+    ----------
+    columns : dict
+        Experiment field names to either a sequence with one value per
+        experiment or a single value shared by all of them. Fields with
+        defaults may be left out. Weather and soil data are given by the
+        "weather_key" and "soil_key" columns instead of weather_data and
+        soil_data.
+    weather : dict, optional
+        Weather DataFrames, see Experiment.weather_data, keyed by the values
+        of the weather_key column.
+    soils : dict, optional
+        dabbler.soil.Soil profiles keyed by the values of the soil_key column.
+    """
+
+    def __init__(self, columns, weather=None, soils=None):
+        self.weather = dict(weather or {})
+        self.soils = dict(soils or {})
+        self.columns = {}  # Field to an array with a value per experiment
+        self.constants = {}  # Field to the value shared by every experiment
+        fields = set(dabbler.Experiment._fields) - {"weather_data", "soil_data"}
+        fields |= {WEATHER_KEY, SOIL_KEY}
+        unknown = set(columns) - fields
+        if unknown:
+            raise ValueError(f"Not Experiment fields: {sorted(unknown)}")
+
+        length = None
+        for field, values in columns.items():
+            if isinstance(values, (str, tuple)) or not hasattr(values, "__len__"):
+                # Tuples are whole values, e.g. AutomaticIrrigationManagement
+                self.constants[field] = values
+                continue
+            if isinstance(values, pd.Series):
+                values = values.to_numpy()
+            if not isinstance(values, np.ndarray):
+                values = list(values)
+                array = np.asarray(values) if values else np.empty(0, object)
+                values = array if array.ndim == 1 else _object_array(values)
+            if length is not None and len(values) != length:
+                raise ValueError(
+                    f"Column {field} has {len(values)} values, expected {length}."
+                )
+            length = len(values)
+            self.columns[field] = values
+        self.length = 1 if length is None else length
+
+        required = {
+            field
+            for field in dabbler.Experiment._fields
+            if field not in dabbler.Experiment._field_defaults
+        }
+        missing = required - set(self.columns) - set(self.constants)
+        if missing:
+            raise ValueError(f"Missing Experiment fields: {sorted(missing)}")
+        for key_field, data in ((WEATHER_KEY, self.weather), (SOIL_KEY, self.soils)):
+            unknown = set(self._unique(key_field)) - set(data) - {None}
+            if unknown:
+                raise KeyError(f"No data for {key_field} values {sorted(unknown)}")
+
+    @classmethod
+    def from_table(cls, table, weather=None, soils=None, **constants):
+        """Build a batch from a table with a row per experiment.
+
+        Parameters
+        ----------
+        table : pandas.DataFrame or pyarrow.Table
+            Columns named as for ExperimentBatch.
+        weather, soils : dict, optional
+            See ExperimentBatch.
+        **constants
+            Fields shared by every row, e.g. crop="Maize".
+        """
+        if not isinstance(table, pd.DataFrame):
+            table = table.to_pandas()  # pyarrow.Table
+        columns = {name: table[name].to_numpy() for name in table.columns}
+        columns.update(constants)
+        return cls(columns, weather, soils)
+
+    @classmethod
+    def from_experiments(cls, experiments):
+        """Build a batch from dabbler.Experiment, sharing their weather and soil.
+
+        Experiments passing the same weather DataFrame or soil object share
+        a single copy of it in the batch.
+        """
+        experiments = list(experiments)
+        columns = {}
+        for field in dabbler.Experiment._fields:
+            if field in ("weather_data", "soil_data"):
+                continue
+            columns[field] = _object_array(
+                [getattr(experiment, field) for experiment in experiments]
+            )
+        weather = {}
+        soils = {}
+        for field, key_field, data in (
+            ("weather_data", WEATHER_KEY, weather),
+            ("soil_data", SOIL_KEY, soils),
+        ):
+            keys = []
+            for experiment in experiments:
+                value = getattr(experiment, field)
+                key = None if value is None else id(value)
+                if key is not None:
+                    data[key] = value
+                keys.append(key)
+            if data:
+                columns[key_field] = np.array(keys, object)
+        return cls(columns, weather, soils)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._slice(index)
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("ExperimentBatch index out of range")
+        values = dict(self.constants)
+        for field, column in self.columns.items():
+            values[field] = column[index]
+        values = {field: _to_python(value) for field, value in values.items()}
+        weather_key = values.pop(WEATHER_KEY, None)
+        soil_key = values.pop(SOIL_KEY, None)
+        if weather_key is not None:
+            values["weather_data"] = self.weather[weather_key]
+        if soil_key is not None:
+            values["soil_data"] = self.soils[soil_key]
+        return dabbler.Experiment(**values)
+
+    def _slice(self, index):
+        batch = ExperimentBatch.__new__(ExperimentBatch)
+        batch.constants = self.constants
+        batch.columns = {field: column[index] for field, column in self.columns.items()}
+        batch.length = len(range(*index.indices(self.length)))
+        # Only carry the weather and soil the slice uses, so slices sent to
+        # workers stay small
+        batch.weather = {key: self.weather[key] for key in batch._unique(WEATHER_KEY)}
+        batch.soils = {key: self.soils[key] for key in batch._unique(SOIL_KEY)}
+        return batch
+
+    def _unique(self, field):
+        if field in self.columns:
+            values = pd.unique(pd.Series(self.columns[field], dtype=object))
+            return [value for value in values if not _is_missing(value)]
+        value = self.constants.get(field)
+        return [] if _is_missing(value) else [value]
+
+    def column(self, field):
+        """Return the values of field, one per experiment, as a list."""
+        if field in self.columns:
+            return [_to_python(value) for value in self.columns[field]]
+        if field in self.constants:
+            return [self.constants[field]] * self.length
+        return [dabbler.Experiment._field_defaults.get(field)] * self.length
@@ -0,0 +1,497 @@
+"""
+On-disk caches shared between DSSAT instances and processes.
+
+Entries are written to a temporary file and moved into place, so readers in
+other processes never see a partly written entry. Reading an entry touches
+its modification time, which is used to evict the least recently used
+entries once the cache grows past its size limit.
+"""
+import os
+import io
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import tempfile
+import functools
+import numpy as np
+import pandas as pd
+import pyproj
+from pathlib import Path
+from typing import NamedTuple
+
+# DayMet's Lambert Conformal Conic grid of 1 km cells, and the top left
+# corner of its top left cell
+DAYMET_CRS = (
+    "+proj=lcc +lat_1=25 +lat_2=60 +lat_0=42.5 +lon_0=-100 "
+    "+x_0=0 +y_0=0 +ellps=WGS84 +units=m +no_defs"
+)
+DAYMET_ORIGIN = (-4560750.0, 4984500.0)
+
+
+class CacheStats(NamedTuple):
+    """Hit and miss counts of a cache, for this process."""
+
+    hits: int
+    misses: int
+    evictions: int
+    size_bytes: int  # Estimated size of the cache directory
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def hash_key(*parts):
+    """Hash the passed strings, bytes or None values into a cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            digest.update(b"\x01")
+        else:
+            if isinstance(part, str):
+                part = part.encode()
+            digest.update(b"\x02" + len(part).to_bytes(8, "little") + part)
+    return digest.hexdigest()
+
+
+def _table_arrays(name, table):
+    """Encode a DataFrame as arrays for an .npz file, keyed name:column.
+
+    String columns are stored as fixed width unicode, with missing values
+    stored empty, as .npz files are read without pickling. See _read_table.
+    """
+    arrays = {}
+    for column in table.columns:
+        values = table[column]
+        if pd.api.types.is_numeric_dtype(values):
+            values = values.to_numpy()
+        else:
+            values = np.asarray(values.fillna(""), dtype=str)
+        arrays[f"{name}:{column}"] = values
+    if not isinstance(table.index, pd.RangeIndex):
+        arrays[f"{name}::index"] = table.index.to_numpy()
+    if table.index.name is not None:
+        arrays[f"{name}::index_name"] = np.array(table.index.name)
+    return arrays
+
+
+def _read_table(columns):
+    """Decode the arrays of a _table_arrays table, keyed by column alone."""
+    index = columns.pop(":index", None)
+    index_name = columns.pop(":index_name", None)
+    for column, values in columns.items():
+        if values.dtype.kind == "U":
+            # Missing strings were stored empty
+            columns[column] = pd.Series(values).replace("", np.nan).to_numpy()
+    table = pd.DataFrame(columns, index=index)
+    if index_name is not None:
+        table.index.name = index_name.item()
+    return table
+
+
+@functools.lru_cache(maxsize=None)
+def _to_daymet_grid():
+    return pyproj.Transformer.from_crs("EPSG:4326", DAYMET_CRS, always_xy=True)
+
+
+class DiskCache:
+    """Size bounded cache of bytes on local disk, keyed by hex strings.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        Created if it does not exist. May be shared between processes.
+    max_bytes : int
+        Least recently used entries are removed once the total size of the
+        entries passes this.
+    suffix : str
+        File suffix of the entries.
+    """
+
+    def __init__(self, directory, max_bytes=2**30, suffix=".bin"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = sum(entry.stat().st_size for entry in self._entries())
+
+    def __getstate__(self):
+        # Counts are kept per process
+        state = self.__dict__.copy()
+        state.update(hits=0, misses=0, evictions=0)
+        return state
+
+    def _path(self, key):
+        # Fan out over sub-directories to keep directory listings short
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def _entries(self):
+        return self.directory.glob(f"*/*{self.suffix}")
+
+    def get(self, key):
+        """Return the bytes stored under key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            pass  # Evicted by another process since it was read
+        self.hits += 1
+        return data
+
+    def set(self, key, data):
+        """Store data under key, replacing any entry already there."""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.size_bytes += len(data) - replaced
+        if self.size_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until under max_bytes."""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry))
+        entries.sort()
+        self.size_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if self.size_bytes <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            self.size_bytes -= size
+            self.evictions += 1
+        logging.info(f"Cache {self.directory} evicted down to {self.size_bytes} B.")
+
+    def clear(self):
+        """Remove every entry."""
+        for entry in self._entries():
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+        self.size_bytes = 0
+
+    def stats(self):
+        return CacheStats(self.hits, self.misses, self.evictions, self.size_bytes)
+
+
+class ResultCache:
+    """Cache of parsed dabbler.Results keyed by the inputs of the run.
+
+    Tables already parsed are stored column by column in a compressed .npz
+    file, along with the raw output of the rest and the run's overview.
+    Pass to dabbler.DSSAT to skip DSSAT entirely for runs it has already
+    made. DSSAT parses every table it reads before caching the run.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+    max_bytes : int
+        See DiskCache.
+    """
+
+    def __init__(self, directory, max_bytes=2**30):
+        self.disk = DiskCache(directory, max_bytes, suffix=".npz")
+
+    def key(
+        self, input_strings, experiment, dssat_exe, outputs, usecols=None, data_files=()
+    ):
+        """Build the cache key of a run.
+
+        Parameters
+        ----------
+        input_strings : dict
+            EXP, WTH and SOIL file strings of the run.
+        experiment : dabbler.Experiment
+        dssat_exe : str
+            DSSAT executable. Its size and modification time are part of the
+            key, so rebuilding DSSAT invalidates the cache.
+        outputs : list of str
+            Output files read from the run.
+        usecols : dict, optional
+            Columns kept from each table.
+        data_files : iterable of str or pathlib.Path, optional
+            DSSAT's own weather and soil files read by the run. Their size
+            and modification time are part of the key, so editing them
+            invalidates the cache.
+        """
+        exe_stat = os.stat(dssat_exe)
+        data_stats = []
+        for data_file in data_files:
+            stat = os.stat(data_file)
+            data_stats.append(f"{data_file}:{stat.st_size}:{stat.st_mtime_ns}")
+        return hash_key(
+            input_strings["EXP"],
+            input_strings["WTH"],
+            input_strings["SOIL"],
+            experiment.model,
+            experiment.cultivar,
+            f"{dssat_exe}:{exe_stat.st_size}:{exe_stat.st_mtime_ns}",
+            ",".join(sorted(outputs)),
+            repr(sorted((usecols or {}).items())),
+            ",".join(data_stats),
+        )
+
+    def get(self, key, results):
+        """Fill the passed, unread dabbler.Results from the cache.
+
+        Returns
+        -------
+        bool
+            False on a miss, in which case results is left unread.
+        """
+        data = self.disk.get(key)
+        if data is None:
+            return False
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            overview = archive["overview"].item()
+            tables = {}
+            raw_outputs = {}
+            for name in archive.files:
+                if name == "overview":
+                    continue
+                fifo_name, _, column = name.partition(":")
+                if column == "raw":
+                    raw_outputs[fifo_name] = archive[name].tobytes()
+                    continue
+                table = tables.setdefault(fifo_name, {})
+                table[column] = archive[name]
+        for fifo_name, columns in tables.items():
+            tables[fifo_name] = _read_table(columns)
+        results.outputs = raw_outputs
+        results.read_outputs(overview, tables)
+        return True
+
+    def put(self, key, results):
+        """Store the passed, read dabbler.Results."""
+        arrays = {"overview": np.array(getattr(results, "overview", ""))}
+        for fifo_name, output in results.outputs.items():
+            # Tables not parsed, or not read into a DataFrame such as
+            # Summary.OUT, are stored as read
+            table = vars(results).get(fifo_name.split(".")[0])
+            if not isinstance(table, pd.DataFrame):
+                arrays[f"{fifo_name}:raw"] = np.frombuffer(output, dtype=np.uint8)
+                continue
+            # Output values are never empty, so empty strings read back as missing
+            arrays.update(_table_arrays(fifo_name, table))
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        self.disk.set(key, buffer.getvalue())
+
+    def stats(self):
+        return self.disk.stats()
+
+
+class WeatherCache:
+    """Cache of DayMet and NASA POWER downloads, shared between runs.
+
+    Responses are stored zlib compressed along with the time they were
+    downloaded. Downloads are always made for the point asked for. DayMet
+    points are keyed by the cell of DayMet's 1 km grid they fall in, so
+    points in the same cell, which DayMet gives the same weather, share a
+    download. Other points are keyed as given, unless a resolution is set
+    for their source. Pass to the download functions of dabbler.weather.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+    max_bytes : int
+        See DiskCache.
+    ttl : float, optional
+        Seconds after which an entry is downloaded again. Entries never
+        expire if not given.
+    offline : bool
+        Never download. Entries are returned however old they are, and a
+        missing entry raises LookupError.
+    resolution : dict, optional
+        Source name to a (longitude, latitude) spacing in degrees. Points of
+        the source closest to the same multiple of the spacing share the
+        first such point's download. This changes the weather of the rest
+        wherever the source varies within the spacing, e.g. NASA POWER's
+        solar parameters are on a different grid to its other parameters.
+    """
+
+    def __init__(
+        self, directory, max_bytes=2**30, ttl=None, offline=False, resolution=None
+    ):
+        self.disk = DiskCache(directory, max_bytes, suffix=".z")
+        self.ttl = ttl
+        self.offline = offline
+        self.resolution = resolution or {}
+
+    def cell(self, source, coordinates):
+        """Return what identifies the point's weather in the cache.
+
+        Parameters
+        ----------
+        source : str
+            "DayMet" or "NASA-POWER".
+        coordinates : tuple
+            (longitude, latitude) WGS84
+
+        Returns
+        -------
+        tuple
+            For DayMet, the (column, row) of its grid cell. Otherwise the
+            coordinates, snapped to the source's resolution if it has one.
+        """
+        if source == "DayMet":
+            x, y = _to_daymet_grid().transform(*coordinates)
+            left, top = DAYMET_ORIGIN
+            return int((x - left) // 1000), int((top - y) // 1000)
+        if source not in self.resolution:
+            return tuple(coordinates)
+        snapped = []
+        for value, step in zip(coordinates, self.resolution[source]):
+            snapped.append(round(round(value / step) * step, 6))
+        return tuple(snapped)
+
+    def key(self, source, coordinates, start, end, parameters=()):
+        """Build the cache key of a download.
+
+        Parameters
+        ----------
+        source : str
+            "DayMet" or "NASA-POWER".
+        coordinates : tuple
+            (longitude, latitude) downloaded, see WeatherCache.cell.
+        start, end
+            First and last date or year downloaded.
+        parameters : list of str, optional
+            Variables downloaded.
+        """
+        cell = self.cell(source, coordinates)
+        return hash_key(source, repr(cell), str(start), str(end), *parameters)
+
+    def fetch(self, key, download):
+        """Return the content stored under key, downloading it on a miss.
+
+        Parameters
+        ----------
+        key : str
+            See WeatherCache.key.
+        download : callable
+            Called with no arguments to download the content as bytes. If it
+            raises OSError, which includes requests' errors, an expired
+            entry is returned in its place when there is one.
+        """
+        data = self.disk.get(key)
+        downloaded_at = content = None
+        if data is not None:
+            (downloaded_at,) = struct.unpack("<d", data[:8])
+            content = zlib.decompress(data[8:])
+            if self.ttl is None or time.time() - downloaded_at < self.ttl:
+                return content
+        if self.offline:
+            if content is None:
+                raise LookupError(f"No cached download {key} while offline.")
+            return content
+        try:
+            fresh = download()
+        except OSError as e:
+            if content is None:
+                raise
+            logging.warning(f"Using expired download {key}, download failed: {e}")
+            return content
+        self.disk.set(key, struct.pack("<d", time.time()) + zlib.compress(fresh))
+        return fresh
+
+    def stats(self):
+        return self.disk.stats()
+
+
+class SoilCache:
+    """Cache of the soil profiles built by dabbler.soil.SoilGenerator.
+
+    Each profile's depth table, properties and HC27 code are stored in a
+    compressed .npz file, keyed by its ROI's geometry and the SoilGrids and
+    HC27 data it was built from. Pass to SoilGenerator to skip reading
+    SoilGrids, the pedotransfer functions and HC27 matching for ROIs it has
+    already built.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+    max_bytes : int
+        See DiskCache.
+    """
+
+    def __init__(self, directory, max_bytes=2**30):
+        self.disk = DiskCache(directory, max_bytes, suffix=".npz")
+
+    def key(self, ROI, data_version):
+        """Build the cache key of an ROI's soil.
+
+        Parameters
+        ----------
+        ROI : shapely.geometry.base.BaseGeometry
+            ROI in WGS84 coordinates, keyed by its WKB.
+        data_version : str
+            Identifies the SoilGrids and HC27 data, see
+            SoilGenerator.data_version.
+        """
+        return hash_key(ROI.wkb, data_version)
+
+    def get(self, key):
+        """Return the (depth_table, properties, HC_code) stored under key.
+
+        Returns
+        -------
+        tuple or None
+            None on a miss.
+        """
+        data = self.disk.get(key)
+        if data is None:
+            return None
+        tables = {"depth_table": {}, "properties": {}}
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            HC_code = archive["HC_code"].item()
+            for name in archive.files:
+                table, _, column = name.partition(":")
+                if table in tables:
+                    tables[table][column] = archive[name]
+        for name, columns in tables.items():
+            tables[name] = _read_table(columns)
+        return tables["depth_table"], tables["properties"], HC_code
+
+    def put(self, key, soil):
+        """Store the passed dabbler.soil.Soil."""
+        arrays = {"HC_code": np.array(soil.HC_code)}
+        for name in ("depth_table", "properties"):
+            arrays.update(_table_arrays(name, getattr(soil, name)))
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        self.disk.set(key, buffer.getvalue())
+
+    def stats(self):
+        return self.disk.stats()
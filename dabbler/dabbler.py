@@ -2,28 +2,43 @@
 dabbler - a simple Python wrapper for DSSAT.
 """
 import os
-import sys
+import re
+import hashlib
 import signal
-import queue
 import logging
 import time
 import atexit
-import select
+import asyncio
+import weakref
+import threading
 import subprocess
 import pandas as pd
 import datetime
 from . import file_generator
 from . import soil
+from . import pool
+from . import output_parser
+from . import metrics
+from .metrics import RunMetrics
+from .batch import ExperimentBatch
+from .fifo import FifoReader, FifoMultiplexer, DEFAULT_TIMEOUT
 from .dabbler_errors import SimulationFailedError
-from threading import Thread
 from pathlib import Path
 from io import StringIO
 from typing import NamedTuple
+from contextlib import contextmanager
 
 
-# TODO: add track_nitrogen and track_water variables to Experiment, then use
-# that to select which fifos are built (e.g. SoilNBalSum.OUT is not used when
-# no N tracked)
+# DSSAT instances whose I/O directories are removed on SIGTERM / SIGINT
+_live_instances = weakref.WeakSet()
+
+
+def _clean_live_instances(*args):
+    pid = os.getpid()
+    for instance in list(_live_instances):
+        # Skip instances inherited from a parent process through fork
+        if instance.owner_pid == pid:
+            instance.clean_in_out_on_exit()
 
 
 class DSSAT:
@@ -35,6 +50,24 @@ class DSSAT:
         Path to the DSSAT install directory e.g. home/DSSAT/build/bin
     dssat_weather : str
         Path to the DSSAT weather file directory e.g. home/DSSAT/build/weather
+    slot : int or str, optional
+        Identifier for this instance's I/O directory. Give each instance in a
+        process its own slot to run several of them side by side.
+    outputs : list of str, optional
+        Output files read from each run, from DSSAT_OUT_FILES. Defaults to
+        all of them. Only these FIFOs are created, and DSSAT's output
+        switches are set so it writes no more than is needed.
+    cache : dabbler.cache.ResultCache, optional
+        Cache of results looked up before each run. DSSAT is not launched
+        for runs found in it. Not used by run_batch.
+    metrics_registry : dabbler.metrics.MetricsRegistry, optional
+        Registry runs are recorded in. Defaults to dabbler.metrics.registry.
+    timeout : float, optional
+        Seconds a DSSAT run may take before it is killed and
+        SimulationFailedError raised, so a DSSAT that hangs, e.g. on a
+        keyboard prompt after an input error, does not block forever. A
+        batch launch is allowed this long for each of its experiments.
+        Defaults to dabbler.fifo.DEFAULT_TIMEOUT. Waits forever if None.
     """
 
     # NOTE: files commented out are files that DSSAT regularly reads from
@@ -64,6 +97,9 @@ class DSSAT:
         "Weather.OUT",
     ]
 
+    # Logs DSSAT writes on errors, read into SimulationFailedError
+    DSSAT_LOG_FILES = ["ERROR.OUT", "WARNING.OUT"]
+
     # Have to format fifos for weathe soil inputs as it
     # must reside in the /build/Weather
     DSSAT_IN_FILES = {
@@ -74,21 +110,76 @@ class DSSAT:
     }
     # No fifos used for soil.
 
-    def __init__(self, dssat_install, dssat_soil, run_location=Path.cwd()):
+    # Input files for each run of a batch, numbered by run
+    DSSAT_BATCH_IN_FILES = {
+        "EXP": "EXPT{run:04d}.EXP",
+        "WTH": "WTHB{run:04d}.WTH",
+    }
+    # Batch experiment files are numbered EXPT0001 - EXPT9999
+    MAX_BATCH_SIZE = 9999
+
+    # Experiment file output switches that must all be on for DSSAT to write
+    # each output file. Files not listed are always written.
+    OUTPUT_SWITCHES = {
+        "ET.OUT": {"WAOUT"},
+        "Mulch.OUT": {"WAOUT"},
+        "PlantGro.OUT": {"GROUT"},
+        "PlantN.OUT": {"GROUT", "NIOUT"},
+        "SoilTemp.OUT": {"GROUT"},
+        "SoilWatBal.OUT": {"WAOUT"},
+        "SoilWat.OUT": {"WAOUT"},
+        "Weather.OUT": {"GROUT"},
+    }
+    # Outputs read by summary only runs
+    SUMMARY_ONLY_OUTPUTS = ["Summary.OUT"]
+
+    def __init__(
+        self,
+        dssat_install,
+        dssat_soil,
+        run_location=Path.cwd(),
+        slot=None,
+        outputs=None,
+        cache=None,
+        metrics_registry=None,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        self.dssat_install = Path(dssat_install)
         self.dssat_exe = self._check_install(dssat_install)
         self.dssat_soil = Path(dssat_soil)
+        self.slot = slot
+        if outputs is None:
+            outputs = self.DSSAT_OUT_FILES
+        self._check_outputs(outputs)
+        self.outputs = list(outputs)
+        self.cache = cache
+        self.metrics_registry = metrics_registry or metrics.registry
+        self.timeout = timeout
+        self.last_metrics = None
+        self._pool = None  # pool.DSSATPool kept by run_many
+        # An asyncio.Lock is bound to the event loop it is first used on
+        self._async_locks = weakref.WeakKeyDictionary()  # loop: lock
+        self._written_inputs = {}  # Input file: (content digest, mtime, size)
+        self.io = FifoMultiplexer()
         self.create_in_out_location()
         self.build_fifos()
 
     def create_in_out_location(self):
         pid = os.getpid()
-        in_out_location = Path.cwd() / f"DSSAT_IO_{pid}"
+        io_name = f"DSSAT_IO_{pid}"
+        if self.slot is not None:
+            io_name = f"{io_name}_{self.slot}"
+        in_out_location = Path.cwd() / io_name
         in_out_location.mkdir(exist_ok=True)
         self.in_out_location = in_out_location
+        self.owner_pid = pid
         atexit.register(self.clean_in_out_on_exit)
-        # Use signal to catch multi-process exit
-        signal.signal(signal.SIGTERM, self.clean_in_out_on_exit)
-        signal.signal(signal.SIGINT, self.clean_in_out_on_exit)
+        # Use signal to catch multi-process exit. Signal handlers can only be
+        # set from the main thread.
+        _live_instances.add(self)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, _clean_live_instances)
+            signal.signal(signal.SIGINT, _clean_live_instances)
 
     def clean_in_out_on_exit(self, *args):
         logging.info('clean_in_out_on_exit called')
@@ -107,7 +198,7 @@ class DSSAT:
     def kill_dssat_subprocess(self):
         try:
             self.dssat_proc.kill()
-        except AttributeError:
+        except (AttributeError, ProcessLookupError):
             pass
 
     def remove_weather_file(self):
@@ -124,10 +215,79 @@ class DSSAT:
     def build_out_fifos(self):
         # DSSAT will automatically append to them
         self.out_fifos = {}
+        for out_file in self.outputs:
+            self.build_out_fifo(out_file)
+
+    def build_out_fifo(self, out_file):
+        out_fifo = self.in_out_location / out_file
+        try:
+            out_fifo.unlink()  # Regular file left by an earlier run
+        except FileNotFoundError:
+            pass
+        os.mkfifo(out_fifo)
+        self.out_fifos[out_file] = out_fifo
+
+    def _check_outputs(self, outputs):
+        for out_file in outputs:
+            if out_file not in self.DSSAT_OUT_FILES:
+                raise ValueError(
+                    f"{out_file} is not a DSSAT output file, "
+                    f"choose from {self.DSSAT_OUT_FILES}"
+                )
+
+    def _plan_outputs(self, outputs=None, summary_only=False):
+        """Work out which output files a run writes and reads.
+
+        Parameters
+        ----------
+        outputs : list of str, optional
+            Output files to read. Defaults to this instance's outputs. FIFOs
+            are created for any not yet built.
+        summary_only : bool
+            If True, read only SUMMARY_ONLY_OUTPUTS.
+
+        Returns
+        -------
+        list of str
+            Output files to parse.
+        dict
+            Output switches for the experiment file.
+        dict
+            FIFOs DSSAT will write to, keyed by output file name. All of
+            them must be read, otherwise DSSAT blocks opening one.
+        """
+        if summary_only:
+            outputs = self.SUMMARY_ONLY_OUTPUTS
+        elif outputs is None:
+            outputs = self.outputs
+        self._check_outputs(outputs)
+        for out_file in outputs:
+            if out_file not in self.out_fifos:
+                self.build_out_fifo(out_file)
+
+        switches_on = set()
+        for out_file in outputs:
+            switches_on.update(self.OUTPUT_SWITCHES.get(out_file, set()))
+        output_options = {
+            switch: "Y" if switch in switches_on else "N"
+            for switch in file_generator.OUTPUT_OPTIONS
+        }
+        written_fifos = {
+            out_file: out_fifo
+            for out_file, out_fifo in self.out_fifos.items()
+            if self.OUTPUT_SWITCHES.get(out_file, set()) <= switches_on
+        }
+        return list(outputs), output_options, written_fifos
+
+    def _remove_unread_outputs(self):
+        # Output files with no FIFO are written as regular files. Remove them
+        # so that DSSAT does not append to them run after run.
         for out_file in self.DSSAT_OUT_FILES:
-            out_fifo = self.in_out_location / out_file
-            os.mkfifo(out_fifo)
-            self.out_fifos[out_file] = out_fifo
+            if out_file not in self.out_fifos:
+                try:
+                    (self.in_out_location / out_file).unlink()
+                except FileNotFoundError:
+                    pass
 
     def build_in_files(self):
         self.in_files = {}
@@ -143,110 +303,637 @@ class DSSAT:
         batch_fifo = self.in_out_location / self.DSSAT_IN_FILES["BATCH"].format(
             pid=str(pid)[-4:]
         )
+        self.in_files["BATCH"] = batch_fifo
 
-    def run(self, experiment, supress_stdout=True):
+    def run(
+        self,
+        experiment,
+        supress_stdout=True,
+        summary_only=False,
+        outputs=None,
+        usecols=None,
+    ):
         """Run the passed experiment.
 
+        Parameters
+        ----------
+        experiment : dabbler.Experiment
+        supress_stdout : bool
+        summary_only : bool
+            If True, DSSAT does not write its daily output tables and only
+            Results.Summary and the overview are read. Much faster for runs
+            where only end of season values are needed.
+        outputs : list of str, optional
+            Output files to read, from DSSAT_OUT_FILES. Defaults to the
+            outputs the instance was created with.
+        usecols : dict, optional
+            Columns to keep from each output table, keyed by output file
+            name e.g. {"PlantGro.OUT": ["LAID", "CWAD"]}. Tables not listed
+            keep all their columns.
+
         Returns
         -------
         dabbler.Results
         """
-        weather_file_string = None
-        if experiment.weather_station_code is None:
-            weather_file_string = file_generator.generate_weather_file_string(
-                experiment
+        with self._record_run(RunMetrics()) as run_metrics:
+            experiment, outputs, written_fifos, cache_key, result = self._start_run(
+                run_metrics, experiment, summary_only, outputs, usecols
+            )
+            if result is not None:
+                return result
+
+            try:
+                # Open the output fifos so DSSAT never waits on a reader
+                self.io.open(written_fifos)
+                # OK - finally - open a subprocess to run DSSAT from 'within'
+                # the simulation's save directory, so that the files are saved
+                # there.
+                with run_metrics.time("subprocess"):
+                    self.start_dssat_subprocess(supress_stdout)
+                    self._wait_for_dssat(run_metrics)
+            finally:
+                with run_metrics.time("read"):
+                    fifo_outputs = self.io.close()
+                self._remove_unread_outputs()
+            self._check_dssat_exit(self.dssat_proc.returncode)
+
+            result = self._finish_run(
+                run_metrics, experiment, fifo_outputs, outputs, usecols, cache_key
+            )
+
+        return result
+
+    async def run_async(
+        self,
+        experiment,
+        supress_stdout=True,
+        summary_only=False,
+        outputs=None,
+        usecols=None,
+    ):
+        """Run the passed experiment without blocking the event loop.
+
+        Output FIFOs are read through the event loop rather than threads,
+        while generating and writing the inputs and parsing the outputs run
+        in the loop's default executor. Runs on one instance are serialised as they share an I/O directory,
+        so create one instance (each with its own slot) per run to be kept
+        in flight. See DSSAT.run for the parameters.
+
+        NOTE: the event loop reaps DSSAT, so only wall times are recorded in
+        Results.metrics, not DSSAT's CPU time or memory.
+
+        Returns
+        -------
+        dabbler.Results
+        """
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_locks:
+            self._async_locks[loop] = asyncio.Lock()
+        async with self._async_locks[loop]:
+            with self._record_run(RunMetrics("async")) as run_metrics:
+                (
+                    experiment,
+                    outputs,
+                    written_fifos,
+                    cache_key,
+                    result,
+                ) = await loop.run_in_executor(
+                    None,
+                    self._start_run,
+                    run_metrics,
+                    experiment,
+                    summary_only,
+                    outputs,
+                    usecols,
+                )
+                if result is not None:
+                    return result
+
+                readers = {}
+                subprocess_start = time.perf_counter()
+                timed_out = False
+                try:
+                    # Opened here so the readers opened are closed if one fails
+                    for fifo_name, fifo_loc in written_fifos.items():
+                        readers[fifo_name] = reader = FifoReader(fifo_loc)
+                        loop.add_reader(reader.fileno(), reader.read_available)
+                    self.dssat_proc = await asyncio.create_subprocess_exec(
+                        self.dssat_exe,
+                        "A",
+                        self.in_files["EXP"].name,
+                        cwd=self.in_out_location,
+                        stdout=subprocess.DEVNULL if supress_stdout else None,
+                    )
+                    try:
+                        await asyncio.wait_for(self.dssat_proc.wait(), self.timeout)
+                    except asyncio.TimeoutError:
+                        self.kill_dssat_subprocess()
+                        await self.dssat_proc.wait()
+                        timed_out = True
+                    except asyncio.CancelledError:
+                        self.kill_dssat_subprocess()
+                        raise
+                finally:
+                    run_metrics.add(
+                        "subprocess", time.perf_counter() - subprocess_start
+                    )
+                    with run_metrics.time("read"):
+                        for reader in readers.values():
+                            loop.remove_reader(reader.fileno())
+                            reader.close()
+                    self._remove_unread_outputs()
+                run_metrics.returncode = self.dssat_proc.returncode
+                await loop.run_in_executor(
+                    None,
+                    self._check_dssat_exit,
+                    self.dssat_proc.returncode,
+                    f"DSSAT did not finish within {self.timeout} s and was killed."
+                    if timed_out
+                    else None,
+                )
+
+                fifo_outputs = {
+                    fifo_name: reader.getvalue()
+                    for fifo_name, reader in readers.items()
+                }
+                result = await loop.run_in_executor(
+                    None,
+                    self._finish_run,
+                    run_metrics,
+                    experiment,
+                    fifo_outputs,
+                    outputs,
+                    usecols,
+                    cache_key,
+                )
+
+        return result
+
+    def _start_run(self, run_metrics, experiment, summary_only, outputs, usecols):
+        """Generate a run's inputs, then look it up in the cache or write them.
+
+        Shared by DSSAT.run and DSSAT.run_async, see DSSAT.run for the
+        parameters.
+
+        Returns
+        -------
+        dabbler.Experiment
+            Experiment pointed at the generated input files.
+        list of str
+            Output files to parse.
+        dict
+            FIFOs DSSAT will write to, see DSSAT._plan_outputs.
+        str or None
+            Result cache key, None if there is no cache.
+        dabbler.Results or None
+            The cached result, None unless found in the cache. The input
+            files are only written if it is None.
+        """
+        with run_metrics.time("inputs"):
+            outputs, output_options, written_fifos = self._plan_outputs(
+                outputs, summary_only
+            )
+            experiment, input_strings = self._prepare_inputs(
+                experiment, output_options=output_options
+            )
+        cache_key = None
+        if self.cache is not None:
+            with run_metrics.time("cache"):
+                cache_key = self._cache_key(experiment, input_strings, outputs, usecols)
+                result = Results(experiment, self.in_out_location, {}, usecols)
+                run_metrics.cache_hit = self.cache.get(cache_key, result)
+            if run_metrics.cache_hit:
+                result.metrics = run_metrics
+                return experiment, outputs, written_fifos, cache_key, result
+
+        # Input files must be in place before DSSAT is launched
+        with run_metrics.time("write"):
+            self.write_input_files(input_strings)
+        return experiment, outputs, written_fifos, cache_key, None
+
+    def _finish_run(
+        self, run_metrics, experiment, fifo_outputs, outputs, usecols, cache_key
+    ):
+        """Build the Results of a run from what was read from its FIFOs.
+
+        The overview is read and, given a cache_key, the tables are parsed
+        and the result cached, so cache hits need not parse them again.
+        """
+        result = Results(
+            experiment,
+            self.in_out_location,
+            {out_file: fifo_outputs[out_file] for out_file in outputs},
+            usecols,
+        )
+        result.metrics = run_metrics
+        with run_metrics.time("overview"):
+            result.read_outputs()
+        if cache_key is not None:
+            for out_file in outputs:
+                getattr(result, out_file.split(".")[0])
+            with run_metrics.time("cache"):
+                self.cache.put(cache_key, result)
+        return result
+
+    def run_batch(
+        self,
+        experiments,
+        supress_stdout=True,
+        summary_only=False,
+        outputs=None,
+        usecols=None,
+    ):
+        """Run the passed experiments from a single DSSAT launch.
+
+        Each experiment is written to its own experiment file and listed in a
+        DSSAT batch file. The combined outputs are then split back into one
+        Results per experiment. More than MAX_BATCH_SIZE experiments are run
+        over several launches.
+
+        Parameters
+        ----------
+        experiments : iterable of dabbler.Experiment or dabbler.ExperimentBatch
+        supress_stdout : bool
+        summary_only, outputs, usecols
+            See DSSAT.run.
+
+        Returns
+        -------
+        list of dabbler.Results
+            In the order the experiments were passed. A run that wrote no
+            output has its SimulationFailedError as Results.error, raised
+            when its tables are accessed.
+        """
+        if not isinstance(experiments, ExperimentBatch):
+            experiments = list(experiments)
+        output_plan = self._plan_outputs(outputs, summary_only)
+        results = []
+        for start in range(0, len(experiments), self.MAX_BATCH_SIZE):
+            results.extend(
+                self._run_batch_launch(
+                    experiments[start : start + self.MAX_BATCH_SIZE],
+                    supress_stdout,
+                    output_plan,
+                    usecols,
+                )
             )
-            experiment = experiment._replace(
-                weather_station_code=self.in_files["WTH"].stem
+        return results
+
+    def _run_batch_launch(self, experiments, supress_stdout, output_plan, usecols):
+        with self._record_run(RunMetrics("B", len(experiments))) as run_metrics:
+            return self._run_batch_launch_recorded(
+                experiments, supress_stdout, output_plan, usecols, run_metrics
             )
 
+    def _run_batch_launch_recorded(
+        self, experiments, supress_stdout, output_plan, usecols, run_metrics
+    ):
+        outputs, output_options, written_fifos = output_plan
+        inputs_start = time.perf_counter()
+        batch_experiments = []
+        batch_files = {}
+        exp_files = []
+        soil_strings = {}
+        weather_files = {}  # Weather string: the run's file that holds it
+        for run, experiment in enumerate(experiments, 1):
+            exp_file, wth_file = [
+                self.in_out_location / self.DSSAT_BATCH_IN_FILES[in_file].format(run=run)
+                for in_file in ("EXP", "WTH")
+            ]
+            experiment, input_strings = self._prepare_data_inputs(experiment, wth_file)
+            weather_file_string = input_strings["WTH"]
+            if weather_file_string is not None:
+                # Runs with the same weather share the first run's file
+                wth_file = weather_files.setdefault(weather_file_string, wth_file)
+                experiment = experiment._replace(weather_station_code=wth_file.stem)
+                batch_files[wth_file] = weather_file_string
+            batch_experiments.append(experiment)
+            exp_files.append(exp_file.name)
+            if input_strings["SOIL"] is not None:
+                # One profile per soil code in the shared soil file
+                soil_strings[experiment.soil_code] = input_strings["SOIL"]
+
+        if soil_strings:
+            batch_files[self.in_files["SOIL"]] = "".join(soil_strings.values())
+        # Render every experiment file in one pass over their columns
+        experiment_columns = {
+            field: [getattr(experiment, field) for experiment in batch_experiments]
+            for field in Experiment._fields
+            if field not in ("weather_data", "soil_data")
+        }
+        exp_strings = file_generator.generate_experiment_file_strings(
+            experiment_columns, output_options
+        )
+        for exp_file, exp_string in zip(exp_files, exp_strings):
+            batch_files[self.in_out_location / exp_file] = exp_string
+        batch_files[self.in_files["BATCH"]] = file_generator.generate_batchfile_string(
+            batch_experiments[0], exp_files
+        )
+        run_metrics.add("inputs", time.perf_counter() - inputs_start)
+        with run_metrics.time("write"):
+            for in_file, string in batch_files.items():
+                self.write_input_file(string, in_file)
+
+        try:
+            self.io.open(written_fifos)
+            with run_metrics.time("subprocess"):
+                self.start_dssat_subprocess(
+                    supress_stdout, "B", self.in_files["BATCH"].name
+                )
+                self._wait_for_dssat(run_metrics, len(batch_experiments))
+        finally:
+            with run_metrics.time("read"):
+                fifo_outputs = self.io.close()
+            self._remove_unread_outputs()
+
+        # Remove the numbered run files, single runs write their own
+        for in_file in batch_files:
+            if in_file not in self.in_files.values():
+                in_file.unlink()
+        self._check_dssat_exit(self.dssat_proc.returncode)
+
+        overview_start = time.perf_counter()
+        overview = Results.read_overview_file(self.in_out_location / "OVERVIEW.OUT")
+        run_outputs = Results.split_runs(
+            {out_file: fifo_outputs[out_file] for out_file in outputs},
+            len(batch_experiments),
+        )
+        run_overviews = Results.split_overview(overview, len(batch_experiments))
+
+        results = []
+        for experiment, outputs, overview in zip(
+            batch_experiments, run_outputs, run_overviews
+        ):
+            result = Results(experiment, self.in_out_location, outputs, usecols)
+            result.metrics = run_metrics  # Shared by every run of the launch
+            try:
+                result.read_outputs(overview)
+            except SimulationFailedError as error:
+                # Only this run failed, the rest of the launch is kept
+                result.error = error
+            results.append(result)
+        run_metrics.add("overview", time.perf_counter() - overview_start)
+        return results
+
+    def _prepare_inputs(self, experiment, wth_file=None, output_options=None):
+        """Generate the input file strings for the passed experiment.
+
+        Parameters
+        ----------
+        experiment : dabbler.Experiment
+        wth_file : pathlib.Path, optional
+            Weather file generated weather is written to. Defaults to this
+            instance's weather file.
+        output_options : dict, optional
+            Output switches for the experiment file, see DSSAT._plan_outputs.
+
+        Returns
+        -------
+        dabbler.Experiment
+            Experiment with weather station and soil codes set to point at
+            the generated files.
+        dict
+            Input file strings keyed as DSSAT_IN_FILES. Weather and soil are
+            None if DSSAT should use its own files.
+        """
+        experiment, input_strings = self._prepare_data_inputs(experiment, wth_file)
+        input_strings["EXP"] = file_generator.generate_experiment_file_string(
+            experiment, output_options
+        )
+        return experiment, input_strings
+
+    def _prepare_data_inputs(self, experiment, wth_file=None):
+        """Generate the weather and soil file strings, see _prepare_inputs."""
+        weather_file_string = None
+        if experiment.weather_station_code is None:
+            weather_file_string = file_generator.get_weather_file_string(experiment)
+            if wth_file is None:
+                wth_file = self.in_files["WTH"]
+            experiment = experiment._replace(weather_station_code=wth_file.stem)
+
         soil_file_string = None
         if experiment.soil_code is None:
             soil_file_string = str(experiment.soil_data)  # soil.Soil object
             experiment = experiment._replace(soil_code=experiment.soil_data.ROI_code)
 
-        experiment_file_string = file_generator.generate_experiment_file_string(
-            experiment
+        return experiment, {"WTH": weather_file_string, "SOIL": soil_file_string}
+
+    def _cache_key(self, experiment, input_strings, outputs, usecols):
+        exp_string = input_strings["EXP"]
+        if input_strings["WTH"] is not None:
+            # Generated weather files are named after the process, leave the
+            # name out so runs from any process share the cache entry
+            exp_string = exp_string.replace(experiment.weather_station_code, "")
+        return self.cache.key(
+            dict(input_strings, EXP=exp_string),
+            experiment,
+            self.dssat_exe,
+            outputs,
+            usecols,
+            self._data_files(experiment, input_strings),
         )
 
-        # Deploy write threads to write input files
-        write_threads = self.deploy_write_threads(
-            weather_file_string, experiment_file_string, soil_file_string
-        )
+    def _data_files(self, experiment, input_strings):
+        """Return DSSAT's own weather and soil files a run may read.
 
-        # Instance the Results class. It will spawn the read threads
-        result = Results(self.out_fifos, experiment, self.in_out_location)
+        Files are looked for in the I/O directory, the soil directory and
+        the Weather and Soil directories in or beside the install, as laid
+        out by DSSAT installs and builds. Files DSSAT is pointed to anywhere
+        else are not found, so editing them is not seen by the result cache.
+        """
+        names = []
+        if input_strings["WTH"] is None:
+            station = experiment.weather_station_code
+            if len(station) == 4:
+                # Stored a year a file, e.g. UFGA8201.WTH
+                last_date = experiment.harvest_end or experiment.harvest_date
+                years = range(experiment.simulation_start.year, last_date.year + 1)
+                names += [f"{station}{year % 100:02d}01.WTH" for year in years]
+            else:
+                names.append(f"{station}.WTH")
+        if input_strings["SOIL"] is None:
+            names += [self.DSSAT_IN_FILES["SOIL"], f"{experiment.soil_code[:2]}.SOL"]
+        directories = dict.fromkeys([self.in_out_location, self.dssat_soil])
+        for install in (self.dssat_install, self.dssat_install.parent):
+            directories.update(dict.fromkeys([install / "Weather", install / "Soil"]))
+        return [
+            directory / name
+            for directory in directories
+            for name in names
+            if (directory / name).is_file()
+        ]
+
+    def write_input_files(self, input_strings):
+        """Write the input files for a run.
+
+        NOTE: these are regular files rather than fifos as DSSAT reads them
+        more than once.
+        """
+        for in_file, string in input_strings.items():
+            if string is not None:
+                self.write_input_file(string, self.in_files[in_file])
 
-        # Join the write threads to ensure input files are written before
-        # DSSAT is launched
-        [write_thread.join() for write_thread in write_threads]
+    def write_input_file(self, string, in_file):
+        """Write an input file, unless it already holds string.
 
-        # OK - finally - open a subprocess to run DSSAT from 'within'
-        # the simulation's save directory, so that the files are saved there.
-        self.start_dssat_subprocess(supress_stdout)
+        Returns
+        -------
+        bool
+            False if the file was left as it was.
+        """
+        digest = hashlib.blake2b(string.encode(), digest_size=16).digest()
+        try:
+            stat = os.stat(in_file)
+        except FileNotFoundError:
+            stat = None
+        # Files changed or removed by anything else since are written again
+        if stat is not None and self._written_inputs.get(in_file) == (
+            digest,
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            return False
+        self.write_string_to_file(string, in_file)
+        stat = os.stat(in_file)
+        self._written_inputs[in_file] = (digest, stat.st_mtime_ns, stat.st_size)
+        return True
+
+    def run_many(
+        self,
+        experiments,
+        workers=None,
+        ordered=True,
+        supress_stdout=True,
+        summary_only=False,
+        outputs=None,
+        usecols=None,
+    ):
+        """Run the passed experiments concurrently across worker processes.
 
-        # Tell the Results object to join read threads now we have run DSSAT
-        result.read_outputs()
+        Each worker gets its own I/O directory and FIFOs. The workers are
+        started on the first call and kept for later calls with the same
+        number of workers, until DSSAT.close.
 
-        return result
+        Parameters
+        ----------
+        experiments : iterable of dabbler.Experiment or dabbler.ExperimentBatch
+        workers : int, optional
+            Number of worker processes. Defaults to the number of CPUs.
+        ordered : bool
+            If True, yield results in input order, otherwise as they complete.
+        summary_only, outputs, usecols
+            See DSSAT.run. Outputs default to this instance's outputs.
+
+        Yields
+        ------
+        dabbler.Results
+            A failed run has its SimulationFailedError as Results.error, see
+            DSSATPool.map.
+        """
+        if outputs is None:
+            outputs = self.outputs
+        workers = workers or os.cpu_count()
+        if self._pool is None or self._pool.workers != workers:
+            self.close()
+            self._pool = pool.DSSATPool(
+                self.dssat_install,
+                self.dssat_soil,
+                workers,
+                self.outputs,
+                self.cache,
+                self.metrics_registry,
+                self.timeout,
+            )
+        yield from self._pool.map(
+            experiments, ordered, supress_stdout, summary_only, outputs, usecols
+        )
+
+    def close(self):
+        """Shut down the worker processes kept by run_many, if any."""
+        if self.__dict__.get("_pool") is not None:
+            self._pool.close()
+            self._pool = None
+
+    def __del__(self):
+        self.close()
 
-    def start_dssat_subprocess(self, supress_stdout):
+    def start_dssat_subprocess(self, supress_stdout, run_mode="A", run_file=None):
+        if run_file is None:
+            run_file = self.in_files["EXP"].name
         try:
             if supress_stdout:
-                devnull = open(os.devnull, "w")
                 self.dssat_proc = subprocess.Popen(
-                    [self.dssat_exe, "A", self.in_files["EXP"].name],
+                    [self.dssat_exe, run_mode, run_file],
                     cwd=self.in_out_location,
-                    stdout=devnull,
+                    stdout=subprocess.DEVNULL,
                 )
             else:
                 self.dssat_proc = subprocess.Popen(
-                    [self.dssat_exe, "A", self.in_files["EXP"].name],
+                    [self.dssat_exe, run_mode, run_file],
                     cwd=self.in_out_location,
                 )
         except FileNotFoundError:
             print("Simulation sub-dir not found. Exiting")
             exit()
 
-    def deploy_write_threads(self, weather_string, experiment_string, soil_string):
-        # NOTE: none of these can actually be fifos as DSSAT does double reads
-        write_threads = []
-        if soil_string is not None:
-            write_threads.append(
-                Thread(
-                    target=self.write_string_to_file,
-                    args=(soil_string, self.in_files["SOIL"]),
-                    daemon=True,
-                )
-            )
-        if weather_string is not None:
-            write_threads.append(
-                Thread(
-                    target=self.write_string_to_file,
-                    args=(weather_string, self.in_files["WTH"]),
-                    daemon=True,
-                )
-            )
-        write_threads.append(
-            Thread(
-                target=self.write_string_to_file,
-                args=(experiment_string, self.in_files["EXP"]),
-                daemon=True,
+    def _wait_for_dssat(self, run_metrics, num_runs=1):
+        """Read the output fifos until DSSAT exits, or runs out of time."""
+        timeout = None if self.timeout is None else self.timeout * num_runs
+        try:
+            rusage = self.io.wait(self.dssat_proc, timeout)
+        except subprocess.TimeoutExpired:
+            run_metrics.returncode = self.dssat_proc.returncode
+            self._check_dssat_exit(
+                self.dssat_proc.returncode,
+                f"DSSAT did not finish within {timeout} s and was killed.",
             )
-        )
-        [thread.start() for thread in write_threads]
-        return write_threads
+        except BaseException:
+            # Interrupted, don't leave DSSAT running or unreaped
+            self.kill_dssat_subprocess()
+            self.dssat_proc.wait()
+            raise
+        run_metrics.returncode = self.dssat_proc.returncode
+        run_metrics.add("read", self.io.read_seconds)
+        if rusage is not None:
+            run_metrics.set_rusage(rusage)
+        run_metrics.max_rss = self.io.max_rss
+
+    @contextmanager
+    def _record_run(self, run_metrics):
+        """Record the run in the metrics registry once it finishes or fails."""
+        try:
+            yield run_metrics
+        finally:
+            self.last_metrics = run_metrics
+            self.metrics_registry.record(run_metrics)
 
-    def write_string_to_file(self, string, fifo):
-        # Blocks until DSSAT goes to read from the fifo
-        with open(fifo, "w") as f:
-            f.write(string)
+    def _check_dssat_exit(self, returncode, message=None):
+        """Raise if DSSAT exited with an error, with its error logs.
 
-    def read_from_fifo(self, fifo):
-        # Blocks until DSSAT writes to fifo
-        with open(fifo, "r") as f:
-            output = f.read()
-        return output
+        The logs are removed after every run, otherwise DSSAT appends to
+        them run after run. message replaces the default one naming the
+        exit code.
+        """
+        logs = {}
+        for log_file in self.DSSAT_LOG_FILES:
+            log_loc = self.in_out_location / log_file
+            try:
+                if returncode != 0:
+                    with open(log_loc, "r", errors="replace") as f:
+                        logs[log_file] = f.read()
+                log_loc.unlink()
+            except FileNotFoundError:
+                pass
+        if returncode != 0:
+            if message is None:
+                message = f"DSSAT exited with code {returncode}."
+            for log_file, log in logs.items():
+                message += f"\n{log_file}:\n{log.strip()}"
+            raise SimulationFailedError(message, returncode, logs)
+
+    def write_string_to_file(self, string, in_file):
+        with open(in_file, "w") as f:
+            f.write(string)
 
     def forecast(self, forecast_start, num_years):
         """Define forecasting parameters for a forecast run.
@@ -321,15 +1008,141 @@ class Experiment(NamedTuple):
     irrigation_management: AutomaticIrrigationManagement = AutomaticIrrigationManagement()
 
 
+# Line starting each run's section of the daily outputs and the overview
+_RUN_HEADER = re.compile(r"\*RUN\s+(\d+)")
+# Summary.OUT columns after the treatment name, in the order DSSAT writes them
+SUMMARY_COLUMNS = """
+    FNAM WSTA WYEAR SOIL_ID XLAT LONG ELEV SDAT PDAT EDAT ADAT MDAT HDAT HYEAR
+    DWAP CWAM HWAM HWAH BWAH PWAM HWUM H#AM H#UM HIAM LAIX FCWAM FHWAM HWAHF
+    FBWAH FPWAM IR#M IRCM PRCM ETCM EPCM ESCM ROCM DRCM SWXM NI#M NICM NFXM NUCM
+    NLCM NIAM NMINC CNAM GNAM N2OEM PI#M PICM PUPC SPAM KI#M KICM KUPC SKAM RECM
+    ONTAM ONAM OPTAM OPAM OCTAM OCAM CO2EM DMPPM DMPEM DMPTM DMPIM YPPM YPEM
+    YPTM YPIM DPNAM DPNUM YPNAM YPNUM NDCH TMAXA TMINA SRADA DAYLA CO2A PRCP
+    ETCP ESCP EPCP
+""".split()
+SUMMARY_TEXT_COLUMNS = ["FNAM", "WSTA", "SOIL_ID"]
+SUMMARY_DATE_COLUMNS = ["SDAT", "PDAT", "EDAT", "ADAT", "MDAT", "HDAT"]
+
+# Leading Summary.OUT columns. The treatment name (TNAM) is 25 characters
+# wide and may hold spaces, so it cannot be split on whitespace.
+_SUMMARY_ROW = re.compile(
+    r"\s*(?P<RUNNO>\d+)\s+(?P<TRNO>\d+)\s+\d+\s+\d+\s+\d+\s+(?P<CR>\S+)"
+    r"\s+(?P<MODEL>\S+)\s+(?P<EXNAME>\S+) (?P<TNAM>.{25})(?P<rest>.*)"
+)
+
+
+def _summary_value(column, value):
+    if column in SUMMARY_TEXT_COLUMNS:
+        return value
+    try:
+        value = int(value)
+    except ValueError:
+        try:
+            value = float(value)
+        except ValueError:
+            return None  # Field overflowed, DSSAT writes it as *****
+    if value == -99:
+        return None  # DSSAT missing value, -99 or -99.0
+    if column in SUMMARY_DATE_COLUMNS:
+        return datetime.datetime.strptime(str(value), "%Y%j").date()
+    return value
+
+
+class SeasonSummary(NamedTuple):
+    """End of season values of a run, read from its Summary.OUT row.
+
+    Values DSSAT reports as missing (-99) or could not fit in their field
+    (*****) are None. Every column of the row is kept in values, keyed by its
+    DSSAT name (e.g. "HWAM").
+    """
+
+    run: int  # RUNNO
+    treatment: int  # TRNO
+    crop: str  # CR
+    model: str  # MODEL
+    experiment_name: str  # EXNAME
+    treatment_name: str  # TNAM
+    weather_station: str  # WSTA
+    soil_id: str  # SOIL_ID
+    simulation_start: datetime.date  # SDAT
+    planting_date: datetime.date  # PDAT
+    emergence_date: datetime.date  # EDAT
+    anthesis_date: datetime.date  # ADAT
+    maturity_date: datetime.date  # MDAT
+    harvest_date: datetime.date  # HDAT
+    tops_weight: float  # CWAM, kg/ha
+    yield_weight: float  # HWAM, kg/ha
+    harvest_index: float  # HIAM
+    max_LAI: float  # LAIX
+    season_precipitation: float  # PRCM, mm
+    season_ET: float  # ETCM, mm
+    season_irrigation: float  # IRCM, mm
+    values: dict
+
+    @classmethod
+    def from_row(cls, row):
+        """Build the summary from a Summary.OUT data row."""
+        match = _SUMMARY_ROW.match(row)
+        if match is None:
+            raise ValueError(f"Could not read Summary.OUT row: {row!r}")
+        values = {
+            "RUNNO": int(match["RUNNO"]),
+            "TRNO": int(match["TRNO"]),
+            "CR": match["CR"],
+            "MODEL": match["MODEL"],
+            "EXNAME": match["EXNAME"],
+            "TNAM": match["TNAM"].strip(),
+        }
+        # Match the remaining columns from the right, as the field name
+        # (FNAM) is left blank for short experiment IDs
+        fields = match["rest"].split()
+        columns = SUMMARY_COLUMNS[len(SUMMARY_COLUMNS) - len(fields) :]
+        for column, value in zip(columns, fields):
+            values[column] = _summary_value(column, value)
+        return cls(
+            run=values["RUNNO"],
+            treatment=values["TRNO"],
+            crop=values["CR"],
+            model=values["MODEL"],
+            experiment_name=values["EXNAME"],
+            treatment_name=values["TNAM"],
+            weather_station=values.get("WSTA"),
+            soil_id=values.get("SOIL_ID"),
+            simulation_start=values.get("SDAT"),
+            planting_date=values.get("PDAT"),
+            emergence_date=values.get("EDAT"),
+            anthesis_date=values.get("ADAT"),
+            maturity_date=values.get("MDAT"),
+            harvest_date=values.get("HDAT"),
+            tops_weight=values.get("CWAM"),
+            yield_weight=values.get("HWAM"),
+            harvest_index=values.get("HIAM"),
+            max_LAI=values.get("LAIX"),
+            season_precipitation=values.get("PRCM"),
+            season_ET=values.get("ETCM"),
+            season_irrigation=values.get("IRCM"),
+            values=values,
+        )
+
+
 class Results:
     """Class to read in and format DSSAT results from fifos.
 
+    Output tables are parsed from the raw bytes of their fifo the first time
+    they are accessed, e.g. Results.PlantGro, and kept from then on. Call
+    release to free the raw bytes once the tables needed have been read.
+    Results.Summary is the SeasonSummary of the last row of Summary.OUT.
+
     Parameters
     ----------
-    output_fifos
-        Location of output fifos that DSSAT will write to.
-    crop : str
-        E.g. 'wheat', 'maize'
+    experiment : dabbler.Experiment
+        Experiment the results are for.
+    in_out_location : pathlib.Path
+        DSSAT I/O directory the run was made in.
+    outputs : dict
+        Raw bytes read from each output fifo keyed by output file name.
+    usecols : dict, optional
+        Columns to keep from each output table, keyed by output file name.
     """
 
     # Outfile layouts by crop. Number is rows to skip.
@@ -362,74 +1175,236 @@ class Results:
         }
     }
 
-    def __init__(self, output_fifos, experiment, in_out_location):
-        self.output_fifos = output_fifos
+    # Output files whose rows are labelled with their run number in the first
+    # column. Other tables write one header block per run.
+    run_column_files = ["Evaluate.OUT", "Summary.OUT"]
+
+    def __init__(self, experiment, in_out_location, outputs, usecols=None):
         self.experiment = experiment
         self.in_out_location = in_out_location
         self.crop = self.experiment.crop.lower()
-        self.read_threads = self.start_read_threads()
-
-    def start_read_threads(self):
-        read_threads = {}
-        for fifo_name in self.output_fifos:
-            read_threads[fifo_name] = ThreadWithReturnValueAndException(
-                target=self._load_table,
-                args=(
-                    self.output_fifos[fifo_name],
-                    self.file_layouts[self.crop][fifo_name],
-                ),
-                daemon=True,
+        self.outputs = outputs
+        self.usecols = usecols or {}
+        self.metrics = None  # dabbler.metrics.RunMetrics of the run
+        # SimulationFailedError of a run of a batch launch that failed
+        self.error = None
+        self._released = False
+
+    def __getattr__(self, name):
+        # Only called for attributes not set yet, i.e. tables not yet parsed
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self.__dict__.get("error") is not None:
+            raise self.error
+        fifo_name = f"{name}.OUT"
+        if fifo_name in self.__dict__.get("outputs", {}):
+            value = self.parse_output(fifo_name, self.outputs[fifo_name])
+        elif name == "GrowthTable" and "overview" in self.__dict__:
+            if self.__dict__.get("_released") and "PlantGro" not in self.__dict__:
+                # Its stage dates come from PlantGro, which was dropped
+                raise AttributeError(
+                    f"{name} was not read before the results were released"
+                )
+            value = self._build_growth_table(self.overview)
+        elif self.__dict__.get("_released"):
+            raise AttributeError(
+                f"{name} was not read before the results were released"
+            )
+        else:
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no attribute {name!r}"
             )
-            read_threads[fifo_name].start()
-        return read_threads
-
-    def read_outputs(self):
-        results = self.get_results_from_read_threads(self.read_threads)
-        # Set results tables as attributes of object
-        for result in results:
-            setattr(self, result.split(".")[0], results[result])
+        setattr(self, name, value)
+        return value
+
+    def release(self):
+        """Free the raw output bytes. Tables not yet accessed are dropped."""
+        self.outputs = {}
+        self._released = True
+
+    def read_outputs(self, overview=None, tables=None):
+        """Check the outputs and read the overview.
+
+        Tables are not parsed until they are accessed.
+
+        Parameters
+        ----------
+        overview : str, optional
+            Overview text for this run. Read from OVERVIEW.OUT if not passed.
+        tables : dict, optional
+            Tables already parsed, e.g. by a dabbler.cache.ResultCache, keyed
+            by output file name.
+        """
+        for fifo_name, output in self.outputs.items():
+            if self.file_layouts[self.crop][fifo_name] is None:
+                continue
+            if not output.strip():
+                fifo_loc = self.in_out_location / fifo_name
+                logging.info(f"Result file {fifo_loc} empty.")
+                raise SimulationFailedError(f"Result file {fifo_loc} empty.")
+        # Set already parsed tables as attributes of object
+        for fifo_name, table in (tables or {}).items():
+            setattr(self, fifo_name.split(".")[0], table)
         # read Overview file
-        self._set_overview(self.in_out_location / "OVERVIEW.OUT")
+        if overview is None:
+            overview = self.read_overview_file(self.in_out_location / "OVERVIEW.OUT")
+        self._set_overview(overview)
 
-    def get_results_from_read_threads(self, read_threads):
-        results = {}
-        for fifo_name in sorted(read_threads):
-            results[fifo_name] = read_threads[fifo_name].join_with_exception()
-        return results
+    @classmethod
+    def split_runs(cls, outputs, num_runs):
+        """Split the outputs of a batch launch into the outputs of each run.
+
+        Each run's output keeps the lines ahead of the first run's column
+        header, so it can be parsed with the same file layouts as a single
+        run.
 
-    def _load_table(self, fifo_loc, skiprows=0, index="DOY", numrows=None):
+        Parameters
+        ----------
+        outputs : dict
+            Raw bytes read from each output fifo keyed by output file name.
+        num_runs : int
 
+        Returns
+        -------
+        list of dict
+            Raw bytes for each output keyed by output file name, one dict per
+            run in run order.
+        """
+        run_outputs = [{} for _ in range(num_runs)]
+        for fifo_name, output in outputs.items():
+            lines = output.splitlines(keepends=True)
+            headers = [i for i, line in enumerate(lines) if line.startswith(b"@")]
+            if fifo_name in cls.run_column_files:
+                # Keep the lines up to the first column header, if any, then
+                # gather the data rows that follow by their run number
+                start = headers[0] + 1 if headers else 0
+                preamble = b"".join(lines[:start])
+                runs = [[] for _ in range(num_runs)]
+                for line in lines[start:]:
+                    fields = line.split()
+                    if fields and fields[0].isdigit():
+                        run = int(fields[0])
+                        if 0 < run <= num_runs:
+                            runs[run - 1].append(line)
+                for run_output, run in zip(run_outputs, runs):
+                    run_output[fifo_name] = preamble + b"".join(run)
+                continue
+            if not headers:
+                for run_output in run_outputs:
+                    run_output[fifo_name] = b""
+                continue
+            preamble = b"".join(lines[: headers[0]])
+            # Each block is a column header followed by its data rows, keyed by
+            # the run header written ahead of it. The first run's header may
+            # be missing, as may any run's block if that run failed.
+            blocks = {}
+            run, block = 1, None
+            for line in lines:
+                if line.startswith(b"*RUN"):
+                    match = _RUN_HEADER.match(line.decode(errors="replace"))
+                    if match:
+                        run, block = int(match.group(1)), None
+                elif line.startswith(b"@"):
+                    if block is not None:
+                        run += 1  # No run header between blocks
+                    block = blocks[run] = [line]
+                elif block is not None and line.strip():
+                    if line[:1] not in (b"*", b"!"):
+                        block.append(line)
+
+            missing = [run for run in range(1, num_runs + 1) if run not in blocks]
+            if missing:
+                logging.warning(f"{fifo_name} holds no output for runs {missing}.")
+
+            for run, run_output in enumerate(run_outputs, 1):
+                block = blocks.get(run)
+                run_output[fifo_name] = preamble + b"".join(block) if block else b""
+        return run_outputs
+
+    @staticmethod
+    def split_overview(overview, num_runs):
+        """Split the overview of a batch launch into the overview of each run.
+
+        Each run's overview keeps the lines ahead of the first run section.
+        Sections are matched to runs by their *RUN number, so a run with no
+        section gets an empty overview.
+        """
+        if not overview:
+            return [""] * num_runs
+        sections = overview.split("\n*RUN ")
+        preamble = sections[0] + "\n"
+        run_sections = {}
+        for section in sections[1:]:
+            match = _RUN_HEADER.match("*RUN " + section)
+            run = int(match.group(1)) if match else None
+            run_sections.setdefault(run, []).append("*RUN " + section)
+        return [
+            preamble + "\n".join(run_sections[run]) if run in run_sections else ""
+            for run in range(1, num_runs + 1)
+        ]
+
+    @staticmethod
+    def read_overview_file(overview_loc):
+        """Read and remove the overview file. Returns an empty string if missing."""
         try:
-            with open(fifo_loc, "r") as fifo:
-                r, w, e = select.select([fifo], [], [fifo], 3)  # timeout 3 seconds
-                if not (r or w or e):
-                    raise SimulationFailedError(f"Timeout on file {fifo_loc}.")
-                out_string = fifo.read()
+            with open(overview_loc, "rb") as f:
+                overview = f.read().decode("unicode_escape")
         except FileNotFoundError:
-            return None
+            return ""  # No overview file generated
+        # Remove file otherwise DSSAT will stack results
+        overview_loc.unlink()
+        return overview
+
+    def parse_output(self, fifo_name, output):
+        """Parse a single output table from the raw bytes read from its fifo."""
+        start = time.perf_counter()
+        if fifo_name == "Summary.OUT":
+            table = self._parse_summary(output.decode(errors="replace"))
+        else:
+            table = self._parse_table(
+                output.decode(errors="replace"),
+                self.in_out_location / fifo_name,
+                self.file_layouts[self.crop][fifo_name],
+                usecols=self.usecols.get(fifo_name),
+            )
+        elapsed = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.add("parse", elapsed)
+            # Tables parsed after the run was recorded go straight to the
+            # registry it was recorded in
+            if self.metrics.registry is not None:
+                self.metrics.registry.observe("parse", elapsed)
+        return table
 
-        # Skip must be after read so that DSSAT can write to fifo
+    def _parse_table(
+        self, out_string, fifo_loc, skiprows=0, numrows=None, usecols=None
+    ):
+        # Output is read and trashed for files with no layout
         if skiprows is None:
             return None
 
-        try:
-            table = pd.read_csv(
-                StringIO(out_string),
-                sep="\s+",
-                skiprows=skiprows,  # noqa
-                nrows=numrows,
-            )
-        except pd.errors.EmptyDataError:
+        table = output_parser.read_table(out_string, skiprows, usecols)
+        if table is None:
             logging.info(f"Result file {fifo_loc} empty.")
             raise SimulationFailedError(f"Result file {fifo_loc} empty.")
-
-        if "DOY" in table.columns:
-            DOY_leading_zeroes = table["DOY"].apply("{:0>3}".format)
-            year_day = (table["@YEAR"].astype(str) + DOY_leading_zeroes).astype(int)
-            table.index = year_day
+        if numrows is not None:
+            table = table.iloc[:numrows]
 
         return table
 
+    def _parse_summary(self, out_string):
+        # Summary.OUT holds one row per season, after any header and comments.
+        # A run of one experiment has one season; should DSSAT write several
+        # (e.g. forecast years) only the last is kept.
+        rows = [
+            SeasonSummary.from_row(line)
+            for line in out_string.splitlines()
+            if line.strip() and line[:1] not in ("*", "!", "@")
+        ]
+        if not rows:
+            return None
+        return rows[-1]
+
     def _load_INFO(self, info_loc):
         # Load INFO.OUT file special case
         # TODO: lift other information from this file as needed
@@ -452,17 +1427,15 @@ class Results:
         table.index = [int(x) for x in table.index.levels[0][:-1]]
         self.SoilInfo = table
 
-    def _set_overview(self, overview_loc):
-        try:
-            with open(overview_loc, "rb") as f:
-                overview = f.read().decode("unicode_escape")
-        except FileNotFoundError:
+    def _set_overview(self, overview):
+        if not overview:
             return  # No overview file generated
         self.overview = overview
-        with open(overview_loc, "rb") as f:
-            crop_info = f.readlines()[11].decode("unicode_escape")
+        crop_info = overview.split("\n")[11] + "\n"
         self.crop_info = crop_info
 
+    def _build_growth_table(self, overview):
+        # Growth stages from the overview, with their dates from PlantGro
         overview_sections = overview.split("*")
         for x in overview_sections:
             if "SIMULATED CROP AND SOIL STATUS AT MAIN DEVELOPMENT STAGES" in x:
@@ -485,9 +1458,13 @@ class Results:
                 )
                 growth_stage_table["Start"] = None
                 growth_stage_table["End"] = None
+                # Stage dates come from PlantGro, which may not have been read
+                plant_gro = getattr(self, "PlantGro", None)
                 for index, row in growth_stage_table.iterrows():
+                    if plant_gro is None or "GSTD" not in plant_gro.columns:
+                        break
                     try:
-                        gstd = self.PlantGro[self.PlantGro["GSTD"] == row["GSTD_code"]]
+                        gstd = plant_gro[plant_gro["GSTD"] == row["GSTD_code"]]
                         start = gstd.index[0]
                         end = gstd.index[-1]
                     except IndexError:  # No row with this stage
@@ -495,55 +1472,9 @@ class Results:
                     growth_stage_table.loc[index, "Start"] = start
                     growth_stage_table.loc[index, "End"] = end
                 growth_stage_table.index = growth_stage_table["GSTD_code"]
-                self.GrowthTable = growth_stage_table
-
-        # Remove file at the end otherwise DSSAT will stack results
-        overview_loc.unlink()
+                return growth_stage_table
+        return None
 
     def __str__(self):
         return self.overview
 
-
-class ThreadWithReturnValueAndException(Thread):
-    """Used to return value from a thread.
-    See: https://stackoverflow.com/questions/6893968"""
-
-    def __init__(
-        self,
-        group=None,
-        target=None,
-        name=None,
-        daemon=None,
-        args=(),
-        kwargs={},
-        Verbose=None,
-    ):
-        Thread.__init__(self, group, target, name, args, kwargs, daemon=daemon)
-        self._return = None
-        self.__status_queue = queue.Queue()
-
-    def run_with_exception(self):
-        if self._target is not None:
-            self._return = self._target(*self._args, **self._kwargs)
-
-    def join(self, timeout=None):
-        Thread.join(self, timeout)
-        return self._return
-
-    def run(self):
-        """This method should NOT be overriden."""
-        try:
-            self.run_with_exception()
-        except BaseException:
-            self.__status_queue.put(sys.exc_info())
-        self.__status_queue.put(None)
-
-    def wait_for_exc_info(self):
-        return self.__status_queue.get()
-
-    def join_with_exception(self):
-        ex_info = self.wait_for_exc_info()
-        if ex_info is None:
-            return self.join()
-        else:
-            raise ex_info[1]
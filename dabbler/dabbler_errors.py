@@ -9,5 +9,22 @@ class NoWeatherInformationError(Exception):
 
 
 class SimulationFailedError(Exception):
-    def __init__(self, message):
+    """A DSSAT run failed.
+
+    Parameters
+    ----------
+    message : str
+    returncode : int, optional
+        Exit code of DSSAT, if it exited with an error.
+    logs : dict, optional
+        Contents of ERROR.OUT and WARNING.OUT from the run, keyed by file name.
+    """
+
+    def __init__(self, message, returncode=None, logs=None):
         super().__init__(message)
+        self.returncode = returncode
+        self.logs = logs or {}
+
+    def __reduce__(self):
+        # Keep returncode and logs when raised in a pool worker
+        return type(self), (self.args[0], self.returncode, self.logs)
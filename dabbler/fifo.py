@@ -0,0 +1,248 @@
+"""
+Non-blocking readers for the FIFOs DSSAT writes its output files to.
+"""
+import os
+import time
+import selectors
+import subprocess
+
+READ_SIZE = 65536
+# Seconds a DSSAT run may take by default, far longer than any season needs
+DEFAULT_TIMEOUT = 300
+
+
+class FifoReader:
+    """Collects everything written to a DSSAT output FIFO during a run.
+
+    The FIFO is opened read-write and non-blocking. Holding a write end
+    ourselves means the open never blocks waiting for DSSAT, and the reader
+    never sees EOF when DSSAT closes and re-opens the file between seasons,
+    so it never spins on a hung-up descriptor. The run is over when the
+    DSSAT process exits, after which the reader is drained and closed.
+
+    NOTE: opening a FIFO O_RDWR is Linux behaviour, as is the rest of the
+    FIFO interface to the modified DSSAT.
+
+    Parameters
+    ----------
+    fifo_loc : pathlib.Path
+        Location of the output FIFO.
+    """
+
+    def __init__(self, fifo_loc):
+        self.fifo_loc = fifo_loc
+        self.chunks = []
+        self.fd = os.open(fifo_loc, os.O_RDWR | os.O_NONBLOCK)
+
+    def fileno(self):
+        return self.fd
+
+    def read_available(self):
+        """Read whatever is currently buffered in the FIFO."""
+        while True:
+            try:
+                chunk = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return
+            if not chunk:
+                return
+            self.chunks.append(chunk)
+
+    def close(self):
+        """Drain anything left in the FIFO and close it."""
+        if self.fd is None:
+            return
+        self.read_available()
+        os.close(self.fd)
+        self.fd = None
+
+    def getvalue(self):
+        """Return everything read from the FIFO as bytes."""
+        return b"".join(self.chunks)
+
+
+def reap(proc, block=True):
+    """Reap a subprocess.Popen with os.wait4, setting its returncode.
+
+    Returns
+    -------
+    resource.struct_rusage or None
+        Resource usage of the process. None if it is still running, when not
+        blocking, or was already reaped.
+    """
+    if proc.returncode is not None:
+        return None
+    try:
+        pid, status, rusage = os.wait4(proc.pid, 0 if block else os.WNOHANG)
+    except ChildProcessError:
+        proc.poll()  # Reaped elsewhere, let Popen settle the returncode
+        return None
+    if pid == 0:
+        return None  # Still running
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return rusage
+
+
+def peak_rss(pid):
+    """Return the peak resident set size of a running child, in bytes.
+
+    Read from VmHWM in /proc/<pid>/status. Unlike the ru_maxrss reported by
+    os.wait4 this is the program's own memory, not including what the child
+    held of ours from before it exec'd.
+
+    Returns
+    -------
+    int or None
+        None if the process has exited, or not yet exec'd, i.e. still has
+        our command line.
+    """
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read()
+        with open(f"/proc/{pid}/status") as f:
+            status = dict(line.split(":", 1) for line in f)
+        with open("/proc/self/cmdline", "rb") as f:
+            exec_pending = f.read() == cmdline
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+    if exec_pending or "VmHWM" not in status:
+        return None
+    return int(status["VmHWM"].split()[0]) * 1024  # Reported in kB
+
+
+class FifoMultiplexer:
+    """Drains every output FIFO of a run from a single selector.
+
+    One multiplexer is kept for the lifetime of a DSSAT instance and reused
+    for each run, in place of a read thread per FIFO.
+
+    Where the platform has pidfds (Linux 5.3+) the DSSAT process itself is
+    watched by the selector too, so the wait ends the moment it exits
+    rather than at the next poll.
+
+    While waiting, DSSAT's peak memory is sampled every poll_interval, as it
+    can no longer be read once the process has exited.
+
+    Parameters
+    ----------
+    poll_interval : float
+        Seconds between checks on whether the DSSAT process has exited, when
+        it cannot be watched through a pidfd, and between memory samples.
+    """
+
+    def __init__(self, poll_interval=0.05):
+        self.poll_interval = poll_interval
+        self.selector = selectors.DefaultSelector()
+        self.readers = {}
+        self.read_seconds = 0.0  # Time spent reading during the last wait
+        self.max_rss = None  # Peak memory of the last process waited on
+
+    def open(self, out_fifos):
+        """Open and register the passed output FIFOs ahead of a run.
+
+        Parameters
+        ----------
+        out_fifos : dict
+            FIFO locations keyed by output file name.
+        """
+        for fifo_name, fifo_loc in out_fifos.items():
+            reader = FifoReader(fifo_loc)
+            self.selector.register(reader, selectors.EVENT_READ)
+            self.readers[fifo_name] = reader
+
+    def wait(self, proc, timeout=None):
+        """Read from the open FIFOs until the passed process exits.
+
+        The process is reaped before returning, so proc.returncode is set.
+
+        Parameters
+        ----------
+        proc : subprocess.Popen
+        timeout : float, optional
+            Seconds to wait before the process is killed, reaped and
+            subprocess.TimeoutExpired raised. Waits forever if None.
+
+        Returns
+        -------
+        resource.struct_rusage or None
+            Resource usage of the process, None if it was reaped elsewhere.
+        """
+        self.read_seconds = 0.0
+        self.max_rss = None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        next_sample = 0.0
+        pidfd = self._open_pidfd(proc)
+        if pidfd is None:
+            while True:
+                self._sample_rss(proc.pid)
+                rusage = reap(proc, block=False)
+                if proc.returncode is not None:
+                    return rusage
+                self._check_deadline(proc, deadline, timeout)
+                for key, _ in self.selector.select(self._select_timeout(deadline)):
+                    self._read(key.fileobj)
+
+        self.selector.register(pidfd, selectors.EVENT_READ)
+        try:
+            exited = False
+            while not exited:
+                self._check_deadline(proc, deadline, timeout)
+                if time.monotonic() >= next_sample:
+                    self._sample_rss(proc.pid)
+                    next_sample = time.monotonic() + self.poll_interval
+                for key, _ in self.selector.select(self._select_timeout(deadline)):
+                    if key.fileobj == pidfd:
+                        exited = True
+                    else:
+                        self._read(key.fileobj)
+        finally:
+            self.selector.unregister(pidfd)
+            os.close(pidfd)
+        return reap(proc)
+
+    def _select_timeout(self, deadline):
+        if deadline is None:
+            return self.poll_interval
+        return max(0.0, min(self.poll_interval, deadline - time.monotonic()))
+
+    def _check_deadline(self, proc, deadline, timeout):
+        if deadline is None or time.monotonic() < deadline:
+            return
+        proc.kill()
+        reap(proc)
+        raise subprocess.TimeoutExpired(proc.args, timeout)
+
+    def _sample_rss(self, pid):
+        rss = peak_rss(pid)
+        if rss is not None:
+            self.max_rss = max(self.max_rss or 0, rss)
+
+    def _read(self, reader):
+        start = time.perf_counter()
+        reader.read_available()
+        self.read_seconds += time.perf_counter() - start
+
+    def _open_pidfd(self, proc):
+        if not hasattr(os, "pidfd_open"):
+            return None
+        try:
+            return os.pidfd_open(proc.pid)
+        except OSError:
+            # Already exited and reaped, or pidfds not supported by the kernel
+            return None
+
+    def close(self):
+        """Drain and close the FIFOs of the current run.
+
+        Returns
+        -------
+        dict
+            Bytes read from each FIFO keyed by output file name.
+        """
+        outputs = {}
+        for fifo_name, reader in self.readers.items():
+            self.selector.unregister(reader)
+            reader.close()
+            outputs[fifo_name] = reader.getvalue()
+        self.readers = {}
+        return outputs
@@ -3,15 +3,62 @@ file_generator.py
 
 Generates formatted DSSAT input files.
 """
+import hashlib
+import functools
 import warnings
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from typing import NamedTuple
 from .headers import get_header
 from . import dabbler_errors
 from . import templates
+from . import wth
 from . import dabbler
 
+# Switches in the experiment file OUTPUTS line that turn on DSSAT's daily
+# output files, and the value they are written with by default.
+#   GROUT - growth (PlantGro, PlantN, Weather, SoilTemp)
+#   WAOUT - water (ET, Mulch, SoilWat, SoilWatBal)
+#   NIOUT - nitrogen (PlantN)
+OUTPUT_OPTIONS = {"GROUT": "Y", "WAOUT": "Y", "NIOUT": "Y"}
+
+# Generated weather file strings kept for reuse by later runs
+WEATHER_CACHE_SIZE = 128
+
+# Days in the year ahead of the first of each month, for non leap years
+_DAYS_BEFORE_MONTH = [0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+
+
+def format_date(date):
+    """Format a date as DSSAT's YYDDD, same as date.strftime("%y%j")."""
+    year = date.year
+    day_of_year = _DAYS_BEFORE_MONTH[date.month] + date.day
+    if date.month > 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        day_of_year += 1
+    return f"{year % 100:02d}{day_of_year:03d}"
+
+
+def format_dates(dates):
+    """Format an array of dates as DSSAT's YYDDD, see format_date.
+
+    Parameters
+    ----------
+    dates : array-like of datetime.date, numpy.datetime64 or pandas.Timestamp
+
+    Returns
+    -------
+    list of str
+    """
+    days = pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]")
+    years = days.astype("datetime64[Y]")
+    day_of_year = (days - years).astype(np.int64) + 1
+    codes = (years.astype(np.int64) + 1970) % 100 * 1000 + day_of_year
+    # Sweeps repeat the same few dates, format each once
+    unique_codes, inverse = np.unique(codes, return_inverse=True)
+    strings = np.array([f"{code:05d}" for code in unique_codes.tolist()])
+    return strings[inverse].tolist()
+
 
 def gen_weather_name(ASD, county, year, gen_names):
     # Generate a weather file name
@@ -30,12 +77,15 @@ def gen_weather_name(ASD, county, year, gen_names):
     return weather_name
 
 
-def generate_experiment_file_string(experiment):
+def generate_experiment_file_string(experiment, output_options=None):
     """Generate the experiment file from the MZIXM template.MZX
 
     Parameters
     ----------
     experiment : dabbler.Experiment
+    output_options : dict, optional
+        "Y" or "N" for any of the OUTPUT_OPTIONS switches, overriding their
+        defaults.
 
     Returns
     -------
@@ -46,33 +96,37 @@ def generate_experiment_file_string(experiment):
         raise ValueError("Experiment weather station code not set.")
     if experiment.soil_code is None:
         raise ValueError("Experiment soil code not set.")
-    if experiment.irrigation is not "N":
+    if experiment.irrigation != "N":
         check_valid_irrigation_setup(experiment)
 
-    # Read in the experiment template file
-    template = templates.get_template_for_crop(experiment.crop)
+    template = templates.get_compiled_template_for_crop(experiment.crop)
 
+    plant_date = format_date(experiment.plant_date)
+    harvest_date = format_date(experiment.harvest_date)
     terms = {
         "FLD_ID": experiment.experiment_ID[3:],
         "ID": experiment.experiment_ID,
         "MDL": experiment.model,
         "CULT": experiment.cultivar,
-        "SDT": experiment.simulation_start.strftime("%y%j"),
+        "SDT": format_date(experiment.simulation_start),
         "SOIL_IDN": experiment.soil_code,
-        "PLF": experiment.plant_date.strftime("%y%j"),
-        "PLL": experiment.plant_date.strftime("%y%j")
+        "PLF": plant_date,
+        "PLL": plant_date
         if experiment.plant_end is None
-        else experiment.plant_end.strftime("%y%j"),
-        "HVF": experiment.harvest_date.strftime("%y%j"),
-        "HVL": experiment.harvest_date.strftime("%y%j")
+        else format_date(experiment.plant_end),
+        "HVF": harvest_date,
+        "HVL": harvest_date
         if experiment.harvest_end is None
-        else experiment.harvest_end.strftime("%y%j"),
-        "HDT": experiment.harvest_date.strftime("%y%j"),
+        else format_date(experiment.harvest_end),
+        "HDT": harvest_date,
         "WST": experiment.weather_station_code,
         "LOC": experiment.experiment_location_name,
     }
 
     terms = format_irrigation_terms(terms, experiment)
+    terms.update(OUTPUT_OPTIONS)
+    if output_options is not None:
+        terms.update(output_options)
 
     if experiment.forecast_from_date is not None:
         terms["FODAT"] = experiment.forecast_from_date
@@ -81,11 +135,116 @@ def generate_experiment_file_string(experiment):
             raise ValueError("Must specify Experiment.num_forecast_years.")
         terms["NYR"] = "{0: >5}".format(str(experiment.num_forecast_years))
 
-    experiment_file_string = template.format(**terms)
+    experiment_file_string = template.render(terms)
 
     return experiment_file_string
 
 
+def generate_experiment_file_strings(parameters, output_options=None):
+    """Generate experiment files for many experiments at once.
+
+    Dates are formatted a column at a time and every file is rendered from
+    the crop's compiled template, so thousands of files take milliseconds.
+
+    Parameters
+    ----------
+    parameters : pandas.DataFrame or dict of sequences
+        One row per experiment, with columns named after the dabbler.Experiment
+        fields. Fields with defaults may be left out. All rows must be of
+        the same crop.
+    output_options : dict, optional
+        See generate_experiment_file_string.
+
+    Returns
+    -------
+    list of str
+        Formatted experiment file strings, in row order.
+    """
+    names = list(parameters)
+    count = len(parameters[names[0]]) if names else 0
+    if count == 0:
+        return []
+    defaults = dabbler.Experiment._field_defaults
+
+    def column(field):
+        if field in parameters:
+            return list(parameters[field])
+        return [defaults[field]] * count
+
+    def is_missing(values):
+        # None, or NaN / NaT in columns read from a DataFrame
+        return pd.isna(pd.Series(values, dtype=object)).to_numpy()
+
+    def dates_or(field, fallback):
+        # Fields such as plant_end default to another date when not set
+        values = column(field)
+        missing = is_missing(values)
+        if missing.all():
+            return fallback
+        return [fallback[i] if missing[i] else value for i, value in enumerate(values)]
+
+    for field in ("weather_station_code", "soil_code"):
+        if is_missing(column(field)).any():
+            raise ValueError(f"Experiment {field.replace('_', ' ')} not set.")
+    crops = {crop.lower() for crop in column("crop")}
+    if len(crops) > 1:
+        raise ValueError(f"Experiments must all be of one crop, got {crops}.")
+
+    template = templates.get_compiled_template_for_crop(crops.pop())
+
+    plant_dates = column("plant_date")
+    harvest_dates = column("harvest_date")
+    harvest_codes = format_dates(harvest_dates)
+    experiment_ids = column("experiment_ID")
+    terms = {
+        "FLD_ID": [experiment_id[3:] for experiment_id in experiment_ids],
+        "ID": experiment_ids,
+        "MDL": column("model"),
+        "CULT": column("cultivar"),
+        "SDT": format_dates(column("simulation_start")),
+        "SOIL_IDN": column("soil_code"),
+        "PLF": format_dates(plant_dates),
+        "PLL": format_dates(dates_or("plant_end", plant_dates)),
+        "HVF": harvest_codes,
+        "HVL": format_dates(dates_or("harvest_end", harvest_dates)),
+        "HDT": harvest_codes,
+        "WST": column("weather_station_code"),
+        "LOC": column("experiment_location_name"),
+    }
+
+    irrigation_terms = []
+    formatted = {}  # Terms of each distinct irrigation setup
+    for row in zip(column("irrigation"), column("irrigation_management")):
+        if row not in formatted:
+            row_fields = _IrrigationRow(*row)
+            if row_fields.irrigation != "N":
+                check_valid_irrigation_setup(row_fields)
+            formatted[row] = format_irrigation_terms({}, row_fields)
+        irrigation_terms.append(formatted[row])
+    for term in irrigation_terms[0]:
+        terms[term] = [row[term] for row in irrigation_terms]
+
+    terms.update(OUTPUT_OPTIONS)
+    if output_options is not None:
+        terms.update(output_options)
+
+    forecast_from_date = column("forecast_from_date")
+    if not is_missing(forecast_from_date).all():
+        num_forecast_years = column("num_forecast_years")
+        if is_missing(num_forecast_years).any():
+            raise ValueError("Must specify Experiment.num_forecast_years.")
+        terms["FODAT"] = forecast_from_date
+        terms["NYR"] = ["{0: >5}".format(str(value)) for value in num_forecast_years]
+
+    return template.render_many(terms, count)
+
+
+class _IrrigationRow(NamedTuple):
+    # The dabbler.Experiment fields the irrigation helpers read
+    irrigation: str
+    irrigation_management: object
+
+
 def format_irrigation_terms(terms, experiment):
     terms["IRIG"] = experiment.irrigation
     management = experiment.irrigation_management
@@ -113,6 +272,14 @@ def check_valid_irrigation_setup(experiment):
             )
 
 
+def check_weather_information(experiment):
+    if experiment.weather_data is None and experiment.weather_station_code is None:
+        raise dabbler_errors.NoWeatherInformationError(
+            "No weather information set. You must either set Experiment.weather_data"
+            " or Experiment.weather_station_code."
+        )
+
+
 def generate_weather_file_string(experiment):
     """Generate a DSSAT weather file string from an experiment.
 
@@ -127,62 +294,66 @@ def generate_weather_file_string(experiment):
     str
         Absolute path to newly generated file.
     """
+    check_weather_information(experiment)
 
-    if experiment.weather_data is None and experiment.weather_station_code is None:
-        raise dabbler_errors.NoWeatherInformationError(
-            "No weather information set. You must either set Experiment.weather_data"
-            " or Experiment.weather_station_code."
-        )
-
-    # Check for any missing weather columns and fill them with NaN
-    weather_columns = [
-        "@DATE",
-        "SRAD",
-        "TMAX",
-        "TMIN",
-        "RAIN",
-        "DEWP",
-        "WIND",
-        "PAR",
-        "EVAP",
-        "RHUM",
-    ]
+    header_data = collate_weather_header_information(experiment)
 
-    weather_data = experiment.weather_data.round(1)
+    return wth.encode_weather(header_data, experiment.weather_data)
 
-    # Make wind data a whole int
-    if "WIND" in weather_data.columns:
-        weather_data["WIND"] = weather_data["WIND"].astype(int)
 
-    weather_data = fill_missing_columns_with_nan(weather_data, weather_columns)
+def weather_file_key(experiment):
+    """Return a key identifying the weather file of an experiment.
 
+    Experiments with equal keys generate the same weather file string, so
+    the string can be reused rather than regenerated. The weather data is
+    hashed by content, which is far cheaper than formatting it.
+    """
+    check_weather_information(experiment)
+    weather_data = experiment.weather_data
+    digest = hashlib.blake2b(
+        pd.util.hash_pandas_object(weather_data, index=False).to_numpy().tobytes(),
+        digest_size=16,
+    )
+    digest.update(repr(list(weather_data.columns)).encode())
     header_data = collate_weather_header_information(experiment)
+    return digest.digest(), tuple(sorted(header_data.items()))
 
-    header_string = build_header("weather", header_data)
 
-    dataframe_string = format_weather_dataframe_for_DSSAT(weather_data, weather_columns)
+class _WeatherKey:
+    # An experiment hashed and compared by its weather_file_key, so the
+    # weather file strings can be kept by functools.lru_cache
+    def __init__(self, experiment):
+        self.experiment = experiment
+        self.key = weather_file_key(experiment)
 
-    full_string = header_string + "\n" + dataframe_string
+    def __hash__(self):
+        return hash(self.key)
 
-    return full_string
+    def __eq__(self, other):
+        return self.key == other.key
 
 
-def format_weather_dataframe_for_DSSAT(dataframe, columns):
-    # Set proper format justifications for columns
-    justify = ["left"] + ["right"] * 9
-    # Have to split and strip to get formatting exactly right for DSSAT
-    strings = dataframe.to_string(
-        index=False, columns=columns, na_rep="   ", justify=justify
-    ).split("\n")
-    strings = [x.strip() for x in strings]
-    string = "\n".join(strings)
+def get_weather_file_string(experiment):
+    """Return the weather file string of an experiment.
+
+    Sweeps run the same weather many times over, so the strings of the last
+    WEATHER_CACHE_SIZE weather files are kept and reused by experiments with
+    the same weather_file_key. See generate_weather_file_string.
+    """
+    return _get_weather_file_string(_WeatherKey(experiment))
+
+
+@functools.lru_cache(maxsize=WEATHER_CACHE_SIZE)
+def _get_weather_file_string(weather_key):
+    # The cache keeps the key, don't let it keep the weather data too
+    experiment, weather_key.experiment = weather_key.experiment, None
+    return generate_weather_file_string(experiment)
 
-    # replace -99.0 values that are a result of formatting with DSSAT
-    # friendly -99 values
-    string = string.replace("-99.0", "  -99")
-    string = string.replace("-99.00", "   -99")
 
-    return string
+def format_weather_dataframe_for_DSSAT(dataframe, columns):
+    # Daily table of a weather file, see dabbler.wth.encode_table
+    columns = [column for column in columns if column != "@DATE"]
+    return b"".join(wth.encode_table(dataframe, columns)).decode()
 
 
 def fill_missing_columns_with_nan(dataframe, required_columns):
@@ -214,57 +385,13 @@ def generate_weather(filename, savepath, weather_data, header_data):
 
     path = Path(savepath, filename)
 
-    # Check for any missing weather columns and fill them with NaN
-    weather_columns = [
-        "@DATE",
-        "SRAD",
-        "TMAX",
-        "TMIN",
-        "RAIN",
-        "DEWP",
-        "WIND",
-        "PAR",
-        "EVAP",
-        "RHUM",
-    ]
-
-    weather_data = weather_data.round(1)
-
-    # Make wind data a whole int
-    if "WIND" in weather_data.columns:
-        weather_data["WIND"] = weather_data["WIND"].astype(int)
-
-    for col in weather_columns:
-        if col not in weather_data.columns:
-            weather_data[col] = np.nan
-
-    # Set proper format justifications for solumns
-    justify = ["left"] + ["right"] * 9
-
     if path.exists():
         warnings.warn(
             "Found existing weather file in specified location:" f" {path}",
             RuntimeWarning,
         )
 
-    with open(path, "w") as f:
-        # Write the header to file
-        build_header(f, "weather", header_data)
-
-        # Have to split and strip to get formatting exactly right for DSSAT
-        strings = weather_data.to_string(
-            index=False, columns=weather_columns, na_rep="   ", justify=justify
-        ).split("\n")
-        strings = [x.strip() for x in strings]
-        string = "\n".join(strings)
-
-        # replace -99.0 values that are a result of formatting with DSSAT
-        # friendly -99 values
-        string = string.replace("-99.0", "  -99")
-        string = string.replace("-99.00", "   -99")
-
-        f.write(string)
-        f.close()
+    wth.write_weather(path, header_data, weather_data)
 
     return str(path.absolute())
 
@@ -326,7 +453,8 @@ def generate_batchfile_string(experiment, EXP_fifo):
     Parameters
     ----------
     experiment : dabbler.Experiment
-    EXP_fifo : pathlib.Path for experiment fifo object
+    EXP_fifo : pathlib.Path for experiment fifo object, or list of them
+        Experiment files to run, one batch line each.
 
     Returns
     -------
@@ -335,20 +463,23 @@ def generate_batchfile_string(experiment, EXP_fifo):
 
     Note
     ----
-    Generates a very simple 2 line batch file. Used to run single
+    Generates a very simple batch file. Used to run single
     experiments from a different directory as DSSAT does not like single
     experiment files being passed that are not in the same directory as the
-    DSSAT file.
+    DSSAT file, or to run many experiment files from one DSSAT launch.
     """
 
     header_data = {"CROP": experiment.crop}
 
-    # Format line string
-    line = f"{str(EXP_fifo):<98}1      1      0      0      0"
+    if not isinstance(EXP_fifo, (list, tuple)):
+        EXP_fifo = [EXP_fifo]
+
+    # Format line strings
+    lines = [f"{str(EXP):<98}1      1      0      0      0" for EXP in EXP_fifo]
 
     header_string = build_header("batch", header_data)
 
-    batch_string = header_string + "\n" + line
+    batch_string = header_string + "\n" + "\n".join(lines)
 
     return batch_string
 
@@ -407,7 +538,7 @@ if __name__ == "__main__":
     # Read in from a DSSAT weather file for testing
     wth_file = "UFGA8201.WTH"
 
-    wth = pd.read_csv(wth_file, skiprows=4, sep="\s+")
+    weather_data = pd.read_csv(wth_file, skiprows=4, sep="\s+")
 
     header_data = {
         "INSI": "UFGA",
@@ -421,7 +552,7 @@ if __name__ == "__main__":
         "location": "Test",
     }
 
-    generate_weather("test.WTH", "", wth, header_data)
+    generate_weather("test.WTH", "", weather_data, header_data)
     generate_batchfile(
         "/home/george/Documents/code/dabbler/EXP_template.MZX", "run", "MAIZE", "1234"
     )
@@ -0,0 +1,259 @@
+"""
+Daily weather read from locally mirrored, gridded DayMet or NASA POWER data.
+
+Rather than a request per point, every point's grid cells are found at once
+and read block by block, one block per chunk of the data, so only the
+chunks holding points are read from disk. The weather is returned in the
+same DSSAT ready form as dabbler.weather.get_daymet_data and
+get_nasa_power_data.
+"""
+import numpy as np
+import pandas as pd
+import pyproj
+import xarray as xr
+from pathlib import Path
+from . import weather
+from .cache import DAYMET_CRS
+
+# Variables read from each source, named as in the source's files
+VARIABLES = {
+    "DayMet": list(weather.DAYMET_COLUMNS),
+    "NASA-POWER": weather.POWER_VARIABLES,
+}
+# Names of a grid's axes, projected or in degrees
+AXES = [("x", "y"), ("lon", "lat"), ("longitude", "latitude")]
+# Cells per side of the blocks read, if the data is not chunked
+BLOCK_SIZE = 64
+
+
+def open_gridded(data):
+    """Open gridded weather lazily.
+
+    Parameters
+    ----------
+    data : str, pathlib.Path, list or xarray.Dataset
+        A NetCDF file, a Zarr store (a .zarr directory), a glob pattern or
+        list of NetCDF files to combine by their coordinates (which needs
+        dask), or an already open dataset.
+
+    Returns
+    -------
+    xarray.Dataset
+    """
+    if isinstance(data, xr.Dataset):
+        return data
+    if isinstance(data, (list, tuple)) or any(c in str(data) for c in "*?["):
+        return xr.open_mfdataset(data, combine="by_coords")
+    if Path(data).suffix == ".zarr":
+        return xr.open_zarr(data)
+    return xr.open_dataset(data)
+
+
+class GriddedWeather:
+    """Daily weather at points, from gridded DayMet or NASA POWER data.
+
+    Pass as the source of dabbler.weather.fetch_weather, or call extract.
+
+    Parameters
+    ----------
+    data : str, pathlib.Path, list or xarray.Dataset
+        See open_gridded. The dataset has a time axis and either projected
+        x and y axes or lon and lat axes, and the variables of VARIABLES for
+        its source. An "elevation" variable, if there is one, gives the
+        header's elevation.
+    source : str
+        'DayMet' or 'NASA-POWER', naming the variables and their units.
+    method : str
+        'nearest' to take each point's cell, or 'bilinear' to interpolate
+        between the four cells around it.
+    crs : str or pyproj.CRS, optional
+        Projection of the x and y axes. By default read from the dataset's
+        grid mapping, or DayMet's if it has none.
+    """
+
+    def __init__(self, data, source="DayMet", method="nearest", crs=None):
+        if source not in VARIABLES:
+            raise ValueError("'DayMet' or 'NASA-POWER' available.")
+        if method not in ("nearest", "bilinear"):
+            raise ValueError("'nearest' or 'bilinear' available.")
+        self.dataset = open_gridded(data)
+        self.source = source
+        self.method = method
+        for x, y in AXES:
+            if x in self.dataset.dims and y in self.dataset.dims:
+                self.x, self.y = x, y
+                break
+        else:
+            raise ValueError(f"No x and y or lon and lat axes in {self.dataset}")
+        self.transformer = None
+        if self.x == "x":
+            crs = crs or self._grid_mapping_crs() or DAYMET_CRS
+            self.transformer = pyproj.Transformer.from_crs(
+                "EPSG:4326", crs, always_xy=True
+            )
+        self.years = self.dataset.indexes["time"].year.to_numpy()
+
+    def _grid_mapping_crs(self):
+        variable = self.dataset[VARIABLES[self.source][0]]
+        grid_mapping = variable.attrs.get("grid_mapping")
+        if grid_mapping not in self.dataset.variables:
+            return None
+        return pyproj.CRS.from_cf(self.dataset[grid_mapping].attrs)
+
+    def _fractional_indexes(self, points):
+        # Position of each point along the x and y axes, in cells
+        lon, lat = np.asarray(points, dtype=float).T
+        if self.transformer is None:
+            x, y = lon, lat
+        else:
+            x, y = self.transformer.transform(lon, lat)
+            if self.dataset[self.x].attrs.get("units") == "km":
+                x, y = x / 1000, y / 1000
+        indexes = []
+        for values, axis in ((x, self.x), (y, self.y)):
+            coordinates = self.dataset[axis].to_numpy()
+            positions = np.arange(len(coordinates), dtype=float)
+            if coordinates[0] > coordinates[-1]:
+                coordinates, positions = coordinates[::-1], positions[::-1]
+            # Up to half a cell past the first and last cell centres
+            step = np.diff(coordinates[:2]).sum() or 1
+            outside = (values < coordinates[0] - step / 2) | (
+                values > coordinates[-1] + step / 2
+            )
+            if outside.any():
+                raise ValueError(f"Points outside the grid: {np.flatnonzero(outside)}")
+            indexes.append(np.interp(values, coordinates, positions))
+        return indexes
+
+    def _cells_and_weights(self, points):
+        # Cells, as (y, x) index arrays of shape (corners, points), and the
+        # weight of each corner
+        fx, fy = self._fractional_indexes(points)
+        if self.method == "nearest":
+            ix = np.rint(fx).astype(int)[None]
+            iy = np.rint(fy).astype(int)[None]
+            return iy, ix, np.ones(ix.shape)
+        nx, ny = self.dataset.sizes[self.x], self.dataset.sizes[self.y]
+        x0 = np.minimum(np.floor(fx).astype(int), max(nx - 2, 0))
+        y0 = np.minimum(np.floor(fy).astype(int), max(ny - 2, 0))
+        wx = fx - x0
+        wy = fy - y0
+        ix = np.stack([x0, x0 + 1, x0, x0 + 1]).clip(0, nx - 1)
+        iy = np.stack([y0, y0, y0 + 1, y0 + 1]).clip(0, ny - 1)
+        weights = np.stack(
+            [(1 - wx) * (1 - wy), wx * (1 - wy), (1 - wx) * wy, wx * wy]
+        )
+        return iy, ix, weights
+
+    def _block_shape(self):
+        variable = self.dataset[VARIABLES[self.source][0]]
+        chunks = variable.encoding.get("preferred_chunks") or {}
+        if variable.chunks:  # Opened with dask
+            chunks = {dim: size[0] for dim, size in zip(variable.dims, variable.chunks)}
+        return chunks.get(self.y, BLOCK_SIZE), chunks.get(self.x, BLOCK_SIZE)
+
+    def _read_cells(self, variables, time, iy, ix):
+        # Values of variables at cells (iy, ix) for the time slice, each of
+        # shape (time, cells), read a block of the grid at a time
+        nx = self.dataset.sizes[self.x]
+        unique, inverse = np.unique(iy * nx + ix, return_inverse=True)
+        uy, ux = np.divmod(unique, nx)
+        block_y, block_x = self._block_shape()
+        blocks = (uy // block_y) * (nx // block_x + 1) + ux // block_x
+        order = np.argsort(blocks, kind="stable")
+        starts = np.flatnonzero(np.diff(blocks[order], prepend=-1))
+        length = len(range(*time.indices(self.dataset.sizes["time"])))
+        values = {name: np.empty((length, len(unique))) for name in variables}
+        for members in np.split(order, starts[1:]):
+            y0, y1 = uy[members].min(), uy[members].max() + 1
+            x0, x1 = ux[members].min(), ux[members].max() + 1
+            window = self.dataset[variables].isel(
+                time=time, **{self.y: slice(y0, y1), self.x: slice(x0, x1)}
+            )
+            for name in variables:
+                block = window[name].transpose("time", self.y, self.x).to_numpy()
+                values[name][:, members] = block[:, uy[members] - y0, ux[members] - x0]
+        return {name: value[:, inverse] for name, value in values.items()}
+
+    def _interpolate(self, variables, time, iy, ix, weights):
+        # Weighted sum over corners, ignoring corners with no data
+        corners, count = iy.shape
+        cells = self._read_cells(variables, time, iy.ravel(), ix.ravel())
+        interpolated = {}
+        for name, value in cells.items():
+            value = value.reshape(len(value), corners, count)
+            weight = np.where(np.isnan(value), 0, weights)
+            with np.errstate(invalid="ignore"):
+                interpolated[name] = (np.nan_to_num(value) * weight).sum(axis=1) / (
+                    weight.sum(axis=1)
+                )
+        return interpolated
+
+    def extract(self, points, years):
+        """Read the daily weather at points for years.
+
+        Parameters
+        ----------
+        points : list of tuple
+            (longitude, latitude) WGS84
+        years : list of int
+
+        Returns
+        -------
+        dict
+            (point, year) to (weather_data, elev, t_avg), as returned by
+            dabbler.weather.fetch_weather.
+        """
+        points = [tuple(point) for point in points]
+        iy, ix, weights = self._cells_and_weights(points)
+        elevations = np.full(len(points), -99.0)
+        if "elevation" in self.dataset:
+            elevation = self.dataset["elevation"].isel(
+                {self.y: xr.DataArray(iy[0]), self.x: xr.DataArray(ix[0])}
+            )
+            elevations = np.nan_to_num(elevation.to_numpy(), nan=-99.0)
+
+        extracted = {}
+        for year in sorted(set(years)):
+            (days,) = np.nonzero(self.years == year)
+            if not len(days):
+                raise KeyError(f"No weather for {year}")
+            time = slice(days[0], days[-1] + 1)
+            values = self._interpolate(VARIABLES[self.source], time, iy, ix, weights)
+            if self.source == "DayMet":
+                frames = _daymet_frames(values, year, elevations)
+            else:
+                dates = self.dataset.indexes["time"][time]
+                frames = _power_frames(values, dates, elevations)
+            for point, frame in zip(points, frames):
+                extracted[point, year] = frame
+        return extracted
+
+
+def _daymet_frames(values, year, elevations):
+    # As weather._daymet_to_dssat, for every point at once
+    index = pd.RangeIndex(int(str(year)[2:] + "001"), int(str(year)[2:] + "365") + 1)
+    columns = weather.daymet_columns(values)
+    t_avgs = np.mean((columns["TMAX"] + columns["TMIN"]) / 2, axis=0)
+    frames = []
+    for i, elevation in enumerate(elevations):
+        point_columns = {name: column[:, i] for name, column in columns.items()}
+        field_df = pd.DataFrame(
+            {"@DATE": index.to_numpy(), **point_columns}, index=index
+        )
+        frames.append((field_df, int(elevation), t_avgs[i]))
+    return frames
+
+
+def _power_frames(values, dates, elevations):
+    # As weather._power_to_dssat, for every point at once
+    codes = list(dates.strftime("%y%j"))
+    index = pd.DatetimeIndex(pd.to_datetime(codes, format="%y%j"))
+    columns = weather.power_columns(values)
+    t_avgs = np.mean((columns["TMAX"] + columns["TMIN"]) / 2, axis=0)
+    frames = []
+    for i, elevation in enumerate(elevations):
+        point_columns = {name: column[:, i] for name, column in columns.items()}
+        dssat_weather = pd.DataFrame({"@DATE": codes, **point_columns}, index=index)
+        frames.append((dssat_weather, float(elevation), t_avgs[i]))
+    return frames
@@ -0,0 +1,180 @@
+"""
+Timings and resource use of DSSAT runs.
+
+Every run records a RunMetrics, available as Results.metrics, with the wall
+time spent in each phase of the run and, where the DSSAT process could be
+reaped with os.wait4, its CPU time. DSSAT's peak memory is sampled from
+/proc while it runs, as os.wait4 also counts the memory it inherits from
+the Python process at fork. Finished runs are added
+to a MetricsRegistry, by default the module level registry, which keeps
+running totals, calls any hooks added to it and can export a snapshot in
+the Prometheus text format.
+
+Phases of a run:
+    inputs      generating the EXP, WTH and SOIL file strings
+    cache       looking the run up in the result cache
+    write       writing the input files
+    subprocess  launching DSSAT until it exits, including reading the FIFOs
+    read        reading the FIFOs, part of subprocess
+    overview    checking the outputs and reading the overview
+    parse       parsing tables, recorded when each table is first accessed
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+class RunMetrics:
+    """Timings and resource use of a single DSSAT launch.
+
+    Parameters
+    ----------
+    mode : str
+        "A" for a single run, "B" for a batch, "async" for DSSAT.run_async.
+    runs : int
+        Experiments run by the launch.
+    """
+
+    def __init__(self, mode="A", runs=1):
+        self.mode = mode
+        self.runs = runs
+        self.phases = {}
+        self.cache_hit = False
+        self.returncode = None
+        self.cpu_user = None  # Seconds, None if DSSAT was not reaped by us
+        self.cpu_system = None
+        self.max_rss = None  # Bytes, None if DSSAT exited before a sample
+        self.registry = None  # MetricsRegistry the run was recorded in
+
+    def __getstate__(self):
+        # Registries stay in their own process, a copy is recorded afresh
+        state = self.__dict__.copy()
+        state["registry"] = None
+        return state
+
+    @contextmanager
+    def time(self, phase):
+        """Add the time spent in the with block to phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def set_rusage(self, rusage):
+        """Set CPU time from DSSAT's resource usage.
+
+        Its ru_maxrss is left out, it includes the memory of the Python
+        process DSSAT was forked from.
+        """
+        self.cpu_user = rusage.ru_utime
+        self.cpu_system = rusage.ru_stime
+
+    @property
+    def wall_time(self):
+        return sum(
+            seconds for phase, seconds in self.phases.items() if phase != "read"
+        )
+
+    def __repr__(self):
+        phases = ", ".join(f"{k}={v:.4f}" for k, v in self.phases.items())
+        return f"RunMetrics(mode={self.mode!r}, runs={self.runs}, {phases})"
+
+
+class MetricsRegistry:
+    """Running totals of the runs recorded in it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hooks = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.launches = 0
+            self.runs = 0
+            self.failures = 0
+            self.cache_hits = 0
+            self.phase_seconds = {}
+            self.phase_counts = {}
+            self.cpu_user = 0.0
+            self.cpu_system = 0.0
+            self.max_rss = 0
+
+    def add_hook(self, hook):
+        """Call hook with the RunMetrics of every run recorded from now on."""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def observe(self, phase, seconds):
+        """Add time spent in a phase outside of a recorded run."""
+        with self._lock:
+            self._observe(phase, seconds)
+
+    def _observe(self, phase, seconds):
+        self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+        self.phase_counts[phase] = self.phase_counts.get(phase, 0) + 1
+
+    def record(self, run_metrics):
+        """Add a finished run to the totals and pass it to the hooks."""
+        run_metrics.registry = self
+        with self._lock:
+            self.launches += 1
+            self.runs += run_metrics.runs
+            if run_metrics.cache_hit:
+                self.cache_hits += 1
+            if run_metrics.returncode not in (None, 0):
+                self.failures += 1
+            for phase, seconds in run_metrics.phases.items():
+                self._observe(phase, seconds)
+            if run_metrics.cpu_user is not None:
+                self.cpu_user += run_metrics.cpu_user
+                self.cpu_system += run_metrics.cpu_system
+            if run_metrics.max_rss is not None:
+                self.max_rss = max(self.max_rss, run_metrics.max_rss)
+        for hook in list(self._hooks):
+            try:
+                hook(run_metrics)
+            except Exception:
+                logging.exception(f"Metrics hook {hook!r} failed.")
+
+    def snapshot(self, prefix="dabbler"):
+        """Return the totals in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                f"# TYPE {prefix}_launches_total counter",
+                f"{prefix}_launches_total {self.launches}",
+                f"# TYPE {prefix}_runs_total counter",
+                f"{prefix}_runs_total {self.runs}",
+                f"# TYPE {prefix}_run_failures_total counter",
+                f"{prefix}_run_failures_total {self.failures}",
+                f"# TYPE {prefix}_cache_hits_total counter",
+                f"{prefix}_cache_hits_total {self.cache_hits}",
+                f"# TYPE {prefix}_phase_seconds_total counter",
+            ]
+            for phase, seconds in sorted(self.phase_seconds.items()):
+                lines.append(
+                    f'{prefix}_phase_seconds_total{{phase="{phase}"}} {seconds}'
+                )
+            lines.append(f"# TYPE {prefix}_phase_count_total counter")
+            for phase, count in sorted(self.phase_counts.items()):
+                lines.append(f'{prefix}_phase_count_total{{phase="{phase}"}} {count}')
+            cpu = f"{prefix}_child_cpu_seconds_total"
+            lines += [
+                f"# TYPE {cpu} counter",
+                f'{cpu}{{mode="user"}} {self.cpu_user}',
+                f'{cpu}{{mode="system"}} {self.cpu_system}',
+                f"# TYPE {prefix}_child_max_rss_bytes gauge",
+                f"{prefix}_child_max_rss_bytes {self.max_rss}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+# Registry runs are recorded in by default
+registry = MetricsRegistry()
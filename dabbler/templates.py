@@ -1,7 +1,14 @@
 """
 Handles template location logic.
+
+Templates are read once per crop and compiled into their literal text and
+the fields slotted between it, so rendering an experiment file is a join
+rather than a parse of the whole template.
 """
+import string
 import pathlib
+import functools
+from itertools import repeat
 
 CROP_EXPERIMENT_TEMPLATES = {
     "maize": (
@@ -10,7 +17,83 @@ CROP_EXPERIMENT_TEMPLATES = {
 }
 
 
+class CompiledTemplate:
+    """A str.format template split into literal text and field slots.
+
+    Parameters
+    ----------
+    template : str
+        Template in str.format syntax, e.g. "{WST:<8}".
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.literals = []  # Text ahead of each field, then the trailing text
+        self.fields = []  # (name, format spec)
+        text = ""
+        for literal, name, spec, conversion in string.Formatter().parse(template):
+            if conversion:
+                raise ValueError(f"Template conversions are not supported: {name}")
+            # Escaped braces split the literal text without a field
+            text += literal
+            if name is not None:
+                self.literals.append(text)
+                self.fields.append((name, spec))
+                text = ""
+        self.literals.append(text)
+
+    def render(self, terms):
+        """Render the template, same as template.format(**terms)."""
+        parts = []
+        for literal, (name, spec) in zip(self.literals, self.fields):
+            parts.append(literal)
+            parts.append(format(terms[name], spec))
+        parts.append(self.literals[-1])
+        return "".join(parts)
+
+    def render_many(self, terms, count):
+        """Render the template count times.
+
+        Parameters
+        ----------
+        terms : dict
+            Each field's value, either one value shared by every rendering
+            or a sequence with a value per rendering.
+        count : int
+
+        Returns
+        -------
+        list of str
+        """
+        # Fields with one value for every rendering are folded into the
+        # literal text around them, leaving a few varying slots per row
+        columns = []
+        text = ""
+        for literal, (name, spec) in zip(self.literals, self.fields):
+            text += literal
+            value = terms[name]
+            if isinstance(value, str) or not hasattr(value, "__len__"):
+                text += format(value, spec)
+                continue
+            distinct = set(value)
+            if len(distinct) == 1:
+                text += format(distinct.pop(), spec)
+                continue
+            formatted = {v: format(v, spec) for v in distinct}
+            columns.append(repeat(text, count))
+            columns.append(map(formatted.__getitem__, value))
+            text = ""
+        columns.append(repeat(text + self.literals[-1], count))
+        return ["".join(parts) for parts in zip(*columns)]
+
+
+@functools.lru_cache(maxsize=None)
 def get_template_for_crop(crop):
     with open(CROP_EXPERIMENT_TEMPLATES[crop.lower()], "r") as f:
         template = f.read()
     return template
+
+
+@functools.lru_cache(maxsize=None)
+def get_compiled_template_for_crop(crop):
+    return CompiledTemplate(get_template_for_crop(crop))
@@ -2,6 +2,8 @@
 Generate DSSAT weather files for anywhere in the CONUS.
 
 Weather data taken from DayMet - https://daymet.ornl.gov/
+or NASA POWER - https://power.larc.nasa.gov/. Use fetch_weather to download
+many points and years at once.
 
 (DayMet date range: 1980 to 2019)
 
@@ -13,15 +15,50 @@ Date: February 8th 2021
 """
 import time
 import io
+import random
+import logging
 import numpy as np
 import pandas as pd
 import requests
-from .headers import get_header
+from . import wth
 from pathlib import Path
 from datetime import date, datetime
-
-
-def generate_weather(coordinates, year, loc_name, filename, savepath, source="DayMet"):
+from concurrent.futures import ThreadPoolExecutor
+
+DAYMET_URL = "https://daymet.ornl.gov/single-pixel/api/data"
+POWER_URL = "https://power.larc.nasa.gov/api/temporal/daily/point"
+# Responses retried, how many times, and the wait before the first retry in
+# seconds, doubling with each retry
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RETRIES = 5
+BACKOFF = 2.0
+TIMEOUT = 120
+# DayMet variables to the columns of its single pixel API
+DAYMET_COLUMNS = {
+    "dayl": "dayl (s)",
+    "prcp": "prcp (mm/day)",
+    "srad": "srad (W/m^2)",
+    "tmax": "tmax (deg c)",
+    "tmin": "tmin (deg c)",
+}
+# NASA POWER variables downloaded, and the value it writes when missing
+POWER_VARIABLES = [
+    "T2M_MAX",
+    "T2M_MIN",
+    "T2MDEW",
+    "PRECTOTCORR",
+    "WS2M",
+    "RH2M",
+    "ALLSKY_SFC_SW_DWN",
+]
+POWER_MISSING = -999
+
+_session = None
+
+
+def generate_weather(
+    coordinates, year, loc_name, filename, savepath, source="DayMet", cache=None
+):
     """Generate a DSSAT weather file from DayMet weather data.
 
     Parameters
@@ -38,6 +75,8 @@ def generate_weather(coordinates, year, loc_name, filename, savepath, source="Da
         directory to save generated file in
     source : str
         'DayMet' or 'NASA-POWER' available.
+    cache : dabbler.cache.WeatherCache, optional
+        Cache of downloads.
 
     Returns
     -------
@@ -48,11 +87,11 @@ def generate_weather(coordinates, year, loc_name, filename, savepath, source="Da
     # Get the weather data
     if source == "DayMet":
         weather_data, elev, t_avg = get_daymet_data(
-            coordinates[0], coordinates[1], year
+            coordinates[0], coordinates[1], year, cache
         )
     elif source == "NASA-POWER":
         weather_data, elev, t_avg = get_nasa_power_data(
-            coordinates[0], coordinates[1], year
+            coordinates[0], coordinates[1], year, cache
         )
     else:
         raise ValueError("'DayMet' or 'NASA-POWER' available.")
@@ -72,161 +111,300 @@ def generate_weather(coordinates, year, loc_name, filename, savepath, source="Da
 
     path = Path(savepath, filename)
 
-    # Check for any missing weather columns and fill them with NaN
-    weather_columns = [
-        "@DATE",
-        "SRAD",
-        "TMAX",
-        "TMIN",
-        "RAIN",
-        "DEWP",
-        "WIND",
-        "PAR",
-        "EVAP",
-        "RHUM",
-    ]
-
-    weather_data = weather_data.round(1)
-
-    for col in weather_columns:
-        if col not in weather_data.columns:
-            weather_data[col] = np.nan
+    wth.write_weather(path, header_data, weather_data)
 
-    # Set proper format justifications for columns
-    justify = ["left"] + ["right"] * 9
+    return str(path.absolute())
 
-    with open(path, "w") as f:
-        # Write the header to file
-        _build_header(f, "weather", header_data)
 
-        # Have to split and strip to get formatting exactly right for DSSAT
-        strings = weather_data.to_string(
-            index=False, columns=weather_columns, na_rep="   ", justify=justify
-        ).split("\n")
-        strings = [x.strip() for x in strings]
-        string = "\n".join(strings)
+def _get_session():
+    # Shared so connections are kept alive between requests
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def _download(url, params, session=None):
+    session = session or _get_session()
+    for attempt in range(RETRIES + 1):
+        retry_after = ""
+        try:
+            r = session.get(url, params=params, timeout=TIMEOUT)
+            if r.status_code not in RETRY_STATUS:
+                r.raise_for_status()
+                return r.content
+            error = requests.HTTPError(f"{r.status_code} from {r.url}", response=r)
+            retry_after = r.headers.get("Retry-After", "")
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        if attempt == RETRIES:
+            raise error
+        if retry_after.isdigit():
+            wait = float(retry_after)
+        else:
+            # Jittered so many workers backing off do not retry together
+            wait = BACKOFF * 2**attempt * random.uniform(0.5, 1)
+        logging.info(f"{error}, retrying in {wait:.1f} s.")
+        time.sleep(wait)
+
+
+def _get(source, url, params, key_parts, cache=None, session=None):
+    # key_parts are the coordinates, date range and parameters of the request
+    if cache is None:
+        return _download(url, params, session)
+    return cache.fetch(
+        cache.key(source, *key_parts), lambda: _download(url, params, session)
+    )
 
-        f.write(string)
-        f.close()
 
-    return str(path.absolute())
+def fetch_weather(points, years, source="DayMet", cache=None, max_workers=8):
+    """Download weather for many points and years at once.
 
-
-def _build_header(f, filetype, data):
-    """Builds the header and returns open file object.
+    Points are downloaded concurrently over a pool of kept alive
+    connections, all years of a point in one request, and requests that
+    fail with a server error or time out are retried with exponential
+    backoff.
 
     Parameters
     ----------
-    f : io.TextIOWrapper
-        Open file wrapper
-    filetype : str
-        'weather' 'experiment'
-    data : dict
-        Data with releveant header data needed. Indexed by
-        DSSAT header names e.g. 'ELEV' 'LAT' 'LONG'
-        plus 'location' for location
+    points : list of tuple
+        (longitude, latitude) WGS84
+    years : list of int
+    source : str or dabbler.gridded.GriddedWeather
+        'DayMet' or 'NASA-POWER' available, or local gridded data to read
+        the points from instead of downloading them.
+    cache : dabbler.cache.WeatherCache, optional
+        Cache of downloads. Points cached as one, see WeatherCache.cell,
+        are downloaded once.
+    max_workers : int
+        Most requests made at the same time.
 
     Returns
     -------
-    _io.TextIOWrapper
-        Open file wrapper with header written to it
+    dict
+        (point, year) to the (weather_data, elev, t_avg) that
+        get_daymet_data or get_nasa_power_data return.
     """
-    header = get_header(filetype)
-
-    # Format the header using the data dict
-    header = header.format(**data)
-
-    f.write(header)
+    if not isinstance(source, str):
+        return source.extract(points, years)
+    if source == "DayMet":
+        get_years = get_daymet_years
+    elif source == "NASA-POWER":
+        get_years = get_nasa_power_years
+    else:
+        raise ValueError("'DayMet' or 'NASA-POWER' available.")
+    points = [tuple(point) for point in points]
+    years = sorted(set(years))
+    # Points cached as one are downloaded once, for the first of them
+    if cache is None:
+        cells = {point: point for point in points}
+    else:
+        cells = {point: cache.cell(source, point) for point in points}
+    firsts = {}
+    for point, cell in cells.items():
+        firsts.setdefault(cell, point)
+
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        with ThreadPoolExecutor(max_workers) as executor:
+            futures = {
+                cell: executor.submit(
+                    get_years, point[0], point[1], years, cache, session
+                )
+                for cell, point in firsts.items()
+            }
+            fetched = {cell: future.result() for cell, future in futures.items()}
+    return {
+        (point, year): fetched[cells[point]][year]
+        for point in points
+        for year in years
+    }
 
 
-def get_daymet_data(lon, lat, year):
+def get_daymet_data(lon, lat, year, cache=None):
     """Pull the DayMet data for the field from the ORNL ReST server.
 
     https://daymet.ornl.gov/web_services#single
 
     Parameters
     ----------
-    field_df : pandas.DataFrame
+    lon, lat : float
+        WGS84
+    year : int
+    cache : dabbler.cache.WeatherCache, optional
+        Cache of downloads, keyed by the cell of DayMet's grid.
 
     Returns
     -------
     field_df : pandas.DataFrame
+    elev : int
+    t_avg : float
     """
+    return get_daymet_years(lon, lat, [year], cache)[year]
 
-    query = (
-        "https://daymet.ornl.gov/single-pixel/api/data?"
-        "lat={lat}&lon={lon}&years={year}"
-    )
 
-    query = query.format(lat=lat, lon=lon, year=year)
+def get_daymet_years(lon, lat, years, cache=None, session=None):
+    """Pull several years of DayMet data for the field in one request.
+
+    Parameters
+    ----------
+    lon, lat : float
+        WGS84
+    years : list of int
+    cache : dabbler.cache.WeatherCache, optional
+        Cache of downloads. Each year is cached on its own, so a year cached
+        by get_daymet_data is not downloaded again.
+    session : requests.Session, optional
+
+    Returns
+    -------
+    dict
+        Year to the (field_df, elev, t_avg) get_daymet_data returns.
+    """
+    years = sorted(set(years))
+    params = {"lat": lat, "lon": lon, "years": ",".join(map(str, years))}
+    texts = {}
+
+    def download(year):
+        # The first year missed downloads every year
+        if not texts:
+            text = _download(DAYMET_URL, params, session).decode()
+            texts.update(_split_daymet_years(text))
+        return texts[year]
+
+    data = {}
+    for year in years:
+        if cache is None:
+            text = download(year)
+        else:
+            key = cache.key("DayMet", (lon, lat), year, year)
+            text = cache.fetch(key, lambda: download(year).encode()).decode()
+        data[year] = _read_daymet(text, year)
+    return data
+
+
+def _split_daymet_years(text):
+    # A DayMet response per year, each with the response's header
+    lines = text.splitlines(keepends=True)
+    header = "".join(lines[:8])
+    rows = {}
+    for line in lines[8:]:
+        year, _, _ = line.partition(",")
+        rows.setdefault(int(year), []).append(line)
+    return {year: header + "".join(lines) for year, lines in rows.items()}
+
+
+def _read_daymet(text, year):
+    weather = pd.read_csv(io.StringIO(text), skiprows=7)
+
+    # Read elevation info off here
+    elev_line = text.split("\n")[3]
+    elev = int(elev_line.split()[1])
 
-    r = requests.get(query)
+    return _daymet_to_dssat(weather, elev, year)
 
-    while r.status_code != 200:
-        print(f"Request to DayMet is currently at code: {r.status_code}")
-        print("Waiting 30 seconds before next request.")
-        time.sleep(30)
 
+def _daymet_to_dssat(weather, elev, year):
+    # weather has DayMet's columns, e.g. "srad (W/m^2)", for the 365 days
     start_of_year = int(str(year)[2:] + "001")
     end_of_year = int(str(year)[2:] + "365")
 
     index = range(start_of_year, end_of_year + 1)
     field_df = pd.DataFrame(index=index)
 
-    weather = pd.read_csv(io.StringIO(r.text), skiprows=7)
-    weather.index = field_df.index
+    values = {
+        variable: weather[column].to_numpy()
+        for variable, column in DAYMET_COLUMNS.items()
+    }
+    field_df["@DATE"] = field_df.index
+    for name, column in daymet_columns(values).items():
+        field_df[name] = column
+
+    t_avg = np.mean((field_df["TMAX"] + field_df["TMIN"]) / 2)
+
+    return field_df, elev, t_avg
+
+
+def daymet_columns(values):
+    """Convert DayMet variables to DSSAT weather columns.
 
+    Shared by the single pixel downloads and dabbler.gridded.
+
+    Parameters
+    ----------
+    values : dict
+        Arrays of each of DAYMET_COLUMNS' variables, a row per day, for one
+        point or with a column per point.
+
+    Returns
+    -------
+    dict
+        RAIN, SRAD, TMAX and TMIN arrays, shaped as values.
+    """
     # Do SRAD calc to get from W/m2 to MJ / (m2*day) which DSSAT needs
-    watts = weather["srad (W/m^2)"]
-    MJ_hour = watts * 0.0036
-    MJ_day = MJ_hour * (weather["dayl (s)"] / (60 ** 2))
+    MJ_hour = values["srad"] * 0.0036
+    MJ_day = MJ_hour * (values["dayl"] / (60 ** 2))
+    return {
+        "RAIN": values["prcp"],
+        "SRAD": MJ_day,
+        "TMAX": values["tmax"],
+        "TMIN": values["tmin"],
+    }
 
-    field_df["@DATE"] = weather.index
-    field_df["RAIN"] = weather["prcp (mm/day)"]
-    field_df["SRAD"] = MJ_day
-    field_df["TMAX"] = weather["tmax (deg c)"]
-    field_df["TMIN"] = weather["tmin (deg c)"]
 
-    # Read elevation info off here
-    elev_line = r.text.split("\n")[3]
-    elev = int(elev_line.split()[1])
-    t_avg = np.mean((field_df["TMAX"] + field_df["TMIN"]) / 2)
+def get_nasa_power_data(lon, lat, year, cache=None):
+    return get_nasa_power_years(lon, lat, [year], cache)[year]
 
-    return field_df, elev, t_avg
 
+def get_nasa_power_years(lon, lat, years, cache=None, session=None):
+    """Pull several years of NASA POWER data, a request per run of years.
 
-def get_nasa_power_data(lon, lat, year):
+    Consecutive years are requested together, every day from the start of
+    the first to the end of the last, then split by year. Years apart, e.g.
+    1990 and 2020, are requested separately so the years between are not
+    downloaded.
 
-    start_date, end_date = generate_start_and_end_date(year)
+    Returns
+    -------
+    dict
+        Year to the (dssat_weather, elevation, t_avg) get_nasa_power_data
+        returns.
+    """
+    data = {}
+    for first_year, last_year in _consecutive_runs(years):
+        start_date, _ = generate_start_and_end_date(first_year)
+        _, end_date = generate_start_and_end_date(last_year)
+        weather, elevation = get_POWER_singlepoint(
+            (lon, lat), start_date, end_date, POWER_VARIABLES, cache, session
+        )
+        for year in range(first_year, last_year + 1):
+            yearly = weather[weather["YEAR"] == year].reset_index(drop=True)
+            data[year] = _power_to_dssat(yearly, elevation)
+    return data
 
-    variables = [
-        "T2M_MAX",
-        "T2M_MIN",
-        "T2MDEW",
-        "PRECTOTCORR",
-        "WS2M",
-        "RH2M",
-        "ALLSKY_SFC_SW_DWN",
-    ]
-    weather, elevation = get_POWER_singlepoint(
-        (lon, lat), start_date, end_date, variables
-    )
+
+def _consecutive_runs(years):
+    """Split years into (first, last) runs of consecutive years, in order."""
+    runs = []
+    for year in sorted(set(years)):
+        if runs and year == runs[-1][1] + 1:
+            runs[-1][1] = year
+        else:
+            runs.append([year, year])
+    return [tuple(run) for run in runs]
+
+
+def _power_to_dssat(weather, elevation):
     # convert to DSSAT weather
     dssat_weather = pd.DataFrame()
     dssat_weather["@DATE"] = [
         str(x)[2:] + f"{y:03}" for x, y in zip(weather["YEAR"], weather["DOY"])
     ]
-    dssat_weather["SRAD"] = weather["ALLSKY_SFC_SW_DWN"]
-    dssat_weather["TMAX"] = weather["T2M_MAX"]
-    dssat_weather["TMIN"] = weather["T2M_MIN"]
-    dssat_weather["DEWP"] = weather["T2MDEW"]
-    # Convert m/s to km/d for NASA POWER to DSSAT
-    dssat_weather["WIND"] = (weather["WS2M"] * (86400 / 1000)).astype(int)
-    dssat_weather["RAIN"] = weather["PRECTOTCORR"]
-    dssat_weather["RHUM"] = weather["RH2M"]
-    # Mask any no-value points
-    dssat_weather = dssat_weather.replace(-999, -99)
-    dssat_weather = dssat_weather.replace(-86313, -99)  # no point wind
+    values = {variable: weather[variable].to_numpy() for variable in POWER_VARIABLES}
+    for name, column in power_columns(values).items():
+        dssat_weather[name] = column
 
     dssat_weather.index = pd.DatetimeIndex(
         [datetime.strptime(x, "%y%j") for x in dssat_weather["@DATE"]]
@@ -236,6 +414,43 @@ def get_nasa_power_data(lon, lat, year):
     return dssat_weather, elevation, t_avg
 
 
+def power_columns(values):
+    """Convert NASA POWER variables to DSSAT weather columns.
+
+    Shared by the single point downloads and dabbler.gridded.
+
+    Parameters
+    ----------
+    values : dict
+        Arrays of each of POWER_VARIABLES, a row per day, for one point or
+        with a column per point. Missing values may be NaN or POWER's -999.
+
+    Returns
+    -------
+    dict
+        SRAD, TMAX, TMIN, DEWP, WIND, RAIN and RHUM arrays, shaped as values,
+        with missing values as DSSAT's -99.
+    """
+    columns = {
+        "SRAD": values["ALLSKY_SFC_SW_DWN"],
+        "TMAX": values["T2M_MAX"],
+        "TMIN": values["T2M_MIN"],
+        "DEWP": values["T2MDEW"],
+        "WIND": values["WS2M"],
+        "RAIN": values["PRECTOTCORR"],
+        "RHUM": values["RH2M"],
+    }
+    for name, column in columns.items():
+        columns[name] = np.nan_to_num(column, nan=POWER_MISSING)
+    # Convert m/s to km/d for NASA POWER to DSSAT
+    columns["WIND"] = (columns["WIND"] * (86400 / 1000)).astype(int)
+    for name, column in columns.items():
+        # Mask any no-value points, -86313 being a missing wind converted
+        missing = (column == POWER_MISSING) | (column == -86313)
+        columns[name] = np.where(missing, -99, column).astype(column.dtype)
+    return columns
+
+
 def generate_start_and_end_date(year):
     start_date = date(year, 1, 1)
     if year == datetime.now().year:
@@ -246,7 +461,9 @@ def generate_start_and_end_date(year):
     return start_date, end_date
 
 
-def get_POWER_singlepoint(coordinates, start_date, end_date, parameters):
+def get_POWER_singlepoint(
+    coordinates, start_date, end_date, parameters, cache=None, session=None
+):
     """
     Retrieve daily values for a single point from NASA POWER.
 
@@ -260,6 +477,9 @@ def get_POWER_singlepoint(coordinates, start_date, end_date, parameters):
     end_date : datetime.date
     parameters : list of str
         Parameters to request. 
+    cache : dabbler.cache.WeatherCache, optional
+        Cache of downloads.
+    session : requests.Session, optional
 
     Returns
     -------
@@ -276,8 +496,6 @@ def get_POWER_singlepoint(coordinates, start_date, end_date, parameters):
     if len(parameters) > 20:
         raise RuntimeError("NASA POWER allows only 20 parameters at a time.")
 
-    power_url = "https://power.larc.nasa.gov/api/temporal/daily/point?"
-
     payload = {
         "parameters": ",".join(parameters),
         "community": "AG",
@@ -288,18 +506,26 @@ def get_POWER_singlepoint(coordinates, start_date, end_date, parameters):
         "format": "CSV",
     }
 
-    r = requests.get(power_url, params=payload)
+    content = _get(
+        "NASA-POWER",
+        POWER_URL,
+        payload,
+        (tuple(coordinates), start_date, end_date, parameters),
+        cache,
+        session,
+    )
 
-    csv_io = io.BytesIO(r.content)
+    csv_io = io.BytesIO(content)
     # skip lines that are header + parameter details
     try:
         data = pd.read_csv(csv_io, skiprows=8 + len(parameters))
-    except Exception as e:
-        print(r.content)
-        raise (e)
+    except ValueError as e:
+        raise ValueError(
+            f"Could not read NASA POWER response:\n{content.decode(errors='replace')}"
+        ) from e
 
     # get elevation average from header
-    header = str(r.content).split("-END HEADER-")[0]
+    header = str(content).split("-END HEADER-")[0]
     elev = float(header.split("=")[1].split("meters")[0].strip())
 
     return data, elev
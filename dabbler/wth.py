@@ -0,0 +1,531 @@
+"""
+Read and write DSSAT .WTH weather files.
+
+Daily weather is written in DSSAT's fixed-width layout: a five character
+YYDDD date followed by six character, right aligned columns. Values are
+formatted a column at a time with NumPy straight into a byte buffer, and
+missing values are written as DSSAT's -99. Reading reverses this, parsing
+each fixed-width column of a memory-mapped file as a block of bytes.
+"""
+import os
+import re
+import json
+import mmap
+import datetime
+import tempfile
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import NamedTuple
+from .headers import get_header
+
+# Daily columns written, in order, and the decimals each is written with
+WEATHER_COLUMNS = {
+    "SRAD": 1,
+    "TMAX": 1,
+    "TMIN": 1,
+    "RAIN": 1,
+    "DEWP": 1,
+    "WIND": 0,
+    "PAR": 1,
+    "EVAP": 1,
+    "RHUM": 1,
+}
+# Columns DSSAT needs, written even if every value is missing
+REQUIRED_COLUMNS = ["SRAD", "TMAX", "TMIN", "RAIN"]
+DATE_WIDTH = 5
+COLUMN_WIDTH = 6
+MISSING = -99
+
+_SPACE, _MINUS, _POINT, _ZERO = b" -.0"
+
+
+def format_fixed(values, width, decimals):
+    """Format numbers right aligned in fixed-width fields.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Numbers to format. NaN is written as -99.
+    width : int
+        Characters per value.
+    decimals : int
+        Digits after the decimal point. No point is written for 0.
+
+    Returns
+    -------
+    numpy.ndarray
+        uint8 array of shape (len(values), width) holding the ASCII text.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = np.where(np.isnan(values), MISSING, values)
+    scaled = np.rint(np.abs(values) * 10**decimals).astype(np.int64)
+    negative = (values < 0) & (scaled > 0)
+
+    out = np.full((len(values), width), _SPACE, dtype=np.uint8)
+    rows = np.arange(len(values))
+    column = width - 1
+    for _ in range(decimals):
+        out[:, column] = _ZERO + scaled % 10
+        scaled //= 10
+        column -= 1
+    if decimals:
+        out[:, column] = _POINT
+        column -= 1
+    # Integer digits, at least one, then the sign, each at its row's position
+    position = np.full(len(values), column)
+    remaining = np.ones(len(values), dtype=bool)
+    while remaining.any():
+        if (position[remaining] < 0).any():
+            raise ValueError(f"Values too wide for {width} characters.")
+        out[rows[remaining], position[remaining]] = _ZERO + scaled[remaining] % 10
+        scaled //= 10
+        position[remaining] -= 1
+        remaining &= scaled > 0
+    if (position[negative] < 0).any():
+        raise ValueError(f"Values too wide for {width} characters.")
+    out[rows[negative], position[negative]] = _MINUS
+    return out
+
+
+def format_date_column(dates):
+    """Format a weather date column as YYDDD bytes.
+
+    Parameters
+    ----------
+    dates : array-like
+        YYDDD strings or integers, or datetimes.
+
+    Returns
+    -------
+    numpy.ndarray
+        uint8 array of shape (len(dates), 5).
+    """
+    dates = pd.Series(dates)
+    if not len(dates):
+        return np.empty((0, DATE_WIDTH), dtype=np.uint8)
+    if dates.dtype == object and isinstance(dates.iloc[0], datetime.date):
+        dates = pd.to_datetime(dates)
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        days = pd.to_datetime(dates).to_numpy().astype("datetime64[D]")
+        years = days.astype("datetime64[Y]")
+        codes = ((years.astype(np.int64) + 1970) % 100) * 1000 + (
+            (days - years).astype(np.int64) + 1
+        )
+    else:
+        codes = dates.astype(np.int64).to_numpy()
+    if ((codes < 0) | (codes > 99999)).any():
+        raise ValueError("Weather dates must be YYDDD.")
+    out = np.empty((len(codes), DATE_WIDTH), dtype=np.uint8)
+    for column in range(DATE_WIDTH - 1, -1, -1):
+        out[:, column] = _ZERO + codes % 10
+        codes = codes // 10
+    return out
+
+
+def weather_columns(weather_data):
+    """Return the daily columns written for the weather data."""
+    return [
+        column
+        for column in WEATHER_COLUMNS
+        if column in REQUIRED_COLUMNS
+        or (column in weather_data.columns and weather_data[column].notna().any())
+    ]
+
+
+def encode_table(weather_data, columns=None, chunksize=None):
+    """Encode the daily weather table, column header included.
+
+    Parameters
+    ----------
+    weather_data : pandas.DataFrame
+        "@DATE" and any of WEATHER_COLUMNS. Missing values may be NaN.
+    columns : list of str, optional
+        Daily columns to write. Defaults to weather_columns(weather_data).
+    chunksize : int, optional
+        Encode this many rows at a time, yielding each chunk as it is done,
+        to stream long records in bounded memory.
+
+    Yields
+    ------
+    bytes
+    """
+    if columns is None:
+        columns = weather_columns(weather_data)
+    yield b"@DATE" + b"".join(
+        column.rjust(COLUMN_WIDTH).encode() for column in columns
+    ) + b"\n"
+    chunksize = chunksize or max(len(weather_data), 1)
+    for start in range(0, len(weather_data), chunksize):
+        chunk = weather_data.iloc[start : start + chunksize]
+        fields = [format_date_column(chunk["@DATE"].to_numpy())]
+        for column in columns:
+            if column in chunk.columns:
+                values = chunk[column].to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                values = np.full(len(chunk), np.nan)
+            fields.append(format_fixed(values, COLUMN_WIDTH, WEATHER_COLUMNS[column]))
+        fields.append(np.full((len(chunk), 1), ord("\n"), dtype=np.uint8))
+        yield np.hstack(fields).tobytes()
+
+
+def encode_weather(header_data, weather_data, columns=None):
+    """Encode a whole weather file.
+
+    Parameters
+    ----------
+    header_data : dict
+        With keys 'INSI', 'LAT', 'LONG', 'ELEV', 'TAV', 'AMP', 'REFHT',
+        'WNDHT' and 'location'.
+    weather_data : pandas.DataFrame
+        See encode_table.
+    columns : list of str, optional
+        See encode_table.
+
+    Returns
+    -------
+    str
+    """
+    table = b"".join(encode_table(weather_data, columns))
+    return get_header("weather").format(**header_data) + "\n" + table.decode()
+
+
+def write_weather(path, header_data, weather_data, columns=None, chunksize=3660):
+    """Write a weather file, a chunk of rows at a time.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+    header_data, weather_data, columns
+        See encode_weather.
+    chunksize : int
+        Rows encoded at a time.
+    """
+    with open(path, "wb") as f:
+        f.write(get_header("weather").format(**header_data).encode() + b"\n")
+        for chunk in encode_table(weather_data, columns, chunksize):
+            f.write(chunk)
+
+
+# Two digit years below this are read as 20xx, the rest as 19xx
+CENTURY_PIVOT = 50
+
+
+class WeatherFile(NamedTuple):
+    """The contents of a .WTH file, see read_weather."""
+
+    header: dict  # INSI, LAT, LONG, ELEV, TAV, ... to values, -99 as None
+    dates: np.ndarray  # datetime64[D]
+    columns: dict  # Daily column name to float array, missing values NaN
+
+    def to_frame(self):
+        """Return the daily table as Experiment.weather_data expects it."""
+        codes = _date_codes(self.dates)
+        weather_data = pd.DataFrame({"@DATE": codes, **self.columns})
+        weather_data.index = pd.DatetimeIndex(self.dates, name="DATE")
+        return weather_data
+
+    def header_data(self, location=""):
+        """Return the header as write_weather expects it."""
+        header_data = {
+            field: MISSING if value is None else value
+            for field, value in self.header.items()
+        }
+        header_data["location"] = location
+        return header_data
+
+
+def _date_codes(dates):
+    # datetime64[D] to YYDDD integers
+    years = dates.astype("datetime64[Y]")
+    day_of_year = (dates - years).astype(np.int64) + 1
+    return (years.astype(np.int64) + 1970) % 100 * 1000 + day_of_year
+
+
+def _parse_dates(codes):
+    # YYDDD or YYYYDDD integers to datetime64[D]
+    years = codes // 1000
+    short = codes < 100000
+    years = np.where(
+        short, years + np.where(years < CENTURY_PIVOT, 2000, 1900), years
+    )
+    starts = (years - 1970).astype("datetime64[Y]").astype("datetime64[D]")
+    return starts + (codes % 1000 - 1).astype("timedelta64[D]")
+
+
+def _read_table_fixed(body, column_ends):
+    # Rows of equal length, each value right aligned to its header's end and
+    # with its point in the same place in every row, as DSSAT writes them
+    if not body.endswith(b"\n"):
+        body += b"\n"
+    first_line = body.find(b"\n") + 1
+    if first_line == 0 or len(body) % first_line:
+        return None
+    rows = np.frombuffer(body, dtype=np.uint8).reshape(-1, first_line)
+    if not (rows[:, -1] == ord("\n")).all():
+        return None
+    rows = rows[:, :-1]
+    if rows.shape[1] and (rows[:, -1] == ord("\r")).all():
+        rows = rows[:, :-1]  # Written on Windows
+    width = column_ends[-1]
+    if rows.shape[1] > width:
+        return None  # Values past the last header, not right aligned
+    # Short rows are padded with blanks, read as missing
+    padded = np.full((len(rows), width), _SPACE, dtype=np.uint8)
+    padded[:, : rows.shape[1]] = rows
+
+    # Each position's column
+    columns = np.zeros((width, len(column_ends)))
+    start = 0
+    for i, end in enumerate(column_ends):
+        columns[start:end, i] = 1
+        start = end
+    digits = padded - _ZERO
+    is_digit = digits <= 9  # Wraps around below "0"
+    if not (
+        is_digit | (padded == _POINT) | (padded == _MINUS) | (padded == _SPACE)
+    ).all():
+        return None  # Text or exponents, leave it to _read_table_whitespace
+    # Counts digits per value, and adds 64 if it has a minus sign
+    flags = (is_digit + (padded == _MINUS) * np.uint8(64)).astype(np.float64)
+    flags = flags @ columns
+    has_digit = flags % 64 > 0
+    negative = flags >= 64
+    point_positions = (padded == _POINT).any(axis=0)
+
+    # Each digit's place value, with every value read as an integer and
+    # divided by its column's power of ten after
+    places = np.zeros((width, len(column_ends)))
+    decimals = np.zeros(len(column_ends))
+    start = 0
+    for i, end in enumerate(column_ends):
+        (points,) = np.nonzero(point_positions[start:end])
+        point = start + points[0] if len(points) else end
+        if len(points) > 1 or (
+            len(points)
+            and not np.array_equal(padded[:, point] == _POINT, has_digit[:, i])
+        ):
+            return None  # The point moves, leave it to _read_table_whitespace
+        decimals[i] = max(end - point - 1, 0)
+        place = np.arange(end - start)[::-1].astype(np.float64)
+        place[: point - start] -= point < end  # Skip over the point
+        places[start:end, i] = 10.0**place
+        start = end
+    digits = (digits * is_digit).astype(np.float64)
+    values = (digits @ places) / 10.0**decimals
+    values[negative] *= -1
+    values[~has_digit | (values == MISSING)] = np.nan
+    return list(values.T)
+
+
+def _read_table_whitespace(body, count):
+    # Any layout, columns split on whitespace
+    lines = body.decode("latin-1").split("\n")
+    values = np.full((len(lines), count), np.nan)
+    length = 0
+    for line in lines:
+        fields = line.split()
+        if fields:
+            values[length, : len(fields)] = [float(field) for field in fields]
+            length += 1
+    values = values[:length]
+    values[values == MISSING] = np.nan
+    return list(values.T)
+
+
+def read_weather(path):
+    """Read a DSSAT .WTH file.
+
+    The file is memory-mapped and, if its rows are fixed-width as DSSAT
+    writes them, every column is parsed with NumPy without splitting lines.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+
+    Returns
+    -------
+    WeatherFile
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        header_start = m.find(b"@ INSI")
+        table_start = _find_table(m, path)
+        header = {}
+        if header_start != -1:
+            header_lines = m[header_start:table_start].decode("latin-1").splitlines()
+            header = _parse_header(header_lines[0].split()[1:], header_lines[1].split())
+        table_header_end = m.find(b"\n", table_start) + 1 or len(m)
+        table_header = m[table_start:table_header_end].decode("latin-1").rstrip()
+        body = m[table_header_end:]
+
+    names = table_header.split()
+    names[0] = "@DATE"
+    if names[1:2] == ["DATE"]:  # "@  DATE"
+        del names[1]
+    column_ends = [match.end() for match in re.finditer(r"\S+", table_header)]
+    if len(column_ends) != len(names):
+        column_ends = None  # "@  DATE" split in two
+    values = _read_table_fixed(body, column_ends) if column_ends else None
+    if values is None:
+        values = _read_table_whitespace(body, len(names))
+    dates = _parse_dates(np.nan_to_num(values[0]).astype(np.int64))
+    return WeatherFile(header, dates, dict(zip(names[1:], values[1:])))
+
+
+def _find_table(m, path):
+    table_start = m.find(b"@DATE")
+    if table_start == -1:
+        table_start = m.find(b"@  DATE")
+    if table_start == -1:
+        raise ValueError(f"No daily table in {path}")
+    return table_start
+
+
+def _parse_header(names, fields):
+    header = {}
+    for name, field in zip(names, fields):
+        if name != "INSI":
+            field = float(field)
+            field = None if field == MISSING else field
+        header[name] = field
+    return header
+
+
+def weather_file_dates(path):
+    """Return the first and last date of a .WTH file as datetime.date.
+
+    Only the first and last rows of the daily table are read.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        first_row = m.find(b"\n", _find_table(m, path)) + 1
+        end = len(m)
+        while end > first_row and m[end - 1 : end].isspace():
+            end -= 1
+        last_row = m.rfind(b"\n", first_row, end) + 1 or first_row
+        codes = []
+        for row in (first_row, last_row):
+            row_end = m.find(b"\n", row, end)
+            # The date is the row's first field, which may be space padded
+            codes.append(int(m[row : end if row_end == -1 else row_end].split()[0]))
+    dates = _parse_dates(np.array(codes))
+    return dates[0].item(), dates[1].item()
+
+
+class WeatherIndex:
+    """Index of the .WTH files in a directory, by station and date range.
+
+    DSSAT weather directories hold a file per station and year or range of
+    years, named SSSSYYNN.WTH for station SSSS. The index records each
+    file's station and first and last date, so reading a station's weather
+    for a range of dates only opens the files that overlap it. It is saved
+    as JSON in the directory and, when opened again, only files added or
+    changed since are read.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        Directory of .WTH files.
+    index_path : str or pathlib.Path, optional
+        Where the index is saved, by default .wth_index.json in directory.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory, index_path=None):
+        self.directory = Path(directory)
+        self.index_path = Path(index_path or self.directory / ".wth_index.json")
+        self.entries = {}  # File name to station, start, end, mtime_ns, size
+        try:
+            with open(self.index_path) as f:
+                saved = json.load(f)
+            if saved.get("version") == self.VERSION:
+                self.entries = saved["files"]
+        except (FileNotFoundError, ValueError):
+            pass
+        self.refresh()
+
+    def refresh(self):
+        """Index files added or changed since the index was saved."""
+        entries = {}
+        for path in self.directory.iterdir():
+            if path.suffix.upper() != ".WTH":
+                continue
+            stat = path.stat()
+            entry = self.entries.get(path.name)
+            if (
+                entry is None
+                or entry["mtime_ns"] != stat.st_mtime_ns
+                or entry["size"] != stat.st_size
+            ):
+                start, end = weather_file_dates(path)
+                entry = {
+                    "station": path.stem[:4].upper(),
+                    "start": start.isoformat(),
+                    "end": end.isoformat(),
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                }
+            entries[path.name] = entry
+        if entries != self.entries:
+            self.entries = entries
+            self._save()
+
+    def _save(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.index_path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": self.VERSION, "files": self.entries}, f)
+            os.replace(tmp_path, self.index_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def stations(self):
+        """Return the station codes in the directory."""
+        return sorted({entry["station"] for entry in self.entries.values()})
+
+    def files(self, station, start=None, end=None):
+        """Return the paths of station's files overlapping start to end.
+
+        Parameters
+        ----------
+        station : str
+            Four character station code.
+        start, end : datetime.date, optional
+            Inclusive range of dates, open ended if not given.
+        """
+        start = start.isoformat() if start else ""
+        end = end.isoformat() if end else "9999"
+        overlapping = sorted(
+            (entry["start"], name)
+            for name, entry in self.entries.items()
+            if entry["station"] == station.upper()
+            and entry["start"] <= end
+            and entry["end"] >= start
+        )
+        return [self.directory / name for _, name in overlapping]
+
+    def read(self, station, start=None, end=None):
+        """Read station's weather from start to end.
+
+        Parameters
+        ----------
+        station : str
+            Four character station code.
+        start, end : datetime.date, optional
+            Inclusive range of dates, open ended if not given.
+
+        Returns
+        -------
+        pandas.DataFrame
+            As WeatherFile.to_frame, for the dates in the files. Where files
+            overlap, the later file's rows are kept.
+        """
+        paths = self.files(station, start, end)
+        if not paths:
+            raise KeyError(f"No weather for {station} from {start} to {end}")
+        weather_data = pd.concat([read_weather(path).to_frame() for path in paths])
+        weather_data = weather_data[~weather_data.index.duplicated(keep="last")]
+        start = start and pd.Timestamp(start)
+        end = end and pd.Timestamp(end)
+        return weather_data.sort_index().loc[start:end]
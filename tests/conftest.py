@@ -0,0 +1,23 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+from datetime import date
+from dabbler import Experiment
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    return Experiment(
+        crop="Maize",
+        model="MZIXM",
+        cultivar="PC0003",
+        plant_date=date(1982, 2, 25),
+        harvest_date=date(1982, 6, 25),
+        simulation_start=date(1982, 1, 1),
+        coordinates_latitude=29.6380,
+        coordinates_longitude=-28.3689,
+        weather_station_code="UFGA",
+        soil_code="IBMZ910014",
+    )
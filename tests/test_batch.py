@@ -0,0 +1,113 @@
+import os
+import sys
+import pickle
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date
+from dabbler import Experiment, ExperimentBatch, AutomaticIrrigationManagement
+
+
+@pytest.fixture()
+def weather():
+    dates = pd.date_range("1982-01-01", "1982-12-31")
+    return {
+        station: pd.DataFrame({"@DATE": dates.strftime("%y%j"), "TMAX": 30.0})
+        for station in ("north", "south")
+    }
+
+
+@pytest.fixture()
+def table():
+    return pd.DataFrame(
+        {
+            "cultivar": ["PC0003", "PC0001", "PC0003", "PC0001"],
+            "plant_date": pd.to_datetime(
+                ["1982-02-25", "1982-02-25", "1982-03-10", "1982-03-10"]
+            ),
+            "plant_end": pd.to_datetime([None, "1982-03-01", None, None]),
+            "weather_key": ["north", "north", "south", "south"],
+        }
+    )
+
+
+@pytest.fixture()
+def batch(table, weather):
+    return ExperimentBatch.from_table(
+        table,
+        weather,
+        crop="Maize",
+        model="MZIXM",
+        harvest_date=date(1982, 6, 25),
+        simulation_start=date(1982, 1, 1),
+        coordinates_latitude=29.6380,
+        coordinates_longitude=-28.3689,
+        soil_code="IBMZ910014",
+    )
+
+
+class TestExperimentBatch:
+    def test_rows_are_experiments(self, batch, weather):
+        experiment = batch[1]
+
+        assert isinstance(experiment, Experiment)
+        assert experiment.cultivar == "PC0001"
+        assert experiment.plant_date == date(1982, 2, 25)
+        assert experiment.plant_end == date(1982, 3, 1)
+        assert batch[0].plant_end is None
+        assert experiment.weather_data is weather["north"]
+        assert experiment.irrigation == "N"
+        assert [e.cultivar for e in batch] == ["PC0003", "PC0001"] * 2
+
+    def test_slice_carries_only_its_weather(self, batch):
+        second_half = batch[2:]
+
+        assert len(second_half) == 2
+        assert list(second_half.weather) == ["south"]
+        assert second_half[0].plant_date == date(1982, 3, 10)
+
+    def test_weather_pickled_once(self, batch, weather):
+        # Pool workers are sent experiments one pickle at a time
+        experiments = list(batch)
+        experiments_size = sum(len(pickle.dumps(e)) for e in experiments)
+
+        assert len(pickle.dumps(batch)) < experiments_size / 1.5
+        unpickled = pickle.loads(pickle.dumps(batch))[3]
+        assert unpickled._replace(weather_data=None) == experiments[3]._replace(
+            weather_data=None
+        )
+        assert unpickled.weather_data.equals(weather["south"])
+
+    def test_from_experiments_shares_weather(self, experiment, weather):
+        management = AutomaticIrrigationManagement(irrigation_amount=20)
+        experiments = [
+            experiment._replace(weather_data=weather["north"], cultivar=cultivar)
+            for cultivar in ("PC0001", "PC0002", "PC0003")
+        ]
+        experiments[0] = experiments[0]._replace(
+            irrigation="A", irrigation_management=management
+        )
+
+        batch = ExperimentBatch.from_experiments(experiments)
+
+        assert len(batch.weather) == 1
+        assert list(batch) == experiments
+        assert batch[0].irrigation_management is management
+
+    def test_missing_field_raises(self, table):
+        with pytest.raises(ValueError):
+            ExperimentBatch.from_table(table)
+
+    def test_unknown_weather_key_raises(self, batch, table, weather):
+        with pytest.raises(KeyError):
+            ExperimentBatch(
+                dict(batch.constants, **batch.columns), {"north": weather["north"]}
+            )
+
+    def test_column(self, batch):
+        assert batch.column("cultivar")[:2] == ["PC0003", "PC0001"]
+        assert batch.column("crop") == ["Maize"] * 4
+        assert batch.column("irrigation") == ["N"] * 4
+        assert isinstance(batch.columns["plant_date"], np.ndarray)
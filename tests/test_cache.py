@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+import pandas as pd
+from io import StringIO
+from pathlib import Path
+from dabbler import Results
+from dabbler.cache import DiskCache, ResultCache
+
+
+@pytest.fixture()
+def results(experiment):
+    outputs = {}
+    for out_file in ["PlantGro.OUT", "Evaluate.OUT", "Summary.OUT", "SoilWatBal.OUT"]:
+        with open(f"test_data/{out_file}", "rb") as f:
+            outputs[out_file] = f.read()
+    with open("test_data/OVERVIEW.OUT", "rb") as f:
+        overview = f.read().decode("unicode_escape")
+    results = Results(experiment, Path("."), outputs)
+    results.read_outputs(overview)
+    return results
+
+
+class TestDiskCache:
+    def test_get_returns_what_was_set(self, tmp_path):
+        cache = DiskCache(tmp_path)
+        cache.set("ab12", b"data")
+
+        assert cache.get("ab12") == b"data"
+        assert cache.get("cd34") is None
+        assert cache.stats()[:2] == (1, 1)
+
+    def test_least_recently_used_evicted(self, tmp_path):
+        cache = DiskCache(tmp_path, max_bytes=25)
+        cache.set("aa", b"0" * 10)
+        time.sleep(0.01)
+        cache.set("bb", b"1" * 10)
+        time.sleep(0.01)
+        cache.get("aa")
+        cache.set("cc", b"2" * 10)
+
+        assert cache.get("bb") is None
+        assert cache.get("aa") is not None
+        assert cache.stats().evictions == 1
+
+    def test_replacing_entry_counts_its_size_once(self, tmp_path):
+        cache = DiskCache(tmp_path)
+        for _ in range(3):
+            cache.set("aa", b"0" * 10)
+
+        assert cache.stats().size_bytes == 10
+
+
+class TestResultCache:
+    def test_results_round_trip(self, tmp_path, experiment, results):
+        cache = ResultCache(tmp_path)
+        cache.put("ab12", results)
+
+        cached = Results(experiment, Path("."), {})
+        assert cache.get("ab12", cached)
+
+        pd.testing.assert_frame_equal(cached.PlantGro, results.PlantGro)
+        pd.testing.assert_frame_equal(cached.Evaluate, results.Evaluate)
+        assert cached.Summary == results.Summary
+        assert cached.SoilWatBal is None
+        assert cached.overview == results.overview
+        assert cached.GrowthTable.equals(results.GrowthTable)
+
+    def test_missing_strings_round_trip(self, tmp_path, experiment, results):
+        table = pd.read_csv(StringIO("RUN NAME X\n1 a 1.5\n2\n"), sep=r"\s+")
+        results.PlantGro = table
+        cache = ResultCache(tmp_path)
+        cache.put("ab12", results)
+
+        cached = Results(experiment, Path("."), {})
+        cache.get("ab12", cached)
+
+        pd.testing.assert_frame_equal(cached.PlantGro, table)
+
+    def test_miss_leaves_results_unread(self, tmp_path, experiment):
+        cached = Results(experiment, Path("."), {})
+        assert not ResultCache(tmp_path).get("ab12", cached)
+        assert not hasattr(cached, "overview")
@@ -2,22 +2,36 @@ import os
 import sys
 import pipes
 import json
+import shutil
 import signal
 import time
+import asyncio
+import threading
+import subprocess
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from dabbler import DSSAT, Experiment, Results
+from dabbler import DSSAT, Experiment, ExperimentBatch, Results, SeasonSummary
+from dabbler.fifo import FifoMultiplexer
+from dabbler.cache import ResultCache
+from dabbler.metrics import MetricsRegistry
+from dabbler.dabbler_errors import SimulationFailedError, NoWeatherInformationError
 import dabbler.soil
+import dabbler.metrics
+import dabbler.file_generator
+import numpy as np
+import pandas as pd
 import difflib
 from datetime import date
 from shapely.geometry import Polygon
 from pathlib import Path
-from threading import Thread
 import pytest
 
 dssat_bin = "/home/george/DSSAT/build/bin"
 dssat_weather = "/home/george/DSSAT/build/Weather"
 dssat_soil = "/home/george/DSSAT/build/Soil"
+if not os.path.isdir(dssat_bin):
+    # Stand in for DSSAT, see fake_dssat/dscsm047
+    dssat_bin = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_dssat")
 
 
 @pytest.fixture(scope="module")
@@ -25,24 +39,6 @@ def dssat_instance():
     return DSSAT(dssat_bin, dssat_weather, dssat_soil)
 
 
-@pytest.fixture(scope="module")
-def experiment():
-    experiment = Experiment(
-        crop="Maize",
-        model="MZIXM",
-        cultivar="PC0003",
-        plant_date=date(1982, 2, 25),
-        harvest_date=date(1982, 6, 25),
-        simulation_start=date(1982, 1, 1),
-        coordinates_latitude=29.6380,
-        coordinates_longitude=-28.3689,
-        weather_station_code="UFGA",
-        soil_code="IBMZ910014",
-    )
-
-    return experiment
-
-
 class TestDabbler:
 
     DSSAT_OUT_FILES = [
@@ -96,7 +92,7 @@ class TestDabbler:
 
     @pytest.fixture()
     def EXP_file(self, dssat_instance, experiment):
-        result = dssat_instance.run(experiment)
+        dssat_instance.run(experiment)
         EXP_file = next(dssat_instance.in_out_location.glob("*.EXP"))
         with open(EXP_file, "r") as f:
             return f.read()
@@ -114,34 +110,24 @@ class TestDabbler:
     def test_EXP_file_generated_correctly(self, EXP_file, reference_EXP_file):
         assert EXP_file == reference_EXP_file
 
-    def test_deploy_write_thread_for_weather(self, dssat_instance, experiment):
+    def test_write_input_files_for_weather(self, dssat_instance, experiment):
         dummy_weather_string = "DUMMY WEATHER"
 
-        test_thread = Thread(
-            target=dssat_instance.deploy_write_threads,
-            args=(dummy_weather_string, "", None),
+        dssat_instance.write_input_files(
+            {"WTH": dummy_weather_string, "EXP": "", "SOIL": None}
         )
-        test_thread.start()
-
-        # Give dabbler time to deploy files
-        time.sleep(0.1)
 
         with open(dssat_instance.in_files["WTH"], "r") as wth:
             output = wth.read()
 
         assert dummy_weather_string == output
 
-    def test_deploy_write_thread_for_soil(self, dssat_instance, experiment):
+    def test_write_input_files_for_soil(self, dssat_instance, experiment):
         dummy_soil_string = "DUMMY SOIL"
 
-        test_thread = Thread(
-            target=dssat_instance.deploy_write_threads,
-            args=(None, "", dummy_soil_string),
+        dssat_instance.write_input_files(
+            {"WTH": None, "EXP": "", "SOIL": dummy_soil_string}
         )
-        test_thread.start()
-
-        # Give dabbler time to deploy files
-        time.sleep(0.1)
 
         with open(dssat_instance.in_files["SOIL"], "r") as soil:
             output = soil.read()
@@ -154,6 +140,152 @@ class TestDabbler:
     def test_run_returns_results(self, dssat_instance, experiment):
         assert isinstance(dssat_instance.run(experiment, supress_stdout=False), Results)
 
+    def test_run_async_returns_results(self, experiment):
+        async def run_in_slots():
+            instances = [
+                DSSAT(dssat_bin, dssat_weather, dssat_soil, slot=slot)
+                for slot in range(2)
+            ]
+            return await asyncio.gather(
+                *[instance.run_async(experiment) for instance in instances]
+            )
+
+        for result in asyncio.run(run_in_slots()):
+            assert len(result.PlantGro) > 10
+
+    def test_run_async_prepares_and_parses_off_the_event_loop(
+        self, experiment, monkeypatch
+    ):
+        instance = DSSAT(dssat_bin, dssat_soil, slot="async_threads")
+        threads = []
+        for method in ("_start_run", "_finish_run"):
+
+            def record_thread(*args, method=getattr(instance, method)):
+                threads.append(threading.current_thread())
+                return method(*args)
+
+            monkeypatch.setattr(instance, method, record_thread)
+
+        result = asyncio.run(instance.run_async(experiment))
+        assert len(result.PlantGro) > 10
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+
+    def test_run_async_on_one_instance_across_event_loops(self, experiment):
+        instance = DSSAT(dssat_bin, dssat_weather, dssat_soil, slot=2)
+
+        async def run_twice():
+            # The second run waits on the first, tying the lock to this loop
+            return await asyncio.gather(
+                instance.run_async(experiment), instance.run_async(experiment)
+            )
+
+        for _ in range(2):
+            for result in asyncio.run(run_twice()):
+                assert len(result.PlantGro) > 10
+
+    def test_run_many_returns_results_in_input_order(self, dssat_instance, experiment):
+        experiments = [
+            experiment._replace(plant_date=date(1982, 2, day)) for day in (20, 25, 28)
+        ]
+        results = list(dssat_instance.run_many(experiments, workers=2))
+        assert [r.experiment.plant_date for r in results] == [
+            e.plant_date for e in experiments
+        ]
+
+    def test_run_many_runs_experiment_batch(self, dssat_instance, experiment):
+        batch = ExperimentBatch.from_experiments(
+            experiment._replace(plant_date=date(1982, 2, day)) for day in range(1, 11)
+        )
+        results = list(dssat_instance.run_many(batch, workers=2))
+        assert [r.experiment for r in results] == list(batch)
+        assert all(len(r.PlantGro) > 10 for r in results)
+
+    @pytest.mark.parametrize("as_batch", [False, True])
+    def test_run_many_fails_runs_alone(self, dssat_instance, experiment, as_batch):
+        experiments = [experiment] * 8
+        # Not in the soil file, run in a slice of two when sent as a batch
+        experiments[1] = experiment._replace(soil_code="IBMZ919999")
+        if as_batch:
+            experiments = ExperimentBatch.from_experiments(experiments)
+        results = list(dssat_instance.run_many(experiments, workers=1))
+
+        assert [r.experiment for r in results] == list(experiments)
+        with pytest.raises(SimulationFailedError, match="IBMZ919999"):
+            results[1].PlantGro
+        assert results[1].metrics.returncode == 99
+        assert all(len(r.PlantGro) > 10 for i, r in enumerate(results) if i != 1)
+
+    def test_run_many_keeps_workers_between_calls(self, experiment):
+        instance = DSSAT(dssat_bin, dssat_soil, slot="pool")
+        list(instance.run_many([experiment], workers=2))
+        dssat_pool = instance._pool
+        results = list(instance.run_many([experiment], workers=2))
+        assert instance._pool is dssat_pool
+        assert len(results[0].PlantGro) > 10
+        instance.close()
+        assert instance._pool is None
+
+    def test_run_batch_returns_result_per_experiment(self, dssat_instance, experiment):
+        experiments = [
+            experiment._replace(plant_date=date(1982, 2, day)) for day in (20, 25, 28)
+        ]
+        results = dssat_instance.run_batch(experiments)
+        assert len(results) == len(experiments)
+        for result, batch_experiment in zip(results, experiments):
+            assert result.experiment.plant_date == batch_experiment.plant_date
+            assert len(result.PlantGro) > 10
+
+    def test_same_weather_generated_and_written_once(
+        self, dssat_instance, experiment, monkeypatch
+    ):
+        days = pd.date_range("1982-01-01", "1982-12-31")
+        weather = pd.DataFrame(
+            {"@DATE": days.strftime("%y%j"), "SRAD": 20.0, "TMAX": 30.0, "TMIN": 15.0}
+        )
+        experiment = experiment._replace(weather_station_code=None, weather_data=weather)
+        dssat_instance.run(experiment)
+        wth_file = dssat_instance.in_files["WTH"]
+        written = wth_file.stat().st_mtime_ns
+
+        generated = []
+        monkeypatch.setattr(
+            dabbler.file_generator, "generate_weather_file_string", generated.append
+        )
+        dssat_instance.run(experiment._replace(weather_data=weather.copy()))
+
+        assert generated == []
+        assert wth_file.stat().st_mtime_ns == written
+
+    def test_batch_runs_share_weather_file(self, dssat_instance, experiment):
+        days = pd.date_range("1982-01-01", "1982-12-31")
+        weather = pd.DataFrame({"@DATE": days.strftime("%y%j"), "TMAX": 30.0})
+        experiments = [
+            experiment._replace(
+                weather_station_code=None, weather_data=weather, cultivar=cultivar
+            )
+            for cultivar in ("PC0001", "PC0002", "PC0003")
+        ]
+
+        results = dssat_instance.run_batch(experiments)
+
+        assert {r.experiment.weather_station_code for r in results} == {"WTHB0001"}
+
+    def test_no_weather_information_raises(self, dssat_instance, experiment):
+        no_weather = experiment._replace(weather_station_code=None)
+
+        with pytest.raises(NoWeatherInformationError):
+            dssat_instance.run(no_weather)
+
+    def test_input_file_rewritten_once_removed(self, dssat_instance):
+        in_file = dssat_instance.in_files["SOIL"]
+
+        assert dssat_instance.write_input_file("SOIL", in_file)
+        assert not dssat_instance.write_input_file("SOIL", in_file)
+        in_file.unlink()
+        assert dssat_instance.write_input_file("SOIL", in_file)
+        in_file.unlink()
+
     def test_run_with_experiment_with_custom_soil_data(
         self, dssat_instance, experiment_with_custom_soil
     ):
@@ -166,39 +298,419 @@ class TestDabbler:
 
 
 class TestResults:
-    @pytest.fixture(scope="module")
-    def empty_results_instance(self, dssat_instance):
-        return Results(dssat_instance.out_fifos, "maize")
-
-    def test_all_read_threads_exit(self, dssat_instance, experiment):
-        results = dssat_instance.run(experiment)
-        for read_thread in results.read_threads:
-            assert not results.read_threads[read_thread].is_alive()
-
-    # def test_start_read_threads(self, empty_results_instance):
-    # NOTE: works with DSSAT but hard to mimic DSSAT writing to pipe behaviour
-    #       with python so commented out for now.
-    #
-    #        read_threads = empty_results_instance.start_read_threads()
-    #        for fifo in sorted(empty_results_instance.output_fifos):
-    #            fifo_loc = empty_results_instance.output_fifos[fifo]
-    #            with Timeout(seconds=1):
-    #                t = pipes.Template()
-    #                f = t.open(fifo_loc, 'w')
-    #                with open(f'test_data/{fifo}', 'r') as example:
-    #                    # Write test string to check pipe is open. Will block if not.
-    #                    example_str = example.read()
-    #                    f.write(example_str)
-    #
-    #        for read_thread_name, read_thread in read_threads.items():
-    #            print('-----------')
-    #            print(read_thread_name)
-    #            print(read_thread.is_alive())
-    #            print('-----------')
-    #
-    #        assert False
-    #
-    #        assert True
+    def test_split_runs_gives_each_run_its_own_table(self):
+        with open("test_data/PlantGro.OUT", "rb") as f:
+            plant_gro = f.read()
+        header_start = plant_gro.index(b"\n@") + 1
+        second_run = b"*RUN   2\n\n" + plant_gro[header_start:]
+
+        run_outputs = Results.split_runs({"PlantGro.OUT": plant_gro + second_run}, 2)
+
+        assert run_outputs[0]["PlantGro.OUT"] == plant_gro
+        assert run_outputs[1]["PlantGro.OUT"] == plant_gro
+
+    def test_split_runs_by_run_number(self):
+        with open("test_data/PlantGro.OUT", "rb") as f:
+            plant_gro = f.read()
+        header_start = plant_gro.index(b"\n@") + 1
+        # Run 2 wrote nothing
+        third_run = b"*RUN   3\n\n" + plant_gro[header_start:]
+
+        run_outputs = Results.split_runs({"PlantGro.OUT": plant_gro + third_run}, 3)
+
+        assert run_outputs[0]["PlantGro.OUT"] == plant_gro
+        assert run_outputs[1]["PlantGro.OUT"] == b""
+        assert run_outputs[2]["PlantGro.OUT"] == plant_gro
+
+    def test_split_overview_by_run_number(self):
+        overview = "*DSSAT\n\n*RUN   1 : FIRST\nA\n*RUN   3 : THIRD\nC\n"
+
+        run_overviews = Results.split_overview(overview, 3)
+
+        assert run_overviews == [
+            "*DSSAT\n\n*RUN   1 : FIRST\nA",
+            "",
+            "*DSSAT\n\n*RUN   3 : THIRD\nC\n",
+        ]
+
+    def test_all_fifo_readers_closed_after_run(self, dssat_instance, experiment):
+        dssat_instance.run(experiment)
+        assert dssat_instance.io.readers == {}
+        assert not dssat_instance.io.selector.get_map()
+
+    def test_summary_read_into_season_summary(self):
+        with open("test_data/Summary.OUT", "r") as f:
+            summary = SeasonSummary.from_row(f.read().splitlines()[0])
+
+        assert summary.treatment_name == "RAINFED HIGH NITROGEN"
+        assert summary.planting_date == date(1982, 2, 25)
+        assert summary.harvest_date == date(1982, 6, 25)
+        assert summary.maturity_date is None
+        assert summary.yield_weight == 10183
+        assert summary.values["PRCP"] == 623.3
+        assert summary.values["EPCP"] == 305.2
+
+    def test_summary_overflowed_fields_read_as_missing(self):
+        with open("test_data/Summary.OUT", "r") as f:
+            row = f.read().splitlines()[0]
+        # Overflow the harvest index field and mark rainfall missing as -99.0
+        summary = SeasonSummary.from_row(row)
+        hiam, prcp = str(summary.harvest_index), str(summary.values["PRCP"])
+        row = row.replace(f" {hiam} ", " " + "*" * len(hiam) + " ", 1)
+        row = row.replace(f" {prcp} ", " " + "-99.0".rjust(len(prcp)) + " ", 1)
+
+        summary = SeasonSummary.from_row(row)
+
+        assert summary.harvest_index is None
+        assert summary.values["PRCP"] is None
+        assert summary.yield_weight == 10183
+
+    def test_split_runs_splits_summary_by_run_number(self):
+        with open("test_data/Summary.OUT", "rb") as f:
+            first_run = f.read()
+        second_run = b"        2" + first_run[9:]
+
+        run_outputs = Results.split_runs({"Summary.OUT": first_run + second_run}, 2)
+
+        assert run_outputs[0]["Summary.OUT"] == first_run
+        assert run_outputs[1]["Summary.OUT"] == second_run
+
+    def test_usecols_keeps_only_selected_columns(self, experiment):
+        with open("test_data/PlantGro.OUT", "rb") as f:
+            outputs = {"PlantGro.OUT": f.read()}
+        results = Results(
+            experiment, Path("."), outputs, {"PlantGro.OUT": ["LAID", "CWAD"]}
+        )
+        results.read_outputs(overview="")
+
+        assert list(results.PlantGro.columns) == ["LAID", "CWAD"]
+        assert results.PlantGro.index[0] == 1982056
+
+    def test_tables_parsed_on_first_access(self, experiment):
+        with open("test_data/PlantGro.OUT", "rb") as f:
+            results = Results(experiment, Path("."), {"PlantGro.OUT": f.read()})
+        results.read_outputs(overview="")
+
+        assert "PlantGro" not in vars(results)
+        plant_gro = results.PlantGro
+        assert results.PlantGro is plant_gro
+
+        results.release()
+        assert results.outputs == {}
+        assert results.PlantGro is plant_gro
+
+    def test_tables_not_read_before_release_are_dropped(self, experiment):
+        with open("test_data/PlantGro.OUT", "rb") as f:
+            results = Results(experiment, Path("."), {"PlantGro.OUT": f.read()})
+        results.read_outputs(overview="")
+        results.release()
+
+        with pytest.raises(AttributeError):
+            results.PlantGro
+
+    def test_growth_table_needs_plant_gro_read_before_release(self, experiment):
+        with open("test_data/PlantGro.OUT", "rb") as f:
+            plant_gro = f.read()
+        with open("test_data/OVERVIEW.OUT", "rb") as f:
+            overview = f.read().decode("unicode_escape")
+        unread = Results(experiment, Path("."), {"PlantGro.OUT": plant_gro})
+        unread.read_outputs(overview=overview)
+        read = Results(experiment, Path("."), {"PlantGro.OUT": plant_gro})
+        read.read_outputs(overview=overview)
+        read.PlantGro
+        unread.release()
+        read.release()
+
+        with pytest.raises(AttributeError, match="released"):
+            unread.GrowthTable
+        assert read.GrowthTable["Start"].notna().any()
+
+    def test_only_selected_output_fifos_created(self, experiment):
+        instance = DSSAT(
+            dssat_bin, dssat_soil, slot="outputs", outputs=["PlantGro.OUT"]
+        )
+        fifos_created = [x.name for x in instance.in_out_location.glob("*.OUT")]
+        assert fifos_created == ["PlantGro.OUT"]
+
+        result = instance.run(experiment)
+        assert len(result.PlantGro) > 10
+        assert not hasattr(result, "ET")
+
+    def test_parse_time_recorded_in_instance_registry(self, experiment):
+        registry = MetricsRegistry()
+        instance = DSSAT(
+            dssat_bin, dssat_soil, slot="metrics", metrics_registry=registry
+        )
+        default_parses = dabbler.metrics.registry.phase_counts.get("parse", 0)
+        instance.run(experiment).PlantGro
+        result = next(instance.run_many([experiment], workers=1))
+        result.PlantGro
+
+        assert registry.phase_counts["parse"] == 2
+        assert dabbler.metrics.registry.phase_counts.get("parse", 0) == default_parses
+
+    def test_summary_only_run_reads_summary_alone(self, dssat_instance, experiment):
+        result = dssat_instance.run(experiment, summary_only=True)
+        assert isinstance(result.Summary, SeasonSummary)
+        assert not hasattr(result, "PlantGro")
+
+
+class TestFailedRun:
+    @pytest.fixture()
+    def failing_dssat(self, tmp_path):
+        # Stand in for DSSAT stopping on bad input
+        exe = tmp_path / "dscsm047"
+        exe.write_text("#!/bin/sh\necho 'Bad soil profile' > ERROR.OUT\nexit 99\n")
+        exe.chmod(0o755)
+        return DSSAT(tmp_path, tmp_path, slot="failing")
+
+    def test_error_log_raised_with_exit_code(self, failing_dssat, experiment):
+        with Timeout(seconds=2):
+            with pytest.raises(SimulationFailedError) as error:
+                failing_dssat.run(experiment)
+
+        assert error.value.returncode == 99
+        assert "Bad soil profile" in error.value.logs["ERROR.OUT"]
+        assert "Bad soil profile" in str(error.value)
+        assert failing_dssat.dssat_proc.returncode == 99
+        assert failing_dssat.last_metrics.returncode == 99
+        assert not (failing_dssat.in_out_location / "ERROR.OUT").exists()
+
+    @pytest.mark.parametrize("run", ["run", "run_async"])
+    def test_fifos_closed_if_one_fails_to_open(self, experiment, run):
+        instance = DSSAT(dssat_bin, dssat_soil, slot=f"unopened_{run}")
+        instance.out_fifos["Weather.OUT"].unlink()
+        open_fds = len(os.listdir("/proc/self/fd"))
+
+        with pytest.raises(FileNotFoundError):
+            if run == "run":
+                instance.run(experiment)
+            else:
+                asyncio.run(instance.run_async(experiment))
+
+        assert len(os.listdir("/proc/self/fd")) == open_fds
+        assert instance.io.readers == {}
+
+    @pytest.fixture()
+    def hanging_dssat(self, tmp_path):
+        # Stand in for DSSAT hanging without ever closing its outputs
+        exe = tmp_path / "dscsm047"
+        exe.write_text("#!/bin/sh\nexec sleep 30\n")
+        exe.chmod(0o755)
+        return DSSAT(tmp_path, tmp_path, slot="hanging", timeout=0.5)
+
+    def test_hung_run_killed_after_timeout(self, hanging_dssat, experiment):
+        with Timeout(seconds=5):
+            with pytest.raises(SimulationFailedError) as error:
+                hanging_dssat.run(experiment)
+
+        assert "did not finish within 0.5 s" in str(error.value)
+        assert hanging_dssat.dssat_proc.returncode == -signal.SIGKILL
+        assert hanging_dssat.last_metrics.returncode == -signal.SIGKILL
+
+    def test_hung_batch_launch_allowed_timeout_per_run(
+        self, hanging_dssat, experiment
+    ):
+        with Timeout(seconds=5):
+            with pytest.raises(SimulationFailedError) as error:
+                hanging_dssat.run_batch([experiment, experiment])
+
+        assert "did not finish within 1.0 s" in str(error.value)
+
+    def test_hung_async_run_killed_after_timeout(self, hanging_dssat, experiment):
+        with Timeout(seconds=5):
+            with pytest.raises(SimulationFailedError) as error:
+                asyncio.run(hanging_dssat.run_async(experiment))
+
+        assert "did not finish within 0.5 s" in str(error.value)
+        assert hanging_dssat.dssat_proc.returncode == -signal.SIGKILL
+
+
+@pytest.mark.skipif(
+    not dssat_bin.endswith("fake_dssat"), reason="Tests the stand-in DSSAT"
+)
+class TestFakeDSSAT:
+    def test_writes_only_switched_on_outputs(self, experiment, tmp_path, monkeypatch):
+        log = tmp_path / "fake.log"
+        monkeypatch.setenv("DABBLER_FAKE_DSSAT_LOG", str(log))
+        instance = DSSAT(dssat_bin, dssat_soil, slot="fake", outputs=["ET.OUT"])
+        instance.run(experiment)
+
+        written = {
+            line.split()[1]
+            for line in log.read_text().splitlines()
+            if line.startswith("write")
+        }
+        # WAOUT is on for ET.OUT, GROUT and NIOUT are off
+        assert "ET.OUT" in written
+        assert not written & {"PlantGro.OUT", "PlantN.OUT", "Weather.OUT"}
+
+    def test_reads_weather_and_soil(self, dssat_instance, experiment, monkeypatch):
+        log = dssat_instance.in_out_location / "fake.log"
+        monkeypatch.setenv("DABBLER_FAKE_DSSAT_LOG", str(log))
+        dssat_instance.run(experiment)
+
+        lines = log.read_text().splitlines()
+        log.unlink()
+        assert [line for line in lines if line.startswith("read")] == [
+            "read UFGA8201.WTH",
+            "read IB.SOL",
+        ]
+
+    @pytest.mark.parametrize(
+        "field, code, in_file, content, message",
+        [
+            ("weather_station_code", "NONE", None, None, "Weather file not found"),
+            (
+                "weather_station_code",
+                "BADW",
+                "BADW8201.WTH",
+                "*WEATHER DATA : BADW\n\n@DATE  SRAD  TMAX\n82001   7.9  high\n",
+                "Malformed weather file",
+            ),
+            ("soil_code", "XXNONE0001", None, None, "Soil profile not found"),
+            (
+                "soil_code",
+                "BADS000001",
+                "SOIL.SOL",
+                "*BADS000001  XXX\n@  SLB SLMH  SLLL\n     5 A    low\n",
+                "Malformed soil profile",
+            ),
+        ],
+    )
+    def test_missing_or_malformed_input_fails(
+        self, experiment, field, code, in_file, content, message
+    ):
+        instance = DSSAT(dssat_bin, dssat_soil, slot="inputs")
+        if in_file is not None:
+            (instance.in_out_location / in_file).write_text(content)
+
+        with pytest.raises(SimulationFailedError) as error:
+            instance.run(experiment._replace(**{field: code}))
+
+        instance.clean_in_out_on_exit()
+        assert error.value.returncode == 99
+        assert message in error.value.logs["ERROR.OUT"]
+
+    def test_cache_missed_once_station_file_edited(self, experiment, tmp_path):
+        instance = DSSAT(
+            dssat_bin, dssat_soil, slot="cached", cache=ResultCache(tmp_path)
+        )
+        station_file = instance.in_out_location / "UFGA8201.WTH"
+        shutil.copy(Path(dssat_bin, "Weather", "UFGA8201.WTH"), station_file)
+        instance.run(experiment)
+        instance.run(experiment)
+        assert instance.cache.stats()[:2] == (1, 1)
+
+        station_file.write_text(station_file.read_text().replace("82001", "82001 "))
+        instance.run(experiment)
+
+        instance.clean_in_out_on_exit()
+        assert instance.cache.stats()[:2] == (1, 2)
+
+    def test_cached_tables_stored_parsed(self, experiment, tmp_path):
+        instance = DSSAT(
+            dssat_bin,
+            dssat_soil,
+            slot="cached_tables",
+            outputs=["PlantGro.OUT", "ET.OUT"],
+            cache=ResultCache(tmp_path),
+        )
+        first = instance.run(experiment)
+        second = instance.run(experiment)
+
+        instance.clean_in_out_on_exit()
+        assert second.metrics.cache_hit
+        pd.testing.assert_frame_equal(second.PlantGro, first.PlantGro)
+        (entry,) = tmp_path.glob("**/*.npz")
+        with np.load(entry) as archive:
+            assert "PlantGro.OUT:LAID" in archive.files
+            assert not [name for name in archive.files if name.endswith(":raw")]
+
+    def test_scale_repeats_daily_rows(self, dssat_instance, experiment, monkeypatch):
+        rows = len(dssat_instance.run(experiment).PlantGro)
+        monkeypatch.setenv("DABBLER_FAKE_DSSAT_SCALE", "3")
+
+        assert len(dssat_instance.run(experiment).PlantGro) == 3 * rows
+
+    def test_batch_run_with_no_output_fails_alone(
+        self, dssat_instance, experiment, monkeypatch
+    ):
+        monkeypatch.setenv("DABBLER_FAKE_DSSAT_SKIP", "2")
+
+        results = dssat_instance.run_batch([experiment] * 3)
+
+        assert isinstance(results[1].error, SimulationFailedError)
+        with pytest.raises(SimulationFailedError):
+            results[1].PlantGro
+        for result in (results[0], results[2]):
+            assert result.error is None
+            assert len(result.PlantGro) > 10
+            assert result.Summary.yield_weight == 10183
+
+    def test_max_rss_is_dssat_memory_alone(self, experiment, monkeypatch):
+        instance = DSSAT(dssat_bin, dssat_soil, slot="memory")
+        monkeypatch.setenv("DABBLER_FAKE_DSSAT_DELAY", "0.3")
+        ballast = bytearray(b"\x01") * 300 * 2**20  # Touched, so resident
+
+        result = instance.run(experiment)
+
+        instance.clean_in_out_on_exit()
+        assert len(ballast) == 300 * 2**20
+        # The stand-in is a small Python script
+        assert 0 < result.metrics.max_rss < 100 * 2**20
+
+    def test_fail_exits_with_code(self, dssat_instance, experiment, monkeypatch):
+        monkeypatch.setenv("DABBLER_FAKE_DSSAT_FAIL", "7")
+
+        with pytest.raises(SimulationFailedError) as error:
+            dssat_instance.run(experiment)
+
+        assert error.value.returncode == 7
+        assert "Simulated failure" in error.value.logs["ERROR.OUT"]
+
+
+class TestFifoMultiplexer:
+    @pytest.fixture()
+    def out_fifos(self, tmp_path):
+        out_fifos = {}
+        for out_file in ["PlantGro.OUT", "ET.OUT"]:
+            os.mkfifo(tmp_path / out_file)
+            out_fifos[out_file] = tmp_path / out_file
+        return out_fifos
+
+    def test_collects_fifo_output_until_process_exits(self, out_fifos):
+        io = FifoMultiplexer()
+        io.open(out_fifos)
+        # Stand in for DSSAT: write each example output to its fifo
+        writer = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import sys, pathlib\n"
+                "for fifo in map(pathlib.Path, sys.argv[1:]):\n"
+                "    fifo.write_bytes(pathlib.Path('test_data', fifo.name).read_bytes())",
+                *[str(fifo) for fifo in out_fifos.values()],
+            ]
+        )
+        io.wait(writer)
+        outputs = io.close()
+
+        for out_file in out_fifos:
+            with open(f"test_data/{out_file}", "rb") as example:
+                assert outputs[out_file] == example.read()
+        assert not io.selector.get_map()
+
+    def test_wait_ends_when_process_exits(self, out_fifos):
+        io = FifoMultiplexer(poll_interval=10)
+        io.open(out_fifos)
+        proc = subprocess.Popen([sys.executable, "-c", "raise SystemExit(3)"])
+        start = time.monotonic()
+        io.wait(proc)
+        io.close()
+
+        assert proc.returncode == 3
+        assert time.monotonic() - start < 5
 
 
 class Timeout:
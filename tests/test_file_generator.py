@@ -0,0 +1,120 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+import pandas as pd
+from datetime import date, timedelta
+from dabbler import Experiment, AutomaticIrrigationManagement
+from dabbler import file_generator
+from dabbler.templates import CompiledTemplate
+
+
+@pytest.fixture()
+def experiments(experiment):
+    return [
+        experiment,
+        experiment._replace(plant_date=date(2000, 3, 1), plant_end=date(2000, 3, 9)),
+        experiment._replace(
+            cultivar="PC0001",
+            irrigation="A",
+            irrigation_management=AutomaticIrrigationManagement(irrigation_amount=20),
+        ),
+    ]
+
+
+class TestFormatDate:
+    def test_matches_strftime(self):
+        days = [date(1899, 12, 25) + timedelta(days=n) for n in range(0, 50000, 7)]
+
+        assert [file_generator.format_date(day) for day in days] == [
+            day.strftime("%y%j") for day in days
+        ]
+        assert file_generator.format_dates(days) == [
+            day.strftime("%y%j") for day in days
+        ]
+
+    def test_leap_days(self):
+        assert file_generator.format_date(date(2000, 12, 31)) == "00366"
+        assert file_generator.format_date(date(1900, 3, 1)) == "00060"
+        assert file_generator.format_dates([date(2024, 3, 1)]) == ["24061"]
+
+
+class TestCompiledTemplate:
+    def test_renders_as_format(self):
+        template = "A {X: >4} {{B}} {Y:<3}|{X} end"
+        terms = {"X": "ab", "Y": 7}
+
+        compiled = CompiledTemplate(template)
+
+        assert compiled.render(terms) == template.format(**terms)
+        assert compiled.render_many({"X": ["ab", "c"], "Y": 7}, 2) == [
+            template.format(X="ab", Y=7),
+            template.format(X="c", Y=7),
+        ]
+
+
+class TestGenerateExperimentFileStrings:
+    def test_matches_one_at_a_time(self, experiments):
+        columns = {
+            field: [getattr(experiment, field) for experiment in experiments]
+            for field in Experiment._fields
+        }
+
+        assert file_generator.generate_experiment_file_strings(
+            columns, {"GROUT": "N"}
+        ) == [
+            file_generator.generate_experiment_file_string(experiment, {"GROUT": "N"})
+            for experiment in experiments
+        ]
+
+    def test_from_dataframe_with_defaults(self, experiment):
+        parameters = pd.DataFrame(
+            {
+                "crop": "Maize",
+                "model": "MZIXM",
+                "cultivar": ["PC0003", "PC0001"],
+                "plant_date": pd.to_datetime(["1982-02-25", "1982-03-10"]),
+                "harvest_date": pd.Timestamp("1982-06-25"),
+                "simulation_start": pd.Timestamp("1982-01-01"),
+                "weather_station_code": "UFGA",
+                "soil_code": "IBMZ910014",
+            }
+        )
+
+        exp_strings = file_generator.generate_experiment_file_strings(parameters)
+
+        assert exp_strings[0] == file_generator.generate_experiment_file_string(
+            experiment
+        )
+        assert " 82069 " in exp_strings[1]
+
+    def test_missing_soil_code_raises(self, experiment):
+        with pytest.raises(ValueError):
+            file_generator.generate_experiment_file_strings(
+                {"crop": ["Maize"], "soil_code": [None]}
+            )
+
+
+class TestGetWeatherFileString:
+    def test_same_weather_generated_once(self, experiment, monkeypatch):
+        days = pd.date_range("1990-01-01", "1990-12-31")
+        weather = pd.DataFrame(
+            {"@DATE": days.strftime("%y%j"), "SRAD": 18.0, "TMAX": 28.0, "TMIN": 12.0}
+        )
+        experiment = experiment._replace(weather_station_code=None, weather_data=weather)
+        generated = []
+
+        def generate(experiment):
+            generated.append(experiment)
+            return "weather"
+
+        monkeypatch.setattr(file_generator, "generate_weather_file_string", generate)
+        first = file_generator.get_weather_file_string(experiment)
+        second = file_generator.get_weather_file_string(
+            experiment._replace(weather_data=weather.copy())
+        )
+        file_generator._get_weather_file_string.cache_clear()  # Drop the stand in
+
+        assert first == second == "weather"
+        assert len(generated) == 1
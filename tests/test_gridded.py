@@ -0,0 +1,151 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+import numpy as np
+import pandas as pd
+import pyproj
+
+xr = pytest.importorskip("xarray")
+from dabbler import gridded, weather
+from dabbler.gridded import GriddedWeather
+
+TO_LCC = pyproj.Transformer.from_crs("EPSG:4326", gridded.DAYMET_CRS, always_xy=True)
+
+
+@pytest.fixture()
+def daymet():
+    # 20 x 15 km around central Iowa, y descending as in DayMet's files
+    x0, y0 = TO_LCC.transform(-93.5, 42.0)
+    x = np.round(x0) + 1000.0 * np.arange(20)
+    y = np.round(y0) - 1000.0 * np.arange(15)
+    time = pd.date_range("2019-01-01", periods=365)
+    shape = (len(time), len(y), len(x))
+    # Maximum temperature encodes the cell, 100 * row + column
+    tmax = (100.0 * np.arange(len(y))[:, None] + np.arange(len(x)))[None]
+    return xr.Dataset(
+        {
+            "dayl": (("time", "y", "x"), np.full(shape, 36000.0)),
+            "prcp": (("time", "y", "x"), np.full(shape, 2.5)),
+            "srad": (("time", "y", "x"), np.full(shape, 300.0)),
+            "tmax": (("time", "y", "x"), np.broadcast_to(tmax, shape).copy()),
+            "tmin": (("time", "y", "x"), np.full(shape, -5.0)),
+            "elevation": (("y", "x"), np.full(shape[1:], 283.0)),
+        },
+        coords={"time": time, "y": y, "x": x},
+    )
+
+
+def cell_centre(dataset, row, column):
+    lon, lat = TO_LCC.transform(
+        dataset.x[column].item(), dataset.y[row].item(), direction="INVERSE"
+    )
+    return (lon, lat)
+
+
+class TestGriddedWeather:
+    def test_nearest_cell(self, daymet, monkeypatch):
+        # Blocks smaller than the grid, so points are read from several
+        monkeypatch.setattr(gridded, "BLOCK_SIZE", 4)
+        points = [cell_centre(daymet, 5, 3), cell_centre(daymet, 2, 10)]
+
+        extracted = GriddedWeather(daymet).extract(points, [2019])
+
+        field_df, elev, t_avg = extracted[points[0], 2019]
+        assert list(field_df.columns) == ["@DATE", "RAIN", "SRAD", "TMAX", "TMIN"]
+        assert len(field_df) == 365
+        assert field_df["@DATE"].iloc[0] == 19001
+        assert (field_df["TMAX"] == 503).all()
+        np.testing.assert_allclose(field_df["SRAD"], 300 * 36000 / 1e6)
+        assert (field_df["RAIN"] == 2.5).all()
+        assert elev == 283
+        assert t_avg == (503 - 5) / 2
+        assert (extracted[points[1], 2019][0]["TMAX"] == 210).all()
+
+    def test_same_as_single_pixel_api(self, daymet):
+        point = cell_centre(daymet, 5, 3)
+        table = pd.DataFrame(
+            {
+                "dayl (s)": 36000.0,
+                "prcp (mm/day)": 2.5,
+                "srad (W/m^2)": 300.0,
+                "tmax (deg c)": 503.0,
+                "tmin (deg c)": -5.0,
+            },
+            index=range(365),
+        )
+
+        field_df, _, _ = GriddedWeather(daymet).extract([point], [2019])[point, 2019]
+
+        pd.testing.assert_frame_equal(
+            field_df, weather._daymet_to_dssat(table, 283, 2019)[0]
+        )
+
+    def test_bilinear(self, daymet):
+        row, column = cell_centre(daymet, 5, 3), cell_centre(daymet, 6, 4)
+        between = ((row[0] + column[0]) / 2, (row[1] + column[1]) / 2)
+
+        gridded_weather = GriddedWeather(daymet, method="bilinear")
+        field_df = gridded_weather.extract([between], [2019])[between, 2019][0]
+
+        np.testing.assert_allclose(field_df["TMAX"], 553.5, atol=0.5)
+
+        # Cells with no data are left out
+        daymet["tmax"][:, 6, :] = np.nan
+        field_df = gridded_weather.extract([between], [2019])[between, 2019][0]
+        np.testing.assert_allclose(field_df["TMAX"], 503.5, atol=0.5)
+
+    def test_power_grid(self):
+        lat = np.arange(40, 45, 0.5)
+        lon = np.arange(-96.25, -90, 0.625)
+        time = pd.date_range("2020-01-01", "2020-12-31")
+        values = np.ones((len(time), len(lat), len(lon)))
+        variables = {
+            name: (("time", "lat", "lon"), values * i)
+            for i, name in enumerate(gridded.VARIABLES["NASA-POWER"], start=1)
+        }
+        dataset = xr.Dataset(variables, coords={"time": time, "lat": lat, "lon": lon})
+        dataset["T2M_MAX"][:, 4, 2] = 30.0
+        # Missing, as gridded data and as the POWER API write it
+        dataset["WS2M"][0, 4, 2] = np.nan
+        dataset["RH2M"][1, 4, 2] = -999
+
+        point = (-95.0, 42.1)
+        extracted = weather.fetch_weather(
+            [point], [2020], source=GriddedWeather(dataset, source="NASA-POWER")
+        )
+
+        dssat_weather, elevation, _ = extracted[point, 2020]
+        assert len(dssat_weather) == 366
+        assert dssat_weather["@DATE"].iloc[-1] == "20366"
+        assert (dssat_weather["TMAX"] == 30).all()
+        assert (dssat_weather["WIND"][1:] == int(5 * 86.4)).all()
+        assert dssat_weather["WIND"].iloc[0] == -99
+        assert dssat_weather["RHUM"].iloc[1] == -99
+        assert elevation == -99
+        table = pd.DataFrame(
+            {
+                "YEAR": 2020,
+                "DOY": range(1, 367),
+                **{name: dataset[name][:, 4, 2].to_numpy() for name in dataset},
+            }
+        )
+        expected = weather._power_to_dssat(table, -99.0)[0]
+        pd.testing.assert_frame_equal(dssat_weather, expected)
+
+    def test_netcdf_file(self, daymet, tmp_path):
+        pytest.importorskip("scipy")
+        path = tmp_path / "daymet_2019.nc"
+        daymet.to_netcdf(path)
+        point = cell_centre(daymet, 7, 12)
+
+        field_df = GriddedWeather(path).extract([point], [2019])[point, 2019][0]
+
+        assert (field_df["TMAX"] == 712).all()
+
+    def test_outside_grid_raises(self, daymet):
+        with pytest.raises(ValueError):
+            GriddedWeather(daymet).extract([(-80.0, 35.0)], [2019])
+        with pytest.raises(KeyError):
+            GriddedWeather(daymet).extract([cell_centre(daymet, 1, 1)], [2018])
@@ -0,0 +1,89 @@
+import os
+import sys
+import pickle
+import resource
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+from dabbler.metrics import RunMetrics, MetricsRegistry
+
+
+@pytest.fixture()
+def run_metrics():
+    run_metrics = RunMetrics("B", runs=3)
+    run_metrics.add("write", 0.5)
+    run_metrics.add("subprocess", 2.0)
+    run_metrics.add("read", 1.0)
+    run_metrics.returncode = 0
+    return run_metrics
+
+
+class TestRunMetrics:
+    def test_time_adds_to_phase(self):
+        run_metrics = RunMetrics()
+        with run_metrics.time("write"):
+            pass
+        with run_metrics.time("write"):
+            pass
+
+        assert list(run_metrics.phases) == ["write"]
+        assert run_metrics.phases["write"] >= 0
+
+    def test_read_not_counted_twice_in_wall_time(self, run_metrics):
+        assert run_metrics.wall_time == 2.5
+
+    def test_set_rusage(self):
+        run_metrics = RunMetrics()
+        run_metrics.set_rusage(resource.getrusage(resource.RUSAGE_SELF))
+
+        assert run_metrics.cpu_user > 0
+        # ru_maxrss counts the memory of the parent DSSAT was forked from
+        assert run_metrics.max_rss is None
+
+
+class TestMetricsRegistry:
+    def test_record_adds_to_totals(self, run_metrics):
+        registry = MetricsRegistry()
+        registry.record(run_metrics)
+        run_metrics.returncode = 99
+        registry.record(run_metrics)
+
+        assert registry.launches == 2
+        assert registry.runs == 6
+        assert registry.failures == 1
+        assert registry.phase_seconds["subprocess"] == 4.0
+        assert registry.phase_counts["write"] == 2
+
+    def test_recorded_run_keeps_registry_in_process(self, run_metrics):
+        registry = MetricsRegistry()
+        registry.record(run_metrics)
+
+        assert run_metrics.registry is registry
+        assert pickle.loads(pickle.dumps(run_metrics)).registry is None
+
+    def test_hooks_called_with_run(self, run_metrics):
+        registry = MetricsRegistry()
+        seen = []
+        registry.add_hook(seen.append)
+        registry.record(run_metrics)
+        registry.remove_hook(seen.append)
+        registry.record(run_metrics)
+
+        assert seen == [run_metrics]
+
+    def test_failing_hook_does_not_fail_run(self, run_metrics):
+        registry = MetricsRegistry()
+        registry.add_hook(lambda run_metrics: 1 / 0)
+        registry.record(run_metrics)
+
+        assert registry.launches == 1
+
+    def test_snapshot(self, run_metrics):
+        registry = MetricsRegistry()
+        registry.record(run_metrics)
+        registry.observe("parse", 0.25)
+        snapshot = registry.snapshot()
+
+        assert "dabbler_runs_total 3\n" in snapshot
+        assert 'dabbler_phase_seconds_total{phase="parse"} 0.25\n' in snapshot
+        assert 'dabbler_phase_count_total{phase="subprocess"} 1\n' in snapshot
@@ -0,0 +1,146 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+import pandas as pd
+from io import StringIO
+from dabbler import Results, output_parser
+from dabbler.output_parser import read_table, get_schema
+
+
+def read_with_pandas(out_string, skiprows):
+    table = pd.read_csv(StringIO(out_string), sep=r"\s+", skiprows=skiprows)
+    if "DOY" in table.columns:
+        DOY_leading_zeroes = table["DOY"].apply("{:0>3}".format)
+        table.index = (table["@YEAR"].astype(str) + DOY_leading_zeroes).astype(int)
+    return table
+
+
+class TestReadTable:
+    @pytest.mark.parametrize(
+        "out_file",
+        [
+            "ET.OUT",
+            "Evaluate.OUT",
+            "Mulch.OUT",
+            "PlantGro.OUT",
+            "PlantN.OUT",
+            "SoilTemp.OUT",
+            "SoilWat.OUT",
+            "Weather.OUT",
+        ],
+    )
+    def test_matches_pandas(self, out_file):
+        with open(f"test_data/{out_file}", "r") as f:
+            out_string = f.read()
+        skiprows = Results.file_layouts["maize"][out_file]
+
+        table = read_table(out_string, skiprows)
+
+        pd.testing.assert_frame_equal(
+            table, read_with_pandas(out_string, skiprows), check_index_type=False
+        )
+
+    def test_usecols_keeps_only_selected_columns(self):
+        with open("test_data/PlantGro.OUT", "r") as f:
+            table = read_table(f.read(), 4, usecols=["LAID", "GSTD"])
+
+        assert list(table.columns) == ["LAID", "GSTD"]
+        assert table.index[0] == 1982056
+        assert table["GSTD"].dtype == "int64"
+
+    def test_schema_spans_end_under_column_names(self):
+        schema = get_schema("@YEAR DOY   DAS    MCFD")
+
+        assert schema.starts.tolist() == [0, 5, 9, 15]
+        assert schema.ends.tolist() == [5, 9, 15, 23]
+        assert get_schema("@YEAR DOY   DAS    MCFD") is schema
+
+    def test_values_run_together_read_with_pandas(self):
+        out_string = "@YEAR DOY   CWAD\n 1982  56 123456\n 1982  57 1234567\n"
+
+        table = read_table(out_string)
+
+        assert table["CWAD"].tolist() == [123456, 1234567]
+
+    def test_decimals_after_whole_first_row(self):
+        out_string = (
+            "@YEAR DOY   DAS   LAID  RDPD\n"
+            " 1982  56     0      0     0\n"
+            " 1982  57     1   0.45    12\n"
+            " 1982  58     2   1.25    20\n"
+        )
+
+        table = read_table(out_string)
+
+        assert table["LAID"].tolist() == [0, 0.45, 1.25]
+        assert table["LAID"].dtype == "float64"
+        assert table["RDPD"].dtype == "int64"
+        pd.testing.assert_frame_equal(
+            table, read_with_pandas(out_string, 0), check_index_type=False
+        )
+
+    def test_negative_values_and_columns_without_values(self):
+        out_string = (
+            "@YEAR DOY   SWTD   ESAA   EOAA\n"
+            " 1982  56 -99.00   -1.5\n"
+            " 1982  57  12.75    0.0\n"
+        )
+
+        table = read_table(out_string)
+
+        assert table["SWTD"].tolist() == [-99, 12.75]
+        assert table["ESAA"].tolist() == [-1.5, 0]
+        assert table["EOAA"].isna().all()
+        pd.testing.assert_frame_equal(
+            table, read_with_pandas(out_string, 0), check_index_type=False
+        )
+
+    def test_rows_read_in_blocks(self, monkeypatch):
+        monkeypatch.setattr(output_parser, "BLOCK_ROWS", 2)
+        out_string = (
+            "@YEAR DOY   DAS   LAID  RDPD\n"
+            " 1982  56     0      0     0\n"
+            " 1982  57     1      1    12\n"
+            " 1982  58     2   1.25    20\n"
+            " 1982  59     3   -1.5    21\n"
+            " 1982  60     4      2    22\n"
+        )
+
+        table = read_table(out_string)
+
+        assert table["LAID"].dtype == "float64"
+        assert table["RDPD"].dtype == "int64"
+        pd.testing.assert_frame_equal(
+            table, read_with_pandas(out_string, 0), check_index_type=False
+        )
+
+    def test_usecols_decodes_only_selected_spans(self, monkeypatch):
+        out_string = (
+            "@YEAR DOY   DAS   LAID  NAME  RDPD\n"
+            " 1982  56     0   0.45  abcd     0\n"
+            " 1982  57     1   1.25  efgh    12\n"
+        )
+        schema = get_schema(out_string.split("\n")[0])
+        decoded = []
+        decode = output_parser._decode
+        monkeypatch.setattr(
+            output_parser,
+            "_decode",
+            lambda chars, index: decoded.append(index) or decode(chars, index),
+        )
+        monkeypatch.setattr(output_parser, "_read_with_pandas", None)
+
+        table = read_table(out_string, usecols=["LAID"])
+
+        assert table["LAID"].tolist() == [0.45, 1.25]
+        (index,) = decoded
+        assert index.shape == (6, 3)
+        spans = [range(start, end) for start, end in zip(schema.starts, schema.ends)]
+        for column, positions in zip([0, 1, 3], index.T):
+            padding = positions == schema.ends[-1]
+            assert set(positions[~padding]) <= set(spans[column])
+
+    def test_no_table_returns_none(self):
+        assert read_table("", 4) is None
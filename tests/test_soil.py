@@ -4,9 +4,30 @@ import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import pytest
+import numpy as np
 import pandas as pd
+import pyproj
+import rasterio
+import rasterio.mask
+import rasterio.windows
+from affine import Affine
+from dabbler import soil
 from dabbler.soil import SoilGenerator, Soil
-from shapely.geometry import Point
+from dabbler.cache import SoilCache
+from shapely.geometry import Point, box
+
+# SoilGrids' Interrupted Goode Homolosine projection
+HOMOLOSINE = "+proj=igh +lat_0=0 +lon_0=0 +datum=WGS84 +units=m +no_defs"
+# Typical topsoil values in SoilGrids units, by property
+TYPICAL_VALUES = {
+    "bdod": 135,
+    "soc": 150,
+    "clay": 250,
+    "silt": 350,
+    "phh2o": 65,
+    "cec": 200,
+    "sand": 400,
+}
 
 
 def load_soil_from_example_file(soil_code, coords):
@@ -26,6 +47,259 @@ def load_soil_from_example_file(soil_code, coords):
             )
 
 
+@pytest.fixture()
+def soilgrids(tmp_path):
+    """A 40 x 40 pixel SoilGrids stand-in around (41.125, -93.625)."""
+    to_homolosine = pyproj.Transformer.from_crs("EPSG:4326", HOMOLOSINE, always_xy=True)
+    x, y = to_homolosine.transform(-93.625, 41.125)
+    grid = Affine(250, 0, round(x) - 5000, 0, -250, round(y) + 5000)
+    rng = np.random.default_rng(0)
+    for soil_property, value in TYPICAL_VALUES.items():
+        (tmp_path / soil_property).mkdir()
+        for i, layer in enumerate(SoilGenerator.soilgrid_layers):
+            data = rng.normal(value, value / 10, (40, 40)).astype(np.int16) - i
+            data[:, :3] = SoilGenerator.nodata
+            layer = layer.format(soil_property=soil_property)
+            with rasterio.open(
+                tmp_path / soil_property / f"{layer}.tif",
+                "w",
+                driver="GTiff",
+                width=40,
+                height=40,
+                count=1,
+                dtype="int16",
+                crs=HOMOLOSINE,
+                transform=grid,
+                nodata=SoilGenerator.nodata,
+            ) as f:
+                f.write(data, 1)
+    return tmp_path
+
+
+def mask_layer_mean(layer, ROI_shape):
+    # Each layer read on its own, as SoilGenerator used to
+    layer_data, _ = rasterio.mask.mask(layer, [ROI_shape], crop=True)
+    if np.max(layer_data) == -32768:
+        layer_data, _ = rasterio.mask.mask(
+            layer, [ROI_shape], crop=True, all_touched=True
+        )
+    layer_data = layer_data.astype(float)
+    layer_data[layer_data == -32768] = np.nan
+    return np.nanmean(layer_data)
+
+
+class TestSyntheticSoilGrids:
+    @pytest.fixture
+    def soil_generator(self, soilgrids):
+        return SoilGenerator(soilgridsdata=soilgrids)
+
+    def test_stack_reads_same_means_as_each_layer(self, soil_generator):
+        ROIs = {
+            "field": Point(-93.62, 41.125).buffer(0.005),
+            # Smaller than a pixel, so only pixels it touches are used
+            "small": Point(-93.63, 41.13).buffer(0.0001, cap_style=3),
+            # Partly over pixels with no data
+            "edge": box(-93.6835, 41.12, -93.675, 41.13),
+        }
+        ROIs = soil_generator._reproject_ROIs(ROIs)
+
+        for ROI_shape in ROIs.values():
+            means = soil_generator._read_ROI_layers(ROI_shape)
+            expected = [
+                mask_layer_mean(layer, ROI_shape)
+                for layer in soil_generator.soillayersrefs.values()
+            ]
+            np.testing.assert_array_equal(means, expected)
+
+    def test_build_soils(self, soil_generator):
+        ROI = Point(-93.625, 41.125).buffer(0.001, cap_style=3)
+
+        soils = soil_generator.build_soils({"US02532556": ROI})
+
+        depth_table = soils["US02532556"].depth_table
+        assert list(depth_table.index) == [5, 15, 30, 60, 100, 200]
+        assert depth_table["SBDM"].between(1.2, 1.5).all()
+        assert depth_table["SLCL"].between(15, 35).all()
+        assert str(soils["US02532556"]).startswith("*US02532556")
+
+    def test_zonal_same_as_each_ROI(self, soil_generator, monkeypatch):
+        # Tiles smaller than the layers, so ROIs are read from several
+        monkeypatch.setattr(soil, "ZONAL_TILE_SIZE", 8)
+        rng = np.random.default_rng(1)
+        ROIs = {
+            f"US{i:08d}": Point(lon, lat).buffer(size, cap_style=3)
+            for i, (lon, lat, size) in enumerate(
+                zip(
+                    rng.uniform(-93.67, -93.57, 60),
+                    rng.uniform(41.09, 41.16, 60),
+                    rng.uniform(0.0001, 0.004, 60),
+                )
+            )
+        }
+        # Overlapping ROIs, and one over pixels with no data
+        ROIs["US10000000"] = box(-93.62, 41.12, -93.61, 41.13)
+        ROIs["US10000001"] = box(-93.615, 41.125, -93.605, 41.135)
+        ROIs["US10000002"] = box(-93.6835, 41.12, -93.675, 41.13)
+        ROIs_homolosine = soil_generator._reproject_ROIs(ROIs)
+
+        zonal = soil_generator._zonal_layer_means(ROIs_homolosine)
+
+        assert list(zonal) == list(ROIs)
+        for key, ROI_shape in ROIs_homolosine.items():
+            np.testing.assert_array_equal(
+                zonal[key], soil_generator._read_ROI_layers(ROI_shape)
+            )
+        soils = soil_generator.build_soils(ROIs, zonal=True)
+        assert str(soils["US10000000"]) == str(
+            soil_generator.build_soils({"US10000000": ROIs["US10000000"]})[
+                "US10000000"
+            ]
+        )
+
+    def test_points_sampled(self, soil_generator, monkeypatch):
+        monkeypatch.setattr(soil, "ZONAL_TILE_SIZE", 8)
+        rng = np.random.default_rng(2)
+        points = {
+            f"US{i:08d}": (lon, lat)
+            for i, (lon, lat) in enumerate(
+                zip(rng.uniform(-93.67, -93.57, 200), rng.uniform(41.09, 41.16, 200))
+            )
+        }
+        stack = soil_generator.soilstack
+        to_homolosine = soil_generator._to_SoilGrids_crs()
+
+        sampled = soil_generator._sample_points(points)
+
+        assert list(sampled) == list(points)
+        for key, point in points.items():
+            xy = [to_homolosine.transform(*point)]
+            expected = next(stack.sample(xy)).astype(float)
+            expected[expected == SoilGenerator.nodata] = np.nan
+            np.testing.assert_array_equal(sampled[key], expected)
+
+    def test_build_soils_from_points(self, soil_generator):
+        # Within one pixel, away from its edges
+        point = (-93.6235, 41.1238)
+        pixel = Point(point).buffer(0.0001, cap_style=3)
+
+        soils = soil_generator.build_soils(
+            {
+                "US00000001": point,
+                "US00000002": Point(point),
+                "US00000003": pixel,
+            }
+        )
+
+        pd.testing.assert_frame_equal(
+            soils["US00000001"].depth_table, soils["US00000003"].depth_table
+        )
+        assert soils["US00000002"].coordinates == point
+        with pytest.raises(ValueError):
+            soil_generator.build_soils({"US00000001": (0.0, 0.0)})
+
+    def test_build_soils_in_workers(self, soil_generator, monkeypatch):
+        monkeypatch.setattr(soil, "ZONAL_TILE_SIZE", 8)
+        rng = np.random.default_rng(3)
+        ROIs = {}
+        for i, (lon, lat) in enumerate(
+            zip(rng.uniform(-93.67, -93.57, 30), rng.uniform(41.09, 41.16, 30))
+        ):
+            ROIs[f"US{i:08d}"] = (lon, lat)
+            ROIs[f"US{i + 30:08d}"] = Point(lon, lat).buffer(0.003)
+
+        serial = soil_generator.build_soils(ROIs)
+        parallel = soil_generator.build_soils(ROIs, zonal=True, workers=2)
+
+        assert list(parallel) == list(ROIs)
+        assert [str(soil) for soil in parallel.values()] == [
+            str(soil) for soil in serial.values()
+        ]
+
+    def test_cached_soils_built_once(self, soilgrids, tmp_path, monkeypatch):
+        cache = SoilCache(tmp_path / "cache")
+        ROIs = {
+            "US00000001": (-93.6235, 41.1238),
+            "US00000002": Point(-93.62, 41.125).buffer(0.003),
+        }
+        built = SoilGenerator(soilgridsdata=soilgrids, cache=cache).build_soils(ROIs)
+
+        soil_generator = SoilGenerator(soilgridsdata=soilgrids, cache=cache)
+        monkeypatch.setattr(
+            soil_generator, "_build_soils", lambda *args: pytest.fail("Not cached")
+        )
+        cached = soil_generator.build_soils(ROIs)
+
+        assert list(cached) == list(ROIs)
+        for ROI_key, built_soil in built.items():
+            assert str(cached[ROI_key]) == str(built_soil)
+            pd.testing.assert_frame_equal(
+                cached[ROI_key].depth_table, built_soil.depth_table
+            )
+        assert cache.stats().hits == 2
+        # Other ROIs and other codes for the same ROI
+        monkeypatch.undo()
+        renamed = soil_generator.build_soils(
+            {"US00000003": ROIs["US00000001"], "US00000004": (-93.6, 41.1)}
+        )
+        assert str(renamed["US00000003"]).startswith("*US00000003")
+        assert cache.stats().hits == 3
+
+    def test_cache_invalidated_by_new_data(self, soilgrids, tmp_path):
+        cache = SoilCache(tmp_path / "cache")
+        soil_generator = SoilGenerator(soilgridsdata=soilgrids, cache=cache)
+        soil = soil_generator.build_soils({"US00000001": (-93.6235, 41.1238)})
+        soil = soil["US00000001"]
+        soil.depth_table.loc[200, "SLMH"] = np.nan
+        key = cache.key(Point(-93.6235, 41.1238), soil_generator.data_version)
+        cache.put(key, soil)
+
+        depth_table, properties, HC_code = cache.get(key)
+
+        pd.testing.assert_frame_equal(depth_table, soil.depth_table)
+        pd.testing.assert_frame_equal(properties, soil.properties)
+        assert HC_code == soil.HC_code
+        layer = soilgrids / "clay" / "clay_0-5cm_mean.tif"
+        os.utime(layer, ns=(0, layer.stat().st_mtime_ns + 1))
+        updated = SoilGenerator(soilgridsdata=soilgrids, cache=cache)
+        assert updated.data_version != soil_generator.data_version
+
+
+class TestZonalHelpers:
+    def test_morton_order(self):
+        codes = soil._morton([0, 0, 1, 1, 0, 2], [0, 1, 0, 1, 2, 0])
+
+        assert codes.tolist() == [0, 1, 2, 3, 4, 8]
+
+    def test_morton_codes_stay_uint64(self):
+        rows = np.array([0, 0xFFFF], dtype=np.int64)
+        columns = np.array([0xFFFF, 0], dtype=np.int64)
+
+        codes = soil._morton(rows, columns)
+
+        assert codes.dtype == np.uint64
+        assert codes.tolist() == [0x55555555, 0xAAAAAAAA]
+
+    def test_tile_groups(self):
+        size = soil.ZONAL_TILE_SIZE
+        rows = np.array([0, size, 0, size + 1, 1])
+        columns = np.array([0, 0, size, 1, 2])
+
+        groups = soil._tile_groups(rows, columns)
+
+        assert [group.tolist() for group in groups] == [[0, 4], [2], [1, 3]]
+
+    def test_disjoint_windows(self):
+        tile = rasterio.windows.Window(10, 10, 20, 20)
+        windows = [
+            rasterio.windows.Window(10, 10, 5, 5),
+            rasterio.windows.Window(14, 14, 5, 5),
+            rasterio.windows.Window(15, 15, 5, 5),
+            rasterio.windows.Window(12, 12, 5, 5),
+        ]
+
+        assert soil._disjoint_windows(windows, tile) == [[0, 2], [1], [3]]
+
+
 class TestSoilGenerator:
     @pytest.fixture
     def soil_generator(self):
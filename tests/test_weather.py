@@ -0,0 +1,259 @@
+import os
+import sys
+import threading
+from datetime import date
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+import requests
+import pandas as pd
+from dabbler import weather
+from dabbler.cache import WeatherCache
+
+POWER_PARAMETERS = ["T2M_MAX", "T2M_MIN", "PRECTOTCORR", "ALLSKY_SFC_SW_DWN"]
+
+
+def daymet_csv(lat, lon, years):
+    lines = [
+        f"Latitude: {lat}  Longitude: {lon}",
+        "X & Y on Lambert Conformal Conic: 1339167.17 -602883.45",
+        "Tile: 11208",
+        "Elevation: 283 meters",
+        "All years; all days; Daymet Software Version 4.0",
+        "How to cite: Thornton et al.",
+        "",
+        "year,yday,dayl (s),prcp (mm/day),srad (W/m^2),tmax (deg c),tmin (deg c)",
+    ]
+    for year in years.split(","):
+        for day in range(1, 366):
+            lines.append(f"{year},{day},36000.0,{day % 7}.0,250.0,{year},{lon}")
+    return "\n".join(lines) + "\n"
+
+
+def power_csv(lat, lon, parameters, start, end):
+    lines = [
+        "-BEGIN HEADER-",
+        "NASA/POWER CERES/MERRA2 Native Resolution Daily Data",
+        "Dates (month/day/year): 01/01/2019 through 01/10/2019",
+        f"Location: Latitude  {lat}   Longitude {lon}",
+        "Elevation from MERRA-2: Average for 0.5 x 0.625 degree lat/lon "
+        "region = 283.17 meters",
+        "The value for missing source data that cannot be computed: -999",
+        "Parameter(s):",
+        *parameters,
+        "-END HEADER-",
+        "YEAR,DOY," + ",".join(parameters),
+    ]
+    for year in range(int(start[:4]), int(end[:4]) + 1):
+        for day in range(1, 11):
+            values = ",".join([str(lon)] * len(parameters))
+            lines.append(f"{year},{day},{values}")
+    return "\n".join(lines) + "\n"
+
+
+class WeatherServer(BaseHTTPRequestHandler):
+    """Stands in for the DayMet and NASA POWER APIs, counting requests."""
+
+    requests = []
+    status = 200
+    failures = 0  # Requests failed with 503 before status is used
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        WeatherServer.requests.append((url.path, query))
+        if WeatherServer.failures:
+            WeatherServer.failures -= 1
+            self.send_error(503)
+            return
+        if self.status != 200:
+            self.send_error(self.status)
+            return
+        if url.path == "/daymet":
+            body = daymet_csv(query["lat"], query["lon"], query["years"])
+        else:
+            body = power_csv(
+                query["latitude"],
+                query["longitude"],
+                query["parameters"].split(","),
+                query["start"],
+                query["end"],
+            )
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def server(monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), WeatherServer)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{httpd.server_port}"
+    monkeypatch.setattr(weather, "DAYMET_URL", f"{url}/daymet")
+    monkeypatch.setattr(weather, "POWER_URL", f"{url}/power")
+    monkeypatch.setattr(weather, "BACKOFF", 0.001)
+    WeatherServer.requests = []
+    WeatherServer.status = 200
+    WeatherServer.failures = 0
+    yield WeatherServer
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestWeatherCache:
+    def test_daymet_downloaded_once_per_grid_cell(self, server, tmp_path):
+        cache = WeatherCache(tmp_path)
+
+        first = weather.get_daymet_data(-93.4512, 42.0349, 2019, cache)
+        second = weather.get_daymet_data(-93.4488, 42.0338, 2019, cache)
+
+        assert len(server.requests) == 1
+        # The point asked for is downloaded, not the cell's centre
+        assert server.requests[0][1] == {
+            "lat": "42.0349",
+            "lon": "-93.4512",
+            "years": "2019",
+        }
+        assert first[0].equals(second[0])
+        assert first[1] == 283
+        weather.get_daymet_data(-93.4512, 42.0349, 2019, WeatherCache(tmp_path))
+        assert len(server.requests) == 1
+        # 800 m east, in the next cell of DayMet's grid
+        weather.get_daymet_data(-93.4416, 42.0349, 2019, cache)
+        assert len(server.requests) == 2
+
+    def test_downloads_same_with_and_without_cache(self, server, tmp_path):
+        start, end = date(2019, 1, 1), date(2019, 1, 10)
+        point = (-93.2, 42.1)
+
+        cached = weather.get_POWER_singlepoint(
+            point, start, end, POWER_PARAMETERS, WeatherCache(tmp_path)
+        )
+        uncached = weather.get_POWER_singlepoint(point, start, end, POWER_PARAMETERS)
+
+        assert server.requests[0] == server.requests[1]
+        pd.testing.assert_frame_equal(cached[0], uncached[0])
+
+    def test_power_keyed_by_parameters(self, server, tmp_path):
+        # Points in the same MERRA-2 cell share a download only if asked to
+        cache = WeatherCache(tmp_path, resolution={"NASA-POWER": (0.625, 0.5)})
+        start, end = date(2019, 1, 1), date(2019, 1, 10)
+
+        data, elevation = weather.get_POWER_singlepoint(
+            (-93.2, 42.1), start, end, POWER_PARAMETERS, cache
+        )
+        weather.get_POWER_singlepoint(
+            (-93.3, 41.9), start, end, POWER_PARAMETERS, cache
+        )
+        weather.get_POWER_singlepoint(
+            (-93.2, 42.1), start, end, POWER_PARAMETERS[:2], cache
+        )
+
+        assert len(server.requests) == 2
+        assert server.requests[0][1]["longitude"] == "-93.2"
+        assert elevation == 283.17
+        assert list(data.columns) == ["YEAR", "DOY", *POWER_PARAMETERS]
+        assert (data["T2M_MAX"] == -93.2).all()
+        weather.get_POWER_singlepoint(
+            (-93.3, 41.9), start, end, POWER_PARAMETERS, WeatherCache(tmp_path)
+        )
+        assert len(server.requests) == 3
+
+    def test_expired_entries_downloaded_again(self, server, tmp_path):
+        weather.get_daymet_data(-93.45, 42.03, 2019, WeatherCache(tmp_path, ttl=0))
+        weather.get_daymet_data(-93.45, 42.03, 2019, WeatherCache(tmp_path, ttl=0))
+
+        assert len(server.requests) == 2
+
+    def test_expired_entry_used_when_download_fails(self, server, tmp_path):
+        weather.get_daymet_data(-93.45, 42.03, 2019, WeatherCache(tmp_path))
+        server.status = 503
+
+        field_df, elev, _ = weather.get_daymet_data(
+            -93.45, 42.03, 2019, WeatherCache(tmp_path, ttl=0)
+        )
+
+        assert len(server.requests) == 2 + weather.RETRIES
+        assert len(field_df) == 365
+        with pytest.raises(requests.HTTPError):
+            weather.get_daymet_data(-93.45, 42.03, 2019)
+
+    def test_offline(self, server, tmp_path):
+        weather.get_daymet_data(-93.45, 42.03, 2019, WeatherCache(tmp_path))
+        offline = WeatherCache(tmp_path, ttl=0, offline=True)
+
+        assert weather.get_daymet_data(-93.45, 42.03, 2019, offline)[1] == 283
+        with pytest.raises(LookupError):
+            weather.get_daymet_data(-93.45, 42.03, 2018, offline)
+        assert len(server.requests) == 1
+
+
+class TestFetchWeather:
+    def test_years_requested_together(self, server, tmp_path):
+        points = [(-93.4512, 42.0349), (-93.4488, 42.0338), (-90.1, 40.2)]
+        cache = WeatherCache(tmp_path)
+
+        fetched = weather.fetch_weather(points, [2018, 2019], cache=cache)
+
+        assert len(server.requests) == 2
+        assert {query["years"] for _, query in server.requests} == {"2018,2019"}
+        assert len(fetched) == 6
+        field_df, elev, t_avg = fetched[(-90.1, 40.2), 2018]
+        assert (field_df["TMAX"] == 2018).all()
+        assert field_df["@DATE"].iloc[0] == 18001
+        assert fetched[points[0], 2019][0] is fetched[points[1], 2019][0]
+        # Each year is cached on its own
+        weather.get_daymet_data(-90.1, 40.2, 2019, cache)
+        assert len(server.requests) == 2
+
+    def test_power(self, server):
+        fetched = weather.fetch_weather(
+            [(-93.2, 42.1)], [2018, 2019], source="NASA-POWER"
+        )
+
+        assert len(server.requests) == 1
+        assert server.requests[0][1]["start"] == "20180101"
+        assert server.requests[0][1]["end"] == "20191231"
+        for year in (2018, 2019):
+            dssat_weather = fetched[(-93.2, 42.1), year][0]
+            assert list(dssat_weather["@DATE"]) == [
+                f"{year % 100}{day:03}" for day in range(1, 11)
+            ]
+            assert (dssat_weather["TMAX"] == -93.2).all()
+
+    def test_power_years_apart_requested_separately(self, server):
+        fetched = weather.get_nasa_power_years(-93.2, 42.1, [2020, 1990, 1991])
+
+        assert sorted(
+            (query["start"], query["end"]) for _, query in server.requests
+        ) == [("19900101", "19911231"), ("20200101", "20201231")]
+        assert sorted(fetched) == [1990, 1991, 2020]
+        assert fetched[2020][0]["@DATE"].iloc[0] == "20001"
+
+    def test_server_errors_retried(self, server):
+        server.failures = 2
+
+        field_df, _, _ = weather.get_daymet_data(-93.45, 42.03, 2019)
+
+        assert len(server.requests) == 3
+        assert len(field_df) == 365
+
+    def test_unreadable_power_response_in_error(self, monkeypatch):
+        monkeypatch.setattr(weather, "_get", lambda *args: b"Rate limit exceeded")
+
+        with pytest.raises(ValueError, match="Rate limit exceeded"):
+            weather.get_POWER_singlepoint(
+                (-93.2, 42.1), date(2019, 1, 1), date(2019, 1, 10), POWER_PARAMETERS
+            )
+
+    def test_unknown_source_raises(self):
+        with pytest.raises(ValueError):
+            weather.fetch_weather([(-93.2, 42.1)], [2019], source="PRISM")
@@ -0,0 +1,242 @@
+import os
+import sys
+import datetime
+from io import StringIO
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+import numpy as np
+import pandas as pd
+from dabbler import wth
+
+HEADER_DATA = {
+    "INSI": "UFGA",
+    "LAT": 29.630,
+    "LONG": -82.370,
+    "ELEV": 10,
+    "TAV": 20.9,
+    "AMP": 13.0,
+    "REFHT": 2.00,
+    "WNDHT": 3.00,
+    "location": "Test",
+}
+
+
+@pytest.fixture()
+def weather_data():
+    rng = np.random.default_rng(0)
+    days = pd.date_range("1999-12-25", periods=40)
+    weather_data = pd.DataFrame(
+        {
+            "@DATE": days.strftime("%y%j"),
+            "SRAD": rng.uniform(0, 30, len(days)),
+            "TMAX": rng.uniform(-10, 40, len(days)),
+            "TMIN": rng.uniform(-30, 20, len(days)),
+            "RAIN": rng.uniform(0, 150, len(days)),
+            "WIND": rng.uniform(0, 400, len(days)),
+            "DEWP": np.nan,
+        }
+    )
+    weather_data.loc[3, "RAIN"] = np.nan
+    return weather_data
+
+
+class TestFormatFixed:
+    def test_values(self):
+        values = np.array([0, 1.24, -3.04, -0.04, np.nan, 123.4, -12.3])
+
+        formatted = wth.format_fixed(values, 6, 1).view("S6").ravel()
+
+        assert formatted.tolist() == [
+            b"   0.0",
+            b"   1.2",
+            b"  -3.0",
+            b"   0.0",
+            b" -99.0",
+            b" 123.4",
+            b" -12.3",
+        ]
+        assert wth.format_fixed(np.array([7.6]), 6, 0).tobytes() == b"     8"
+
+    def test_too_wide_raises(self):
+        with pytest.raises(ValueError):
+            wth.format_fixed(np.array([-12345.0]), 6, 1)
+
+
+class TestEncodeWeather:
+    def test_values_read_back(self, weather_data):
+        encoded = wth.encode_weather(HEADER_DATA, weather_data)
+        table = pd.read_csv(StringIO(encoded.split("\n", 5)[5]), sep=r"\s+")
+
+        assert list(table.columns) == ["@DATE", "SRAD", "TMAX", "TMIN", "RAIN", "WIND"]
+        assert table["@DATE"].iloc[7] == 1
+        expected = weather_data.round({"TMAX": 1, "RAIN": 1, "WIND": 0})
+        np.testing.assert_allclose(table["TMAX"], expected["TMAX"])
+        np.testing.assert_allclose(table["WIND"], expected["WIND"])
+        assert table["RAIN"].iloc[3] == -99
+        np.testing.assert_allclose(table["RAIN"].drop(3), expected["RAIN"].drop(3))
+
+    def test_fixed_width_rows(self, weather_data):
+        lines = wth.encode_weather(HEADER_DATA, weather_data).splitlines()
+
+        assert lines[5] == "@DATE  SRAD  TMAX  TMIN  RAIN  WIND"
+        assert {len(line) for line in lines[5:]} == {5 + 6 * 5}
+        assert lines[6].startswith("99359")
+
+    def test_dates_from_datetimes(self, weather_data):
+        dated = weather_data.copy()
+        dated["@DATE"] = pd.date_range("1999-12-25", periods=len(dated))
+
+        assert wth.encode_weather(HEADER_DATA, dated) == wth.encode_weather(
+            HEADER_DATA, weather_data
+        )
+
+    def test_written_in_chunks(self, weather_data, tmp_path):
+        path = tmp_path / "UFGA9901.WTH"
+        wth.write_weather(path, HEADER_DATA, weather_data, chunksize=7)
+
+        assert path.read_text() == wth.encode_weather(HEADER_DATA, weather_data)
+
+
+class TestReadWeather:
+    def test_reads_dssat_file(self):
+        weather = wth.read_weather("test_data/TTST0001.WTH")
+
+        assert weather.header["INSI"] == "TTST000001"
+        assert weather.header["LAT"] == 42.619
+        assert weather.header["TAV"] == 8.8
+        assert weather.header["AMP"] is None
+        assert len(weather.dates) == 365
+        assert weather.dates[0] == np.datetime64("2020-01-01")
+        assert [weather.columns[name][0] for name in wth.REQUIRED_COLUMNS] == [
+            7.9,
+            4.7,
+            -8.8,
+            0.0,
+        ]
+        assert np.isnan(weather.columns["DEWP"]).all()
+
+    def test_matches_whitespace_parse(self):
+        weather = wth.read_weather("test_data/TTST0001.WTH")
+        table = pd.read_csv("test_data/TTST0001.WTH", skiprows=4, sep=r"\s+")
+
+        for name in wth.REQUIRED_COLUMNS:
+            np.testing.assert_array_equal(weather.columns[name], table[name])
+
+    def test_round_trip(self, weather_data, tmp_path):
+        path = tmp_path / "UFGA9901.WTH"
+        wth.write_weather(path, HEADER_DATA, weather_data)
+
+        weather = wth.read_weather(path)
+
+        assert weather.header["ELEV"] == 10
+        assert weather.dates[0] == np.datetime64("1999-12-25")
+        assert list(weather.to_frame()["@DATE"][:8]) == [
+            99359 + i for i in range(7)
+        ] + [1]
+        expected = weather_data.round({"TMIN": 1, "RAIN": 1, "WIND": 0})
+        np.testing.assert_array_equal(weather.columns["TMIN"], expected["TMIN"])
+        np.testing.assert_array_equal(weather.columns["RAIN"], expected["RAIN"])
+        np.testing.assert_array_equal(weather.columns["WIND"], expected["WIND"])
+        assert wth.encode_weather(
+            weather.header_data("Test"), weather.to_frame()
+        ) == wth.encode_weather(HEADER_DATA, weather_data)
+
+    def test_irregular_rows(self, tmp_path):
+        path = tmp_path / "UFGA9901.WTH"
+        path.write_text(
+            "*WEATHER DATA : Test\n\n"
+            "@DATE  SRAD  TMAX  TMIN  RAIN\n"
+            "99001  10.5  20.1   3.2   0.0\n"
+            "99002 11.25 21.0 -99 4\n"
+        )
+
+        weather = wth.read_weather(path)
+
+        assert weather.header == {}
+        np.testing.assert_array_equal(weather.columns["SRAD"], [10.5, 11.25])
+        np.testing.assert_array_equal(weather.columns["TMIN"], [3.2, np.nan])
+
+    def test_text_fields_not_read_as_missing(self, tmp_path):
+        path = tmp_path / "UFGA9901.WTH"
+        path.write_text(
+            "@DATE  SRAD  TMAX  TMIN  RAIN\n"
+            "99001  10.5  20.1   3.2   0.0\n"
+            "99002  11.2  21.0   n/a   4.0\n"
+        )
+
+        with pytest.raises(ValueError):
+            wth.read_weather(path)
+
+        path.write_text(
+            "@DATE  SRAD  TMAX  TMIN  RAIN\n"
+            "99001  10.5  20.1   3.2   0.0\n"
+            "99002 1.1E1  21.0   2.5   4.0\n"
+        )
+
+        weather = wth.read_weather(path)
+
+        np.testing.assert_array_equal(weather.columns["SRAD"], [10.5, 11])
+
+
+@pytest.fixture()
+def weather_directory(weather_data, tmp_path):
+    for year in (1998, 1999, 2000):
+        yearly = weather_data.copy()
+        yearly["@DATE"] = pd.date_range(f"{year}-01-01", periods=len(yearly))
+        wth.write_weather(tmp_path / f"UFGA{year % 100:02d}01.WTH", HEADER_DATA, yearly)
+    wth.write_weather(tmp_path / "IBWA9901.WTH", HEADER_DATA, weather_data)
+    return tmp_path
+
+
+class TestWeatherIndex:
+    def test_dates(self):
+        assert wth.weather_file_dates("test_data/TTST0001.WTH") == (
+            datetime.date(2020, 1, 1),
+            datetime.date(2020, 12, 30),
+        )
+
+    def test_dates_padded_with_spaces(self, tmp_path):
+        path = tmp_path / "UFGA9901.WTH"
+        path.write_text(
+            "@  DATE  SRAD  TMAX  TMIN  RAIN\n"
+            "  99001  10.5  20.1   3.2   0.0\n"
+            "  99002  11.2  21.0   2.5   4.0\n"
+        )
+
+        assert wth.weather_file_dates(path) == (
+            datetime.date(1999, 1, 1),
+            datetime.date(1999, 1, 2),
+        )
+
+    def test_read_only_overlapping_files(self, weather_directory):
+        index = wth.WeatherIndex(weather_directory)
+
+        assert index.stations() == ["IBWA", "UFGA"]
+        paths = index.files("UFGA", datetime.date(1999, 1, 5), datetime.date(2000, 1, 3))
+        assert [path.name for path in paths] == ["UFGA9901.WTH", "UFGA0001.WTH"]
+        weather_data = index.read(
+            "UFGA", datetime.date(1999, 1, 5), datetime.date(2000, 1, 3)
+        )
+        assert weather_data.index[0] == pd.Timestamp("1999-01-05")
+        assert weather_data.index[-1] == pd.Timestamp("2000-01-03")
+        assert len(weather_data) == 36 + 3
+        with pytest.raises(KeyError):
+            index.read("UFGA", datetime.date(2005, 1, 1))
+
+    def test_saved_and_revalidated(self, weather_directory, weather_data, monkeypatch):
+        wth.WeatherIndex(weather_directory)
+        assert (weather_directory / ".wth_index.json").exists()
+        later = weather_data.copy()
+        later["@DATE"] = pd.date_range("2001-03-01", periods=len(later))
+        wth.write_weather(weather_directory / "UFGA9901.WTH", HEADER_DATA, later)
+
+        read = []
+        original = wth.weather_file_dates
+        monkeypatch.setattr(
+            wth, "weather_file_dates", lambda path: read.append(path.name) or original(path)
+        )
+        index = wth.WeatherIndex(weather_directory)
+
+        assert read == ["UFGA9901.WTH"]
+        assert index.entries["UFGA9901.WTH"]["start"] == "2001-03-01"